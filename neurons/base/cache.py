@@ -0,0 +1,131 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+import threading
+
+from time import time
+from collections import OrderedDict
+
+
+class LruCache(object):
+    """A thread-safe, size-bounded least-recently-used cache with optional
+    per-entry expiry times.
+
+    :param maxsize: Maximum number of entries. The least recently used entry
+        is evicted when a new one would exceed this.
+    """
+
+    def __init__(self, maxsize=1024):
+        assert maxsize > 0
+
+        self.maxsize = maxsize
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Returns the value for the given key, or ``default`` if the key is
+        missing or its entry has expired."""
+
+        with self._lock:
+            entry = self._data.get(key, None)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            # move to the most recently used end
+            del self._data[key]
+            self._data[key] = entry
+
+            self.hits += 1
+            return value
+
+    def put(self, key, value, expires_at=None):
+        """Stores the given value.
+
+        :param expires_at: Unix time after which the entry is considered
+            missing. ``None`` means never.
+        """
+
+        with self._lock:
+            if key in self._data:
+                del self._data[key]
+
+            elif len(self._data) >= self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+            self._data[key] = (value, expires_at)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+
+        if entry is None:
+            return default
+        return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def keys(self):
+        """Returns a snapshot of the keys, least recently used first.
+        Includes expired entries that weren't looked up since."""
+
+        with self._lock:
+            return list(self._data.keys())
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get_stats(self):
+        return dict(size=len(self._data), maxsize=self.maxsize,
+            hits=self.hits, misses=self.misses, evictions=self.evictions,
+                                                   expirations=self.expirations)
@@ -34,9 +34,75 @@
 import logging
 logger = logging.getLogger(__name__)
 
+import sys
+import threading
+
+from time import time
+from datetime import datetime
 from collections import defaultdict
 
+from spyne.util import six
+
 from neurons.base.const import ANON_USERNAME
+from neurons.base.error import RequestTimeoutError
+
+
+_current = threading.local()
+
+
+# the read context whose deadline the sqlite statements that run in the
+# current thread obey. sqlite has one progress handler per connection, and
+# connections can be shared between contexts (e.g. with StaticPool), so the
+# handler must not belong to a context.
+_sqlite_owner = threading.local()
+
+
+def _sqlite_progress():
+    udc = getattr(_sqlite_owner, 'udc', None)
+    if udc is None:
+        return False
+    return udc._sqlite_progress()
+
+
+def get_current_context():
+    """Returns the method context of the request that's being processed in
+    the current thread, or ``None``."""
+
+    return getattr(_current, 'ctx', None)
+
+
+def call_with_context(f, ctx, *args, **kwargs):
+    """Calls ``f(ctx, *args, **kwargs)`` with ``ctx`` set as the current
+    context of the calling thread."""
+
+    prev = getattr(_current, 'ctx', None)
+    _current.ctx = ctx
+    try:
+        return f(ctx, *args, **kwargs)
+    finally:
+        _current.ctx = prev
+
+
+def call_and_finalize(f, ctx, *args, **kwargs):
+    """Like :func:`call_with_context`, but also commits or rolls back and
+    closes the sessions of ``ctx.udc`` before returning. Meant for calls that
+    run in a worker thread, so that the commit happens there too and its
+    errors reach the caller."""
+
+    try:
+        retval = call_with_context(f, ctx, *args, **kwargs)
+
+    except Exception:
+        exc_info = sys.exc_info()
+        try:
+            ctx.udc.close_all_sessions(no_error=False)
+        except Exception as e:
+            logger.exception(e)
+        six.reraise(*exc_info)
+
+    ctx.udc.close_all_sessions()
+
+    return retval
 
 
 class ReadContext(object):
@@ -46,19 +112,144 @@ class ReadContext(object):
         self.user = ANON_USERNAME
         self.logged = True
         self.log_entry = None
+        self.log_writer = None
+        self.log_start = None
         self.sqla_sessions = defaultdict(list)
+        self.sqla_connections = defaultdict(list)
+
+        self.deadline = None
+        """Time after which the queries of this context are cancelled, as
+        returned by :func:`time.time`. None means no deadline."""
+
+        self.cancelled = False
+        self.cancellable = False
+        """Whether :meth:`cancel` can be called, e.g. because the client can
+        go away."""
+
+        self.__lock = threading.Lock()
+
+    def set_deadline(self, timeout):
+        """Gives the context ``timeout`` seconds from now to finish. Falsy
+        values remove the deadline."""
+
+        if timeout:
+            self.deadline = time() + timeout
+        else:
+            self.deadline = None
+
+    def get_remaining(self):
+        """Returns the seconds left until the deadline, or None if there's no
+        deadline."""
+
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time())
+
+    def is_expired(self):
+        if self.cancelled:
+            return True
+        return self.deadline is not None and time() >= self.deadline
+
+    def check_deadline(self):
+        if self.is_expired():
+            raise RequestTimeoutError()
+
+    def cancel(self):
+        """Cancels the statements this context is running. Called when the
+        client goes away."""
+
+        self.cancelled = True
+
+        with self.__lock:
+            connections = [c for cs in self.sqla_connections.values()
+                                                                   for c in cs]
+
+        for connection in connections:
+            if connection.dialect.name != 'postgresql':
+                # sqlite connections notice self.cancelled in the progress
+                # handler
+                continue
+
+            try:
+                connection.connection.cancel()
+            except Exception as e:
+                logger.debug("Could not cancel statement: %r", e)
+
+    def _sqlite_progress(self):
+        # a nonzero return value interrupts the running statement.
+        return self.is_expired()
+
+    def _on_sqla_begin(self, session, transaction, connection):
+        dialect = connection.dialect.name
+
+        if dialect == 'postgresql':
+            remaining = self.get_remaining()
+            if remaining is not None:
+                connection.execute("SET LOCAL statement_timeout = %d" %
+                                                 max(1, int(remaining * 1000)))
+
+        elif dialect == 'sqlite':
+            if self.cancellable or self.get_remaining() is not None:
+                _sqlite_owner.udc = self
+                connection.connection.set_progress_handler(_sqlite_progress,
+                                                                          1000)
+                connection.info['neurons_progress_handler'] = True
+
+        with self.__lock:
+            self.sqla_connections[id(session)].append(connection)
+
+    def _on_sqla_transaction_end(self, session, transaction):
+        if transaction.parent is None:
+            with self.__lock:
+                self.sqla_connections.pop(id(session), None)
+
+            if getattr(_sqlite_owner, 'udc', None) is self:
+                _sqlite_owner.udc = None
 
     def is_read_only(self):
         return True
 
     def sqla_finalize(self, session):
-        logger.warning("This is a read-only context!")
+        # nothing to keep, and ending a read-only transaction is cheap.
+        session.rollback()
+
+    def get_session_factory(self, store):
+        """Returns the sessionmaker to create sessions for given store with.
+        Read-only contexts get sessions that run read-only transactions, don't
+        autoflush and refuse to flush changes."""
+
+        return store.ReadOnlySession
+
+    def get_bind(self, store):
+        """Returns the engine the session for given store should be bound to.
+        ``None`` means the store's default engine."""
+
+        return store.get_read_bind(self.user)
 
     def get_session(self, store, **kwargs):
-        if store.backend == 'sqlalchemy':
+        # also accept store configs from config.stores
+        store = getattr(store, 'itself', None) or store
+
+        if store.type == 'sqlalchemy':
+            self.check_deadline()
+
+            from neurons.daemon import blocking
+            blocking.check('sql_session', store)
+
             sessions = self.sqla_sessions[id(store)]
             if len(sessions) == 0:
-                session = store.Session(**kwargs)
+                if not ('bind' in kwargs):
+                    bind = self.get_bind(store)
+                    if bind is not None:
+                        kwargs['bind'] = bind
+
+                session = self.get_session_factory(store)(**kwargs)
+                session.info['store'] = store
+
+                from sqlalchemy import event
+                event.listen(session, 'after_begin', self._on_sqla_begin)
+                event.listen(session, 'after_transaction_end',
+                                                  self._on_sqla_transaction_end)
                 self.sqla_sessions[id(store)].append(session)
             else:
                 assert len(kwargs) == 0
@@ -68,14 +259,157 @@ class ReadContext(object):
 
         raise NotImplementedError(store)
 
-    def close(self, no_error=True):
-        for sessions in self.sqla_sessions.values():
-            for session in sessions:
-                if no_error:
+    def get_store(self, store_name='sql_main'):
+        """Returns the data store with the given name from the application
+        config, or None if there is no such store."""
+
+        config = getattr(self.parent.app, 'config', None)
+        if config is None or not (store_name in config.stores):
+            return None
+
+        return config.stores[store_name].itself
+
+    def select_async(self, stmt, cls=None, store='sql_main'):
+        """Runs the given select statement on the txpool of the given store
+        without blocking the reactor. See
+        :meth:`neurons.daemon.store.SqlDataStore.select_async`.
+
+        :param store: A data store or the name of one.
+        """
+
+        if isinstance(store, six.string_types):
+            store = self.get_store(store)
+
+        store = getattr(store, 'itself', None) or store
+
+        return store.select_async(stmt, cls)
+
+    def select_cached(self, stmt, params=None, store='sql_main'):
+        """Runs the given select statement through the query cache of the
+        given store. Blocks. See
+        :meth:`neurons.daemon.store.SqlDataStore.select_cached`.
+
+        :param store: A data store or the name of one.
+        """
+
+        if isinstance(store, six.string_types):
+            store = self.get_store(store)
+
+        store = getattr(store, 'itself', None) or store
+
+        return store.select_cached(stmt, params)
+
+    def run_in_executor(self, f, *args, **kwargs):
+        """Runs ``f(*args, **kwargs)`` in the executor of the ``sql_main``
+        store. Pass ``store`` to pick another one.
+
+        :return: A Deferred that fires with the return value of ``f``.
+        """
+
+        store = kwargs.pop('store', 'sql_main')
+        if isinstance(store, six.string_types):
+            store = self.get_store(store)
+
+        store = getattr(store, 'itself', None) or store
+
+        return store.run_in_executor(f, *args, **kwargs)
+
+    def start_log(self, LogEntry, store_name='sql_main'):
+        """Prepares a log entry for the current request. It's queued to the
+        store's :class:`neurons.log.LogWriter` when the context is closed."""
+
+        from neurons.log.writer import get_log_writer
+
+        store = self.get_store(store_name)
+        if store is None:
+            logger.debug("No store '%s' for logging", store_name)
+            return
+
+        self.log_writer = get_log_writer(store, LogEntry)
+        self.log_start = time()
+        self.log_entry = dict(
+            time=datetime.now(),
+            method=self.parent.descriptor.name[:64],
+        )
+
+    def finalize_log(self):
+        ctx = self.parent
+        entry = self.log_entry
+
+        entry['user'] = self.user
+        entry['duration'] = int((time() - self.log_start) * 1000)
+
+        err = ctx.out_error
+        if err is None:
+            entry['err_code'] = 0
+        else:
+            faultcode = getattr(err, 'faultcode', None) or 'Server'
+            entry['err_code'] = 400 if faultcode.startswith('Client') else 500
+            entry['resp_err'] = dict(faultcode=faultcode,
+                       faultstring='%s' % (getattr(err, 'faultstring', err),))
+
+        req = None
+        if ctx.in_object is not None:
+            req = (ctx.descriptor.in_message, ctx.in_object)
+
+        self.log_writer.put(entry, req)
+        self.log_entry = None
+
+    def close_sessions(self, sessions, no_error=True):
+        # a failing commit must not keep the remaining sessions from
+        # returning their connections to the pool.
+        error = None
+        for session in sessions:
+            try:
+                if no_error and error is None:
                     self.sqla_finalize(session)
+
+            except Exception as e:
+                logger.exception(e)
+                error = e
+
+            finally:
                 session.close()
 
+        if error is not None:
+            raise error
+
+    def close(self, no_error=True):
+        if self.log_entry is not None and self.logged:
+            self.finalize_log()
+
+        self.close_all_sessions(no_error)
+
+    def close_all_sessions(self, no_error=True):
+        """Commits or rolls back and closes every session of this context.
+        Once one of them fails, the rest are only closed and the error is
+        raised at the end."""
+
+        error = None
+        for sessions in self.sqla_sessions.values():
+            try:
+                self.close_sessions(sessions, no_error and error is None)
+            except Exception as e:
+                error = e
+
+        self.sqla_sessions.clear()
+        with self.__lock:
+            self.sqla_connections.clear()
+
+        if error is not None:
+            raise error
+
 
 class WriteContext(ReadContext):
+    def get_session_factory(self, store):
+        return store.Session
+
+    def get_bind(self, store):
+        return None
+
     def sqla_finalize(self, session):
         session.commit()
+
+        store = session.info.get('store', None)
+        if store is not None and len(store.replicas) > 0:
+            store.note_write(self.user)
@@ -50,3 +50,21 @@ class SessionExpiredError(ClientError):
 class TamperedCookieError(ClientError):
     def __init__(self):
         super(ClientError, self).__init__("Session expired.")
+
+
+class ReadOnlyContextError(Fault):
+    def __init__(self):
+        super(ReadOnlyContextError, self).__init__('Server.ReadOnlyContext',
+                                 "Attempted to write in a read-only context.")
+
+
+class DatabaseBusyError(Fault):
+    def __init__(self):
+        super(DatabaseBusyError, self).__init__('Server.DatabaseBusy',
+                        "Timed out waiting for a database worker. Try again.")
+
+
+class RequestTimeoutError(Fault):
+    def __init__(self):
+        super(RequestTimeoutError, self).__init__('Server.RequestTimeout',
+                         "The request ran out of time or was cancelled.")
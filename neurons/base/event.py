@@ -37,12 +37,36 @@ logger = logging.getLogger(__name__)
 from neurons.base.const import ANON_USERNAME
 
 
+def get_deadline(ctx):
+    """Returns the number of seconds the given call is allowed to take, either
+    from the ``@deadline`` decorator of the method or from the ``deadline``
+    setting of the listener that received the request. None means no limit."""
+
+    retval = getattr(ctx.function, 'deadline', None)
+    if retval is None:
+        req = getattr(ctx.transport, 'req', None)
+        site = getattr(req, 'site', None)
+        retval = getattr(site, 'neurons_deadline', None)
+
+    return retval
+
+
 def on_method_call(ctx):
     if ctx.udc is None:
         ctx.udc = ctx.service_class.get_context(ctx)
 
     ctx.udc.user = ANON_USERNAME
 
+    if hasattr(ctx.udc, 'set_deadline'):
+        ctx.udc.set_deadline(get_deadline(ctx))
+
+        # twisted requests tell when the client goes away
+        req = getattr(ctx.transport, 'req', None)
+        if hasattr(req, 'notifyFinish'):
+            udc = ctx.udc
+            udc.cancellable = True
+            req.notifyFinish().addErrback(lambda _: udc.cancel())
+
 
 def on_method_context_closed(ctx):
     if ctx is not None and ctx.udc is not None and hasattr(ctx.udc, 'close'):
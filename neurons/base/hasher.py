@@ -0,0 +1,446 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+"""Password hashing schemes, identified by the ``{SCHEME}`` prefix of the
+stored hash, and a process pool to run them outside of the reactor process.
+"""
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import hmac
+import base64
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+from spyne.util.six import text_type, PY2
+
+try:
+    import argon2
+except ImportError:
+    argon2 = None
+
+
+def _to_bytes(s):
+    if isinstance(s, text_type):
+        return s.encode('utf8')
+    return s
+
+
+def _to_text(s):
+    if isinstance(s, bytes):
+        return s.decode('ascii')
+    return s
+
+
+def _b64(s):
+    return base64.b64encode(s).decode('ascii')
+
+
+def _unb64(s):
+    return base64.b64decode(_to_bytes(s))
+
+
+class Hasher(object):
+    """Base class for password hashers. The stored hash must start with
+    ``scheme``."""
+
+    scheme = None
+
+    def is_available(self):
+        return True
+
+    def hash(self, password):
+        raise NotImplementedError()
+
+    def verify(self, password, phash):
+        raise NotImplementedError()
+
+    def needs_rehash(self, phash):
+        """Returns True when the given hash was generated with weaker
+        parameters than the current ones."""
+
+        return False
+
+
+class SshaHasher(Hasher):
+    """Salted SHA1. Only here for verifying legacy hashes."""
+
+    scheme = '{SSHA}'
+
+    def hash(self, password):
+        salt = os.urandom(32)
+        s = hashlib.sha1()
+        s.update(_to_bytes(password))
+        s.update(salt)
+
+        return _to_bytes(self.scheme) + s.digest() + salt
+
+    def verify(self, password, phash):
+        if isinstance(phash, text_type):
+            phash = phash.encode('latin1')
+
+        digest = phash[6:26]
+        salt = phash[26:]
+
+        hr = hashlib.sha1(_to_bytes(password))
+        hr.update(salt)
+
+        return hmac.compare_digest(digest, hr.digest())
+
+
+class Pbkdf2Hasher(Hasher):
+    scheme = '{PBKDF2-SHA256}'
+
+    def __init__(self, iterations=260000):
+        self.iterations = iterations
+
+    def hash(self, password):
+        salt = os.urandom(16)
+        dk = hashlib.pbkdf2_hmac('sha256', _to_bytes(password), salt,
+                                                                self.iterations)
+
+        return '%s%d$%s$%s' % (self.scheme, self.iterations, _b64(salt),
+                                                                       _b64(dk))
+
+    def _parse(self, phash):
+        phash = _to_text(phash)
+        iterations, salt, dk = phash[len(self.scheme):].split('$')
+        return int(iterations), _unb64(salt), _unb64(dk)
+
+    def verify(self, password, phash):
+        iterations, salt, dk = self._parse(phash)
+        dk2 = hashlib.pbkdf2_hmac('sha256', _to_bytes(password), salt,
+                                                                     iterations)
+
+        return hmac.compare_digest(dk, dk2)
+
+    def needs_rehash(self, phash):
+        return self._parse(phash)[0] < self.iterations
+
+
+class ScryptHasher(Hasher):
+    scheme = '{SCRYPT}'
+
+    def __init__(self, n=2 ** 14, r=8, p=1):
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def is_available(self):
+        return hasattr(hashlib, 'scrypt')
+
+    def hash(self, password):
+        salt = os.urandom(16)
+        dk = hashlib.scrypt(_to_bytes(password), salt=salt, n=self.n, r=self.r,
+                                                                      p=self.p)
+
+        return '%s%d$%d$%d$%s$%s' % (self.scheme, self.n, self.r, self.p,
+                                                           _b64(salt), _b64(dk))
+
+    def _parse(self, phash):
+        phash = _to_text(phash)
+        n, r, p, salt, dk = phash[len(self.scheme):].split('$')
+        return int(n), int(r), int(p), _unb64(salt), _unb64(dk)
+
+    def verify(self, password, phash):
+        n, r, p, salt, dk = self._parse(phash)
+        dk2 = hashlib.scrypt(_to_bytes(password), salt=salt, n=n, r=r, p=p,
+                                                                dklen=len(dk))
+
+        return hmac.compare_digest(dk, dk2)
+
+    def needs_rehash(self, phash):
+        n, r, p, _, _ = self._parse(phash)
+        return (n, r, p) < (self.n, self.r, self.p)
+
+
+class Argon2Hasher(Hasher):
+    """Argon2id. Requires the argon2-cffi package."""
+
+    scheme = '{ARGON2}'
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self._hasher = None
+
+    @property
+    def hasher(self):
+        if self._hasher is None:
+            self._hasher = argon2.PasswordHasher(**self.kwargs)
+        return self._hasher
+
+    def is_available(self):
+        return argon2 is not None
+
+    def hash(self, password):
+        return self.scheme + self.hasher.hash(password)
+
+    def verify(self, password, phash):
+        try:
+            return self.hasher.verify(phash[len(self.scheme):], password)
+        except argon2.exceptions.VerificationError:
+            return False
+
+    def needs_rehash(self, phash):
+        return self.hasher.check_needs_rehash(phash[len(self.scheme):])
+
+
+hashers = OrderedDict()
+"""Registered hashers by scheme."""
+
+DEFAULT_SCHEME = Pbkdf2Hasher.scheme
+
+_default_scheme = DEFAULT_SCHEME
+
+
+def register_hasher(hasher):
+    """Registers the given :class:`Hasher` instance, replacing the one with
+    the same scheme, if any. Unavailable hashers are ignored."""
+
+    if not hasher.is_available():
+        logger.debug("Hasher for %s is not available.", hasher.scheme)
+        return False
+
+    hashers[hasher.scheme] = hasher
+    return True
+
+
+def get_hasher(phash):
+    """Returns the hasher for the given password hash.
+
+    :raise NotImplementedError: When there is no hasher for the scheme of the
+        given hash.
+    """
+
+    if isinstance(phash, bytes) and not isinstance(phash, str):
+        phash = phash.decode('latin1')
+
+    for scheme, hasher in hashers.items():
+        if phash.startswith(scheme):
+            return hasher
+
+    raise NotImplementedError(phash[:phash.find('}') + 1])
+
+
+def set_default_scheme(scheme):
+    """Sets the scheme used by :func:`hash_password` and the one hashes are
+    upgraded to on login."""
+
+    global _default_scheme
+
+    if not (scheme in hashers):
+        raise ValueError("Unknown or unavailable password scheme %r. "
+                         "Available: %r" % (scheme, list(hashers.keys())))
+
+    _default_scheme = scheme
+
+
+def get_default_scheme():
+    return _default_scheme
+
+
+def hash_password(password, scheme=None):
+    if scheme is None:
+        scheme = _default_scheme
+
+    return hashers[scheme].hash(password)
+
+
+def verify_password(password, phash):
+    return get_hasher(phash).verify(password, phash)
+
+
+def verify_and_rehash(password, phash, scheme=None):
+    """Verifies the password and, if it matches and the hash is not of the
+    given scheme or is weaker than its current parameters, generates a new
+    hash.
+
+    :return: A ``(matches, new_hash)`` tuple. ``new_hash`` is ``None`` when
+        there is no need to update the stored hash.
+    """
+
+    if scheme is None:
+        scheme = _default_scheme
+
+    hasher = get_hasher(phash)
+    if not hasher.verify(password, phash):
+        return False, None
+
+    if hasher.scheme != scheme or hasher.needs_rehash(phash):
+        return True, hashers[scheme].hash(password)
+
+    return True, None
+
+
+register_hasher(SshaHasher())
+register_hasher(Pbkdf2Hasher())
+register_hasher(ScryptHasher())
+register_hasher(Argon2Hasher())
+
+
+def _noop():
+    pass
+
+
+class HashPool(object):
+    """Runs password hashing in a bounded pool of worker processes, so that
+    slow KDFs don't hold the GIL of the process serving requests.
+
+    Hashers registered after the pool's first use are not visible to the
+    workers.
+
+    Workers are started with the ``forkserver`` or ``spawn`` method where
+    available, as forking a process that runs threads is not safe. Python 2
+    can only fork, so there :meth:`start` should be called before any threads
+    are started.
+
+    :param size: Number of worker processes. Defaults to the number of cpus.
+    """
+
+    def __init__(self, size=None):
+        self.size = size
+
+        self.pending = 0
+        self.completed = 0
+        self.rehashed = 0
+
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = self._create_executor()
+                    logger.debug("Started password hash pool with %r "
+                                                   "workers.", self.size)
+
+        return self._executor
+
+    def _create_executor(self):
+        from concurrent.futures import ProcessPoolExecutor
+
+        if PY2:
+            return ProcessPoolExecutor(self.size)
+
+        import multiprocessing
+
+        methods = multiprocessing.get_all_start_methods()
+        method = 'forkserver' if 'forkserver' in methods else 'spawn'
+
+        return ProcessPoolExecutor(self.size,
+                                mp_context=multiprocessing.get_context(method))
+
+    def start(self):
+        """Starts the worker processes. Blocks until they are up."""
+
+        self.executor.submit(_noop).result()
+
+    def _submit(self, f, *args):
+        from twisted.internet import reactor
+        from twisted.internet.defer import Deferred
+
+        d = Deferred()
+
+        def _done(future):
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+
+            e = future.exception()
+            if e is not None:
+                reactor.callFromThread(d.errback, e)
+            else:
+                reactor.callFromThread(d.callback, future.result())
+
+        with self._lock:
+            self.pending += 1
+        self.executor.submit(f, *args).add_done_callback(_done)
+
+        return d
+
+    def hash(self, password, scheme=None):
+        """Returns a Deferred that fires with the hash of the given
+        password."""
+
+        if scheme is None:
+            scheme = _default_scheme
+
+        return self._submit(hash_password, password, scheme)
+
+    def verify(self, password, phash, rehash=True):
+        """Returns a Deferred that fires with a ``(matches, new_hash)`` tuple.
+        See :func:`verify_and_rehash`. The caller is expected to store
+        ``new_hash`` when it's not ``None``.
+        """
+
+        if not rehash:
+            d = self._submit(verify_password, password, phash)
+            return d.addCallback(lambda matches: (matches, None))
+
+        def _count(retval):
+            if retval[1] is not None:
+                self.rehashed += 1
+            return retval
+
+        d = self._submit(verify_and_rehash, password, phash, _default_scheme)
+        return d.addCallback(_count)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def get_stats(self):
+        return dict(size=self.size, pending=self.pending,
+                           completed=self.completed, rehashed=self.rehashed)
+
+
+_pool = None
+
+
+def get_hash_pool(size=None):
+    """Returns the process-wide :class:`HashPool` instance."""
+
+    global _pool
+
+    if _pool is None:
+        _pool = HashPool(size)
+
+    return _pool
@@ -35,19 +35,84 @@ from spyne import ServiceBase
 from spyne.util import memoize
 
 from neurons.base.event import on_method_call
-from neurons.base.context import WriteContext, ReadContext
+from neurons.base.context import WriteContext, ReadContext, \
+                                          call_with_context, call_and_finalize
+
+
+def db_executor(store_name='sql_main'):
+    """Makes the decorated service method run in the executor thread pool of
+    the given store instead of the reactor thread. Only works for services
+    that derive from :func:`TReaderServiceBase` or :func:`TWriterServiceBase`.
+    The sessions of ``ctx.udc`` are committed and closed in the executor
+    before the return value is serialized, so the method must load everything
+    the response needs. Must be put below the ``@rpc`` decorator: ::
+
+        class SomeService(TReaderServiceBase()):
+            @rpc(Integer, _returns=SomeClass)
+            @db_executor()
+            def get_some_class(ctx, id):
+                return ctx.udc.get_session(ctx.udc.get_store()) \\
+                                                     .query(SomeClass).get(id)
+    """
+
+    def wrapper(f):
+        f.db_executor = store_name
+        return f
+
+    return wrapper
+
+
+def deadline(seconds):
+    """Gives the decorated service method ``seconds`` to finish, counted from
+    the time it's called. Once the time is up, running statements are
+    cancelled and new sessions can't be obtained from ``ctx.udc``. Overrides
+    the deadline of the listener. Must be put below the ``@rpc`` decorator: ::
+
+        class SomeService(TReaderServiceBase()):
+            @rpc(_returns=Array(SomeClass))
+            @deadline(5)
+            def get_some_classes(ctx):
+                return ctx.udc.get_session(ctx.udc.get_store()) \\
+                                                          .query(SomeClass)
+    """
+
+    def wrapper(f):
+        f.deadline = seconds
+        return f
+
+    return wrapper
 
 
 @memoize
 def TReaderServiceBase(_LogEntry=None):
-    # TODO: implement logging
     class ReaderServiceBase(ServiceBase):
         @classmethod
         def get_context(cls, ctx):
             return ReadContext(ctx)
 
+        @classmethod
+        def call_wrapper(cls, ctx, *args, **kwargs):
+            store_name = getattr(ctx.function, 'db_executor', None)
+            call_wrapper = super(ReaderServiceBase, cls).call_wrapper
+
+            if store_name is None:
+                return call_with_context(call_wrapper, ctx, *args, **kwargs)
+
+            # the commit runs in the executor as well, before the response is
+            # sent, so that its errors reach the client.
+            return ctx.udc.run_in_executor(call_and_finalize, call_wrapper,
+                                             ctx, *args, store=store_name,
+                                                                      **kwargs)
+
     ReaderServiceBase.event_manager.add_listener('method_call', on_method_call)
 
+    if _LogEntry is not None:
+        def _on_method_call_log(ctx):
+            ctx.udc.start_log(_LogEntry)
+
+        ReaderServiceBase.event_manager.add_listener('method_call',
+                                                            _on_method_call_log)
+
     return ReaderServiceBase
 
 
@@ -34,6 +34,7 @@
 
 import os
 import hmac
+import struct
 import hashlib
 import uuid
 
@@ -43,12 +44,41 @@ import neurons
 from time import time
 from Crypto.Cipher import AES
 
+try:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
+
+from neurons.base.cache import LruCache
+from neurons.base.hasher import hash_password, verify_password, SshaHasher
 from neurons.base.error import TamperedCookieError, SessionExpiredError
 from spyne.error import ValidationError
 from spyne.util.six import PY3
 
 SESSION_LIFETIME = 15 * 60
 
+SESSION_REPLENISH_THRESHOLD = SESSION_LIFETIME / 3.0
+"""Cookies with more remaining lifetime than this are not reissued by
+:func:`replenish_sid_if_needed`."""
+
+SESSION_CACHE_SIZE = 4096
+
+session_cache = LruCache(SESSION_CACHE_SIZE)
+"""Decoded session data keyed by the class and the raw session id. Entries
+expire along with the session."""
+
+_session_cache_secret = None
+
+SESSION_TOKEN_VERSION = 2
+"""Version of the tokens generated by :func:`encode`. Tokens of all known
+versions are accepted by :func:`decode` regardless of this setting."""
+
+V2_PREFIX = b'\x02'
+V2_NONCE_LENGTH = 12
+V2_TAG_LENGTH = 16
+
+_v2_keys = {}
+
 
 def pad(data, length):
     """
@@ -59,7 +89,7 @@ def pad(data, length):
     padlen = length - len(data) % length
     assert padlen <= length
     assert padlen > 0
-    return data + padlen * chr(padlen)
+    return data + padlen * struct.pack('B', padlen)
 
 
 def unpad(data, length):
@@ -68,14 +98,14 @@ def unpad(data, length):
     """
     assert length < 256
     assert length > 0
-    padlen = ord(data[-1])
+    padlen = ord(data[-1:])
     assert padlen <= length
     assert padlen > 0
-    assert data[-padlen:] == padlen * chr(padlen)
+    assert data[-padlen:] == padlen * struct.pack('B', padlen)
     return data[:-padlen]
 
 
-def encode(data, secret, salt=None):
+def encode_v1(data, secret, salt=None):
     """Encode and return the data as a random-IV-prefixed AES-encrypted
     HMAC-SHA1-authenticated padded message corresponding to the given
     data string and secret, which should be at least 36 randomly
@@ -87,14 +117,14 @@ def encode(data, secret, salt=None):
         salt = os.urandom(16)
 
     aes = AES.new(secret[:16], AES.MODE_CBC, salt)
-    padded_data = pad(20 * '\0' + data, 16)[20:]
+    padded_data = pad(20 * b'\0' + data, 16)[20:]
     mac = hmac.new(key=secret[16:], msg=padded_data, digestmod=hashlib.sha1).digest()
     encrypted = aes.encrypt(mac + padded_data)
 
     return salt + encrypted
 
 
-def decode(data, secret):
+def decode_v1(data, secret):
     """Decode and return the data from random-IV-prefixed AES-encrypted
     HMAC-SHA1-authenticated padded message corresponding to the given
     data string and secret, which should be at least 36 randomly
@@ -119,7 +149,111 @@ def decode(data, secret):
     if mac != mac2:
         raise TamperedCookieError()
 
-    return unpad(20 * '\0' + padded_data, 16)[20:]
+    return unpad(20 * b'\0' + padded_data, 16)[20:]
+
+
+def has_aead():
+    """Returns True when an AES-GCM implementation is available, either from
+    the ``cryptography`` package or from pycryptodome."""
+
+    return AESGCM is not None or hasattr(AES, 'MODE_GCM')
+
+
+def _get_v2_key(secret):
+    key = _v2_keys.get(secret)
+    if key is None:
+        # don't reuse the v1 AES and HMAC keys in a different mode.
+        key = hashlib.sha256(b'neurons-session-v2' + secret).digest()
+        if AESGCM is not None:
+            key = AESGCM(key)
+        _v2_keys.clear()
+        _v2_keys[secret] = key
+
+    return key
+
+
+def encode_v2(data, secret, nonce=None):
+    """Encode and return the data as a version-byte-and-random-nonce-prefixed
+    AES-GCM message. Encryption and authentication are done in a single pass
+    and the data is not padded. The version byte is authenticated as well.
+    """
+
+    assert len(secret) >= 36
+    if nonce is None:
+        nonce = os.urandom(V2_NONCE_LENGTH)
+
+    key = _get_v2_key(secret)
+    if AESGCM is not None:
+        encrypted = key.encrypt(nonce, data, V2_PREFIX)
+
+    else:
+        aes = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        aes.update(V2_PREFIX)
+        encrypted, tag = aes.encrypt_and_digest(data)
+        encrypted += tag
+
+    return V2_PREFIX + nonce + encrypted
+
+
+def decode_v2(data, secret):
+    """Decode and return the data from a message generated by
+    :func:`encode_v2`."""
+
+    assert len(secret) >= 36
+
+    if len(data) < 1 + V2_NONCE_LENGTH + V2_TAG_LENGTH \
+                                            or data[:1] != V2_PREFIX:
+        raise ValidationError(data, "Invalid session value. Please sign out "
+                            "and delete cookies and try again.\nData: '%s'")
+
+    nonce = data[1:1 + V2_NONCE_LENGTH]
+    encrypted = data[1 + V2_NONCE_LENGTH:]
+
+    key = _get_v2_key(secret)
+    try:
+        if AESGCM is not None:
+            return key.decrypt(nonce, encrypted, V2_PREFIX)
+
+        aes = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        aes.update(V2_PREFIX)
+        return aes.decrypt_and_verify(encrypted[:-V2_TAG_LENGTH],
+                                                 encrypted[-V2_TAG_LENGTH:])
+
+    except Exception:
+        raise TamperedCookieError()
+
+
+def encode(data, secret, version=None):
+    """Encode the data using the token format given by ``version``, which
+    defaults to :data:`SESSION_TOKEN_VERSION`. Falls back to the v1 format
+    when no AES-GCM implementation is available."""
+
+    if version is None:
+        version = SESSION_TOKEN_VERSION
+
+    if version == 2 and has_aead():
+        return encode_v2(data, secret)
+
+    return encode_v1(data, secret)
+
+
+def decode(data, secret):
+    """Decode the data from a token of any known version.
+
+    v1 tokens start with a random IV so one in 256 of them starts with the v2
+    prefix byte as well. Those are tried as v2 first and fall back to v1 when
+    the v2 tag doesn't check out. v1 tokens are always a multiple of the AES
+    block size long, so other tokens are never tried as v1."""
+
+    if data[:1] == V2_PREFIX and has_aead():
+        try:
+            return decode_v2(data, secret)
+
+        except TamperedCookieError:
+            if len(data) % 16 != 0:
+                raise
+
+    return decode_v1(data, secret)
 
 
 class SessionObject(object):
@@ -148,29 +282,48 @@ def get_du_from_sid(sid):
 
 
 def get_data(data, cls):
-    dec = decode(''.join(data), neurons.secret)
-    dec_data = msgpack.loads(dec)
-    dec_data = cls(*dec_data)
+    global _session_cache_secret
+
+    if not isinstance(data, (bytes, str)):
+        data = ''.join(data)
+
+    if _session_cache_secret is not neurons.secret:
+        session_cache.clear()
+        _session_cache_secret = neurons.secret
+
+    key = (cls, data)
+    fields = session_cache.get(key)
+
+    if fields is not None:
+        # fresh instance every time as callers are free to modify it.
+        return cls(*fields)
+
+    fields = msgpack.loads(decode(data, neurons.secret))
+    dec_data = cls(*fields)
 
     if dec_data.ttl <= time():
         raise SessionExpiredError()
-    else:
-        return dec_data
+
+    session_cache.put(key, fields, expires_at=dec_data.ttl)
+
+    return dec_data
+
+
+def get_session_cache_stats():
+    return session_cache.get_stats()
 
 
 def get_session_data(sid):
     return get_data(sid, SessionObject)
 
 
-def hashpass(password):
-    salt = os.urandom(32)
-    s = hashlib.sha1()
-    s.update(password)
-    s.update(salt)
-    hash = s.digest() + salt
-    phash = '{SSHA}' + hash
+def hashpass(password, scheme=SshaHasher.scheme):
+    """Returns the hash of the given password. Blocks, so it keeps using the
+    cheap legacy scheme unless told otherwise. See
+    :class:`neurons.base.hasher.HashPool` for the async version, which uses
+    the configured default scheme."""
 
-    return phash
+    return hash_password(password, scheme)
 
 
 def replenish_sid(sid):
@@ -185,6 +338,25 @@ def replenish_sid_ttl(sid):
     return replenish_session(s.domain, s.user, s.shash)
 
 
+def replenish_sid_if_needed(sid, threshold=None):
+    """Like :func:`replenish_sid_ttl`, but returns the given session id as-is
+    when its remaining lifetime is above ``threshold`` seconds, which
+    defaults to :data:`SESSION_REPLENISH_THRESHOLD`. This saves an encryption
+    and a new cookie on most requests.
+
+    :return: A ``(sid, ttl)`` tuple.
+    """
+
+    if threshold is None:
+        threshold = SESSION_REPLENISH_THRESHOLD
+
+    s = get_session_data(sid)
+    if s.ttl - time() >= threshold:
+        return sid, s.ttl
+
+    return replenish_session(s.domain, s.user, s.shash)
+
+
 def put_data(seconds, *args):
     ttl = time() + seconds
     data = msgpack.dumps( args + (ttl,) )
@@ -200,7 +372,8 @@ def replenish_session(domain, user, session_id):
 def gen_session_hash(user):
     salt = os.urandom(16)
     if PY3:
-        key = b''.join([uuid.getnode().to_bytes(), user, time().to_bytes()])
+        key = b''.join([str(uuid.getnode()).encode('ascii'), user,
+                                                str(time()).encode('ascii')])
     else:
         key = b''.join([str(uuid.getnode()), user, str(time())])
 
@@ -212,13 +385,8 @@ def gen_session_hash(user):
 
 
 def verify_hash(clear_password, password_hash):
-    if password_hash.startswith("{SSHA}"):
-        digest = password_hash[6:26]
-        salt = password_hash[26:]
-
-        hr = hashlib.sha1(clear_password.encode('utf8'))
-        hr.update(salt)
-
-        return digest == hr.digest()
+    """Blocking password verification. Raises NotImplementedError for unknown
+    schemes. See :class:`neurons.base.hasher.HashPool` for the async version,
+    which also upgrades outdated hashes."""
 
-    raise NotImplementedError(password_hash[:password_hash.find('}')+1])
+    return verify_password(clear_password, password_hash)
@@ -0,0 +1,260 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+import logging
+logger = logging.getLogger(__name__)
+
+from binascii import hexlify
+from time import time
+
+from spyne import Unicode, Float, AnyDict
+from spyne.util import memoize
+
+from neurons import TableModel
+from neurons.base.cache import LruCache
+from neurons.base.error import SessionExpiredError
+from neurons.base.session import SESSION_LIFETIME, gen_session_hash
+
+
+class SessionRecordMixin(TableModel):
+    __mixin__ = True
+
+    id = Unicode(40, primary_key=True)
+    user = Unicode(256, index='btree')
+    domain = Unicode(256)
+    # Double maps to DOUBLE PRECISION, which only postgresql knows. FLOAT is
+    # double precision there as well.
+    ttl = Float(index='btree')
+    data = AnyDict(store_as='json')
+
+
+@memoize
+def TSessionRecord():
+    class SessionRecord(SessionRecordMixin):
+        __namespace__ = 'neurons.base'
+        __tablename__ = 'neurons_session'
+    return SessionRecord
+
+
+class ServerSession(object):
+    def __init__(self, sid, user, domain, ttl, data=None):
+        """
+        :param sid: Session id. Hex digest of :func:`gen_session_hash`. This
+            is the only thing that goes in the cookie.
+        :param user: User name.
+        :param domain: Domain name.
+        :param ttl: Unix time after which the session is expired.
+        :param data: Arbitrary, json-serializable session payload.
+        """
+
+        self.sid = sid
+        self.user = user
+        self.domain = domain
+        self.ttl = ttl
+        self.data = data if data is not None else {}
+
+
+class SessionStore(object):
+    """Keeps session state on the server side, so the cookie needs to carry
+    only the session id.
+
+    Sessions are read from an in-memory LRU tier first and from the
+    ``neurons_session`` table when that misses. Memory entries are kept for
+    at most ``memory_ttl`` seconds after they were loaded or written, so
+    changes made by other processes, like logouts, are picked up within that
+    time.
+
+    The expiry time is pushed forward only when less than ``threshold``
+    seconds of it are left, so most requests don't write anything.
+
+    Methods here block, they should be called from a worker thread.
+
+    :param store: A :class:`neurons.daemon.store.SqlDataStore` instance.
+    :param cls: The session record class. Defaults to
+        :func:`TSessionRecord()`.
+    :param lifetime: Session lifetime in seconds.
+    :param threshold: Remaining lifetime in seconds below which the session is
+        replenished. Defaults to a third of ``lifetime``.
+    """
+
+    def __init__(self, store, cls=None, lifetime=SESSION_LIFETIME,
+                          threshold=None, cache_size=4096, memory_ttl=60):
+        if cls is None:
+            cls = TSessionRecord()
+        if threshold is None:
+            threshold = lifetime / 3.0
+
+        assert threshold <= lifetime
+
+        self.store = store
+        self.cls = cls
+        self.lifetime = lifetime
+        self.threshold = threshold
+        self.memory_ttl = memory_ttl
+
+        self.memory = LruCache(cache_size)
+
+        self.loads = 0
+        self.replenishes = 0
+
+    def _remember(self, sess):
+        expires_at = min(sess.ttl, time() + self.memory_ttl)
+        self.memory.put(sess.sid, (sess.user, sess.domain, sess.ttl,
+                                                  sess.data), expires_at)
+
+    def create(self, user, domain, data=None):
+        """Creates and persists a new session and returns it."""
+
+        key = user if isinstance(user, bytes) else user.encode('utf8')
+        sid = hexlify(gen_session_hash(key))
+        if not isinstance(sid, str):
+            sid = sid.decode('ascii')
+
+        sess = ServerSession(sid, user, domain, time() + self.lifetime, data)
+
+        table = self.cls.__table__
+        with self.store.engine.begin() as conn:
+            conn.execute(table.insert(), dict(id=sid, user=user, domain=domain,
+                                                ttl=sess.ttl, data=sess.data))
+
+        self._remember(sess)
+
+        return sess
+
+    def get(self, sid):
+        """Returns the session with the given id.
+
+        :raise SessionExpiredError: When the session is missing or expired.
+        """
+
+        loaded = False
+        fields = self.memory.get(sid)
+        if fields is None:
+            table = self.cls.__table__
+            with self.store.engine.connect() as conn:
+                row = conn.execute(table.select()
+                                        .where(table.c.id == sid)).first()
+
+            self.loads += 1
+            if row is None:
+                raise SessionExpiredError()
+
+            fields = (row.user, row.domain, row.ttl, row.data)
+            loaded = True
+
+        user, domain, ttl, data = fields
+        if ttl <= time():
+            self.memory.pop(sid)
+            raise SessionExpiredError()
+
+        sess = ServerSession(sid, user, domain, ttl, dict(data or {}))
+
+        # hits must not extend the lifetime of the memory entry, that's what
+        # bounds how long a session deleted elsewhere stays valid here.
+        if loaded:
+            self._remember(sess)
+
+        return sess
+
+    def touch(self, sess):
+        """Pushes the expiry time of the given session forward if less than
+        ``threshold`` seconds of it are left.
+
+        :return: ``True`` if the session was replenished, ie. when the cookie
+            needs to be re-sent with a new expiry time.
+        :raise SessionExpiredError: When the session was deleted meanwhile.
+        """
+
+        now = time()
+        if sess.ttl - now >= self.threshold:
+            return False
+
+        sess.ttl = now + self.lifetime
+
+        table = self.cls.__table__
+        with self.store.engine.begin() as conn:
+            result = conn.execute(table.update()
+                     .where(table.c.id == sess.sid).values(ttl=sess.ttl))
+
+        if result.rowcount == 0:
+            self.memory.pop(sess.sid)
+            raise SessionExpiredError()
+
+        self._remember(sess)
+        self.replenishes += 1
+
+        return True
+
+    def save(self, sess):
+        """Persists changes to the session payload.
+
+        :raise SessionExpiredError: When the session was deleted meanwhile.
+        """
+
+        table = self.cls.__table__
+        with self.store.engine.begin() as conn:
+            result = conn.execute(table.update()
+                                  .where(table.c.id == sess.sid)
+                                  .values(data=sess.data, ttl=sess.ttl))
+
+        if result.rowcount == 0:
+            self.memory.pop(sess.sid)
+            raise SessionExpiredError()
+
+        self._remember(sess)
+
+    def delete(self, sid):
+        self.memory.pop(sid)
+
+        table = self.cls.__table__
+        with self.store.engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.id == sid))
+
+    def purge_expired(self):
+        """Deletes expired sessions from the database.
+
+        :return: Number of deleted sessions.
+        """
+
+        table = self.cls.__table__
+        with self.store.engine.begin() as conn:
+            result = conn.execute(table.delete().where(table.c.ttl <= time()))
+
+        logger.debug("Purged %d expired sessions.", result.rowcount)
+
+        return result.rowcount
+
+    def get_stats(self):
+        return dict(memory=self.memory.get_stats(), loads=self.loads,
+                                                  replenishes=self.replenishes)
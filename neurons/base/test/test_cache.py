@@ -0,0 +1,87 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import unittest
+
+from time import time
+
+from neurons.base.cache import LruCache
+
+
+class TestLruCache(unittest.TestCase):
+    def test_get_put(self):
+        c = LruCache(2)
+        c.put('a', 1)
+
+        assert c.get('a') == 1
+        assert c.get('b') is None
+        assert c.get('b', 5) == 5
+        assert c.hits == 1
+        assert c.misses == 2
+
+    def test_evicts_least_recently_used(self):
+        c = LruCache(2)
+        c.put('a', 1)
+        c.put('b', 2)
+        c.get('a')
+        c.put('c', 3)
+
+        assert 'a' in c
+        assert not ('b' in c)
+        assert 'c' in c
+        assert c.evictions == 1
+
+    def test_expiry(self):
+        c = LruCache(2)
+        c.put('a', 1, expires_at=time() - 1)
+        c.put('b', 2, expires_at=time() + 60)
+
+        assert c.get('a') is None
+        assert not ('a' in c)
+        assert c.get('b') == 2
+        assert c.expirations == 1
+
+    def test_put_existing_does_not_evict(self):
+        c = LruCache(2)
+        c.put('a', 1)
+        c.put('b', 2)
+        c.put('a', 3)
+
+        assert len(c) == 2
+        assert c.get('a') == 3
+        assert c.get('b') == 2
+        assert c.evictions == 0
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import sqlite3
+import threading
+import unittest
+
+from time import time
+
+from neurons.base.context import ReadContext
+from neurons.base.error import RequestTimeoutError
+
+
+_LONG_QUERY = "WITH RECURSIVE r(i) AS (SELECT 1 UNION ALL " \
+              "SELECT i + 1 FROM r LIMIT 1000000) SELECT count(*) FROM r"
+
+
+class TestDeadline(unittest.TestCase):
+    def test_no_deadline(self):
+        c = ReadContext(None)
+        c.set_deadline(None)
+
+        assert c.get_remaining() is None
+        assert not c.is_expired()
+        c.check_deadline()
+
+    def test_deadline(self):
+        c = ReadContext(None)
+        c.set_deadline(60)
+        assert 59 < c.get_remaining() <= 60
+        assert not c.is_expired()
+
+        c.deadline = time() - 1
+        assert c.get_remaining() == 0
+        assert c.is_expired()
+        self.assertRaises(RequestTimeoutError, c.check_deadline)
+
+    def test_cancel(self):
+        c = ReadContext(None)
+        c.cancel()
+
+        assert c.is_expired()
+        self.assertRaises(RequestTimeoutError, c.check_deadline)
+
+    def test_sqlite_progress_handler(self):
+        c = ReadContext(None)
+        c.cancel()
+
+        conn = sqlite3.connect(':memory:')
+        conn.set_progress_handler(c._sqlite_progress, 100)
+        self.assertRaises(sqlite3.OperationalError, conn.execute,
+                                                                  _LONG_QUERY)
+
+    def test_sqlite_shared_connection(self):
+        from neurons.daemon.store import SqlDataStore
+
+        # in-memory sqlite databases share one connection, see StaticPool
+        store = SqlDataStore('sqlite://')
+
+        # no deadline, no handler
+        b = ReadContext(None)
+        session_b = b.get_session(store)
+        session_b.execute("SELECT 1")
+        assert not session_b.connection().info \
+                                         .get('neurons_progress_handler', False)
+
+        def _run_a():
+            a = ReadContext(None)
+            a.set_deadline(60)
+            a.get_session(store).execute("SELECT 1")
+            a.cancel()
+
+        t = threading.Thread(target=_run_a)
+        t.start()
+        t.join()
+
+        # the expired context's handler is on the shared connection now, but
+        # it must not interrupt the statements of another context.
+        assert session_b.execute(_LONG_QUERY).scalar() == 1000000
+        b.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
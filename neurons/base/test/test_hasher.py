@@ -0,0 +1,100 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+import unittest
+
+from neurons.base.hasher import hash_password, verify_password, \
+    verify_and_rehash, get_hasher, Pbkdf2Hasher, SshaHasher, HashPool
+from neurons.base.session import hashpass
+
+
+class TestHasher(unittest.TestCase):
+    def test_pbkdf2(self):
+        phash = Pbkdf2Hasher(iterations=1000).hash(u'şifre')
+
+        assert phash.startswith('{PBKDF2-SHA256}')
+        assert verify_password(u'şifre', phash)
+        assert not verify_password(u'sifre', phash)
+
+    def test_pbkdf2_bytes(self):
+        phash = Pbkdf2Hasher(iterations=1000).hash(u'şifre')
+
+        assert verify_password(u'şifre', phash.encode('ascii'))
+
+    def test_ssha(self):
+        phash = SshaHasher().hash(u'şifre')
+
+        assert verify_password(u'şifre', phash)
+        assert not verify_password(u'sifre', phash)
+
+    def test_unknown_scheme(self):
+        self.assertRaises(NotImplementedError, get_hasher, '{CRYPT}xyz')
+
+    def test_rehash(self):
+        phash = SshaHasher().hash(u'şifre')
+
+        assert verify_and_rehash(u'sifre', phash) == (False, None)
+
+        matches, new_hash = verify_and_rehash(u'şifre', phash,
+                                                        '{PBKDF2-SHA256}')
+        assert matches
+        assert new_hash.startswith('{PBKDF2-SHA256}')
+        assert verify_and_rehash(u'şifre', new_hash,
+                                               '{PBKDF2-SHA256}') == (True, None)
+
+    def test_weak_parameters_rehash(self):
+        phash = Pbkdf2Hasher(iterations=1000).hash(u'şifre')
+        matches, new_hash = verify_and_rehash(u'şifre', phash,
+                                                        '{PBKDF2-SHA256}')
+
+        assert matches
+        assert new_hash is not None
+        assert hash_password(u'x').startswith('{PBKDF2-SHA256}')
+
+    def test_hashpass_is_cheap(self):
+        assert hashpass(u'x').startswith(b'{SSHA}')
+
+    def test_pool(self):
+        pool = HashPool(1)
+        try:
+            pool.start()
+            phash = pool.executor.submit(hash_password, u'şifre').result()
+            assert verify_password(u'şifre', phash)
+
+        finally:
+            pool.executor.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
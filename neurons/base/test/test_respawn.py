@@ -0,0 +1,142 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import unittest
+
+from sqlalchemy import MetaData, event
+from sqlalchemy.orm.exc import NoResultFound
+from spyne import Integer32, Unicode, TTableModel
+
+from neurons.model import respawn, respawn_many, enable_respawn_cache, \
+    disable_respawn_cache
+from neurons.base.context import ReadContext, WriteContext
+from neurons.daemon.store import SqlDataStore
+
+
+TableModel = TTableModel(MetaData())
+
+
+class Item(TableModel):
+    __tablename__ = 'item'
+
+    id = Integer32(primary_key=True)
+    name = Unicode(32)
+
+
+class _StoreConfig(object):
+    def __init__(self, store):
+        self.itself = store
+
+
+class _Namespace(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class TestRespawn(unittest.TestCase):
+    def setUp(self):
+        self.store = SqlDataStore('sqlite://')
+        TableModel.Attributes.sqla_metadata.create_all(self.store.engine)
+
+        ctx = WriteContext(None)
+        session = ctx.get_session(self.store)
+        session.add_all([Item(id=i, name=u'item%d' % i) for i in range(1, 4)])
+        ctx.close()
+
+        self.queries = []
+        event.listen(self.store.engine, 'before_cursor_execute',
+                                  lambda *args: self.queries.append(args[2]))
+
+    def tearDown(self):
+        disable_respawn_cache()
+
+    def _get_ctx(self, in_object=None, udc_class=ReadContext):
+        config = _Namespace(stores={'sql_main': _StoreConfig(self.store)})
+        return _Namespace(app=_Namespace(config=config),
+                          udc=udc_class(None), in_object=[in_object])
+
+    def _num_selects(self):
+        return len([q for q in self.queries if q.startswith('SELECT')])
+
+    def test_identity_map(self):
+        ctx = self._get_ctx(Item(id=2))
+        loaded = ctx.udc.get_session(self.store).query(Item).get(2)
+        num_selects = self._num_selects()
+
+        assert respawn(Item, ctx) is loaded
+        assert self._num_selects() == num_selects
+        ctx.udc.close()
+
+    def test_not_found(self):
+        ctx = self._get_ctx(Item(id=42))
+
+        self.assertRaises(NoResultFound, respawn, Item, ctx)
+        ctx.udc.close()
+
+    def test_many(self):
+        ctx = self._get_ctx()
+        items = respawn_many(Item, ctx, [3, 42, 1])
+
+        assert [getattr(i, 'name', None) for i in items] == \
+                                                    [u'item3', None, u'item1']
+        assert self._num_selects() == 1
+        ctx.udc.close()
+
+    def test_cache(self):
+        enable_respawn_cache()
+
+        ctx = self._get_ctx(Item(id=1))
+        assert respawn(Item, ctx).name == u'item1'
+        ctx.udc.close()
+        assert self._num_selects() == 1
+
+        # another request gets it from the cache
+        ctx = self._get_ctx(Item(id=1))
+        assert respawn(Item, ctx).name == u'item1'
+        ctx.udc.close()
+        assert self._num_selects() == 1
+
+        # committing a change drops it from the cache
+        ctx = self._get_ctx(Item(id=1), udc_class=WriteContext)
+        respawn(Item, ctx).name = u'changed'
+        ctx.udc.close()
+
+        ctx = self._get_ctx(Item(id=1))
+        assert respawn(Item, ctx).name == u'changed'
+        ctx.udc.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
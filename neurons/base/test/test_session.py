@@ -0,0 +1,83 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+import unittest
+
+from neurons.base.error import TamperedCookieError
+from neurons.base.session import encode, decode, encode_v1, encode_v2, \
+    has_aead
+
+SECRET = b'0123456789abcdef0123456789abcdef0123456789abcdef'
+
+
+class TestSessionToken(unittest.TestCase):
+    def test_v1_roundtrip(self):
+        data = b'some session data'
+        assert decode(encode_v1(data, SECRET), SECRET) == data
+
+    @unittest.skipIf(not has_aead(), "no AES-GCM implementation")
+    def test_v2_roundtrip(self):
+        data = b'some session data'
+        token = encode_v2(data, SECRET)
+
+        assert token[:1] == b'\x02'
+        assert decode(token, SECRET) == data
+        assert decode(encode(data, SECRET, version=2), SECRET) == data
+
+    @unittest.skipIf(not has_aead(), "no AES-GCM implementation")
+    def test_v2_tampered(self):
+        token = bytearray(encode_v2(b'some session data', SECRET))
+        token[-1] ^= 1
+
+        self.assertRaises(TamperedCookieError, decode, bytes(token), SECRET)
+
+    def test_v1_with_v2_prefix(self):
+        data = b'some session data'
+        token = encode_v1(data, SECRET, salt=b'\x02' * 16)
+
+        assert len(token) % 16 == 0
+        assert decode(token, SECRET) == data
+
+    def test_v1_lengths(self):
+        # every padding length, including a full block of padding
+        for i in range(33):
+            data = b'x' * i
+            token = encode_v1(data, SECRET, salt=b'\x02' + b'\x00' * 15)
+
+            assert len(token) % 16 == 0
+            assert decode(token, SECRET) == data
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from time import sleep
+
+from neurons.base.error import SessionExpiredError
+from neurons.base.session_store import SessionStore, TSessionRecord
+from neurons.daemon.store import SqlDataStore
+
+
+class TestSessionStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = SqlDataStore('sqlite:///%s' %
+                                       os.path.join(self.tmpdir, 'test.db'))
+        self.table = TSessionRecord().__table__
+        self.table.create(self.store.engine)
+
+    def tearDown(self):
+        self.store.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def _delete_elsewhere(self, sid):
+        with self.store.engine.begin() as conn:
+            conn.execute(self.table.delete().where(self.table.c.id == sid))
+
+    def test_hit_and_miss(self):
+        sessions = SessionStore(self.store)
+        sess = sessions.create(u'user', u'domain', data={'a': 1})
+
+        assert sessions.get(sess.sid).data == {'a': 1}
+        assert sessions.loads == 0
+
+        sessions.memory.clear()
+        assert sessions.get(sess.sid).user == 'user'
+        assert sessions.loads == 1
+
+        self.assertRaises(SessionExpiredError, sessions.get, 'nonexistent')
+
+    def test_expired(self):
+        sessions = SessionStore(self.store)
+        sess = sessions.create(u'user', u'domain')
+
+        with self.store.engine.begin() as conn:
+            conn.execute(self.table.update().values(ttl=0))
+        sessions.memory.clear()
+
+        self.assertRaises(SessionExpiredError, sessions.get, sess.sid)
+
+    def test_deleted_elsewhere(self):
+        sessions = SessionStore(self.store, memory_ttl=0.2)
+        sess = sessions.create(u'user', u'domain')
+        self._delete_elsewhere(sess.sid)
+
+        # still in memory
+        sleep(0.1)
+        assert sessions.get(sess.sid).sid == sess.sid
+
+        # the hit above must not have extended memory_ttl
+        sleep(0.15)
+        self.assertRaises(SessionExpiredError, sessions.get, sess.sid)
+
+    def test_touch_deleted_elsewhere(self):
+        sessions = SessionStore(self.store, lifetime=60, threshold=60)
+        sess = sessions.create(u'user', u'domain')
+        self._delete_elsewhere(sess.sid)
+
+        self.assertRaises(SessionExpiredError, sessions.touch, sess)
+        assert sessions.memory.get(sess.sid) is None
+
+
+if __name__ == '__main__':
+    unittest.main()
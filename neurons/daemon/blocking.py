@@ -0,0 +1,173 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+"""Detects known blocking calls that are made in the reactor thread.
+
+It's off by default. Set the ``blocking_guard`` option of the daemon config
+(or call :func:`set_mode`) to one of:
+
+  * ``count``: Just count the calls per kind and per call site.
+  * ``log``: Count, and also log the stack the first time a call site is seen.
+  * ``raise``: Count, log and raise :class:`ReactorBlockedError`.
+
+SQLAlchemy connection checkouts and LDAP operations of neurons data stores are
+hooked. Checkouts are only counted and logged, as raising from inside a pool
+event leaves the connection checked out. Sessions obtained from
+``ctx.udc.get_session()`` in the reactor thread raise instead. Other code can
+call :func:`check` right before doing something blocking.
+"""
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import threading
+import traceback
+
+from collections import defaultdict
+
+import neurons
+
+
+MODES = ('off', 'count', 'log', 'raise')
+
+MAX_SITES = 256
+"""Maximum number of distinct call sites to remember."""
+
+_mode = 'off'
+_lock = threading.Lock()
+_counts = defaultdict(int)
+_sites = {}
+
+_LIBRARY_DIRS = (os.sep + 'sqlalchemy' + os.sep,)
+
+
+class ReactorBlockedError(Exception):
+    pass
+
+
+def set_mode(mode):
+    global _mode
+
+    if mode is None:
+        mode = 'off'
+
+    assert mode in MODES, "Invalid blocking guard mode %r" % (mode,)
+
+    _mode = mode
+    if mode != 'off':
+        logger.info("Blocking call guard is in '%s' mode.", mode)
+
+
+def get_mode():
+    return _mode
+
+
+def check(kind, what=None, may_raise=True):
+    """Call this before a blocking operation.
+
+    :param kind: A short string to group calls by, e.g. 'sql'.
+    :param what: Optional description of the call.
+    :param may_raise: Pass False when raising would leave things in an
+        inconsistent state, e.g. from event handlers.
+    """
+
+    if _mode == 'off' or not neurons.is_reactor_thread():
+        return
+
+    # skip this frame and the hook that called us.
+    stack = traceback.extract_stack()[:-2]
+    # then the library code, the call site is where it's called from.
+    while len(stack) > 1 and any(d in stack[-1][0] for d in _LIBRARY_DIRS):
+        stack.pop()
+
+    # FrameSummary instances are not hashable.
+    site = tuple((f[0], f[1], f[2]) for f in stack[-6:])
+
+    with _lock:
+        _counts[kind] += 1
+
+        first = False
+        num = _sites.get(site, None)
+        if num is None:
+            if len(_sites) < MAX_SITES:
+                _sites[site] = 1
+                first = True
+        else:
+            _sites[site] = num + 1
+
+    if _mode in ('log', 'raise') and first:
+        logger.warning("Blocking %s call %s in the reactor thread:\n%s", kind,
+                       '' if what is None else repr(what),
+                       ''.join(traceback.format_list(stack[-12:])))
+
+    if _mode == 'raise' and may_raise:
+        raise ReactorBlockedError("Blocking %s call %r in the reactor thread"
+                                                                % (kind, what))
+
+
+def get_stats(top=10):
+    """Returns the number of blocking calls per kind and the call sites that
+    did the most of them."""
+
+    with _lock:
+        counts = dict(_counts)
+        sites = sorted(_sites.items(), key=lambda x: -x[1])[:top]
+
+    return dict(
+        counts=counts,
+        sites=[(''.join(traceback.format_list(
+                                          [f + (None,) for f in site])), num)
+                                                        for site, num in sites],
+    )
+
+
+def reset_stats():
+    with _lock:
+        _counts.clear()
+        _sites.clear()
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    check('sql', 'connection checkout', may_raise=False)
+
+
+def install_sqlalchemy(engine):
+    """Makes connection checkouts from the given engine's pool go through
+    :func:`check`."""
+
+    from sqlalchemy import event
+
+    if not event.contains(engine, 'checkout', _on_checkout):
+        event.listen(engine, 'checkout', _on_checkout)
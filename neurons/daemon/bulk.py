@@ -0,0 +1,202 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+"""Fast loading of large amounts of rows, e.g. seed data during bootstrap.
+Uses COPY on PostgreSQL and large executemany() transactions elsewhere."""
+
+import logging
+logger = logging.getLogger(__name__)
+
+import csv
+
+from binascii import hexlify
+from time import time
+
+from sqlalchemy import LargeBinary
+
+from spyne.util.six import StringIO, PY2, text_type
+
+
+def _get_table(cls_or_table):
+    return getattr(cls_or_table, '__table__', cls_or_table)
+
+
+def _to_copy_value(value, binary):
+    if value is None:
+        return value
+
+    if binary:
+        # bytea hex format
+        return '\\x' + hexlify(value).decode('ascii')
+
+    if PY2 and isinstance(value, text_type):
+        return value.encode('utf8')
+
+    return value
+
+
+def _get_processors(dialect, table, names):
+    """Returns a ``(processor, is_binary)`` tuple for every given column."""
+
+    retval = []
+    for name in names:
+        type_ = table.c[name].type
+        retval.append((type_.dialect_impl(dialect).bind_processor(dialect),
+                                               isinstance(type_, LargeBinary)))
+    return retval
+
+
+def _copy(conn, table, names, procs, rows):
+    dialect = conn.dialect
+
+    # QUOTE_NONNUMERIC quotes empty strings but not Nones, which is how
+    # COPY's csv format tells them apart.
+    buf = StringIO()
+    writer = csv.writer(buf, quoting=csv.QUOTE_NONNUMERIC)
+    for row in rows:
+        values = []
+        for name, (proc, binary) in zip(names, procs):
+            v = row.get(name, None)
+            if v is not None and proc is not None and not binary:
+                v = proc(v)
+            values.append(_to_copy_value(v, binary))
+
+        writer.writerow(values)
+
+    buf.seek(0)
+
+    sql = 'COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (
+        dialect.identifier_preparer.format_table(table),
+        ', '.join([dialect.identifier_preparer.quote(n) for n in names]))
+
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(sql, buf)
+    finally:
+        cursor.close()
+
+
+def _insert(conn, table, names, rows):
+    # executemany() needs every row to have the same keys.
+    rows = [dict([(k, row.get(k, None)) for k in names]) for row in rows]
+    conn.execute(table.insert(), rows)
+
+
+def bulk_load(engine, cls_or_table, rows, batch_size=50000,
+                                                         defer_indexes=False):
+    """Loads the given rows into the given table in big transactions.
+
+    :param engine: The engine of the target database.
+    :param cls_or_table: A TableModel subclass or a sqlalchemy ``Table``.
+    :param rows: An iterable of dicts. Can be a generator. All rows must
+        have the same columns; the missing ones are left to their defaults.
+        Note that COPY only applies server-side defaults.
+    :param batch_size: Number of rows per transaction.
+    :param defer_indexes: When ``True``, indexes of the table are dropped
+        before the load and created again after it. Meant for empty tables.
+    :return: Number of loaded rows.
+    """
+
+    table = _get_table(cls_or_table)
+    is_pg = engine.dialect.name == 'postgresql'
+
+    names = [c.name for c in table.columns]
+
+    indexes = []
+    if defer_indexes:
+        indexes = list(table.indexes)
+        for index in indexes:
+            index.drop(engine)
+
+    start = time()
+    num_rows = 0
+    done = False
+
+    try:
+        batch = []
+
+        # only pass the columns that are present in the data so that the
+        # rest get their defaults.
+        present = None
+        procs = []
+
+        def _flush():
+            with engine.begin() as conn:
+                if is_pg:
+                    # bind processors are looked up once per load
+                    if len(procs) == 0:
+                        procs.extend(_get_processors(engine.dialect, table,
+                                                                     present))
+                    _copy(conn, table, present, procs, batch)
+                else:
+                    _insert(conn, table, present, batch)
+
+        for row in rows:
+            row_names = [n for n in names if n in row]
+            if present is None:
+                present = row_names
+
+            elif row_names != present:
+                raise ValueError("Row %d has columns %r, expected %r" %
+                                          (num_rows + len(batch), row_names,
+                                                                     present))
+
+            batch.append(row)
+            if len(batch) >= batch_size:
+                _flush()
+                num_rows += len(batch)
+                del batch[:]
+
+        if len(batch) > 0:
+            _flush()
+            num_rows += len(batch)
+
+        done = True
+
+    finally:
+        for index in indexes:
+            try:
+                index.create(engine)
+
+            except Exception as e:
+                if done:
+                    raise
+
+                # don't hide the error that stopped the load
+                logger.error("Could not recreate index %s: %r", index.name, e)
+
+    logger.info("Loaded %d rows to %s in %.1fs.", num_rows, table.name,
+                                                                 time() - start)
+
+    return num_rows
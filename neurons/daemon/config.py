@@ -59,7 +59,7 @@ from spyne.util import six
 from spyne.util.dictdoc import yaml_loads, get_object_as_yaml
 
 from neurons.daemon.daemonize import daemonize
-from neurons.daemon.store import SqlDataStore
+from neurons.daemon.store import SqlDataStore, PooledLdapDataStore
 from neurons.daemon.cli import spyne_to_argparse, config_overrides
 
 STATIC_DESC_ROOT = "Directory that contains static files for the root url."
@@ -166,25 +166,120 @@ class Relational(StorageInfo):
     )
 
     async_pool = Boolean(default=True)
+    async_pool_min = UnsignedInteger(default=1)
+    async_pool_max = UnsignedInteger(default=10)
+    async_pool_idle_timeout = UnsignedInteger(default=300,
+                      help="Idle connections above async_pool_min are closed "
+                           "after this many seconds. 0 means never.")
+
+    replicas = Array(Unicode, help="Connection strings of read-only replicas. "
+                                   "Read-only contexts read from these.")
+    replica_policy = Unicode(
+        default='round_robin',
+        values=['round_robin', 'least_checked_out'],
+    )
+    read_your_writes_sec = UnsignedInteger(default=5)
+
+    prepared_statements = UnsignedInteger(default=0,
+                    help="When nonzero, each connection prepares and reuses "
+                         "up to this many statements. PostgreSQL only.")
+
+    sqlite_journal_mode = Unicode(default='WAL',
+                  values=['DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL'],
+                  help="Journal mode for file-backed SQLite databases.")
+    sqlite_synchronous = Unicode(default='NORMAL',
+                                 values=['OFF', 'NORMAL', 'FULL', 'EXTRA'])
+    sqlite_mmap_size = UnsignedInteger(default=268435456,
+                          help="Bytes of the database file to memory-map.")
+    sqlite_cache_size_kb = UnsignedInteger(default=65536,
+                          help="Page cache size per connection, in KiB.")
+    sqlite_busy_timeout = UnsignedInteger(default=5000,
+                    help="Milliseconds to wait for a locked SQLite database.")
+
+    query_cache_size = UnsignedInteger(default=0,
+                    help="When nonzero, SqlDataStore.select_cached() keeps up "
+                         "to this many results.")
+    query_cache_ttl = UnsignedInteger(default=300)
+
+    pool_monitor = Boolean(default=False,
+                    help="Track connection checkouts. See "
+                         "SqlDataStore.get_pool_stats().")
+    pool_hold_warn_sec = UnsignedInteger(default=30,
+                    help="Log connections held longer than this many seconds "
+                         "with the stack that checked them out. 0 disables.")
+    pool_capture_stacks = Boolean(default=False,
+                    help="Record the stack of every checkout. Costly.")
 
     def __init__(self, *args, **kwargs):
         super(Relational, self).__init__(*args, **kwargs)
         self.itself = None
 
+    def get_sqlite_pragmas(self):
+        cache_size = None
+        if self.sqlite_cache_size_kb is not None:
+            # negative values are in KiB, positive ones in pages.
+            cache_size = -self.sqlite_cache_size_kb
+
+        return (
+            ('busy_timeout', self.sqlite_busy_timeout),
+            ('journal_mode', self.sqlite_journal_mode),
+            ('synchronous', self.sqlite_synchronous),
+            ('cache_size', cache_size),
+            ('mmap_size', self.sqlite_mmap_size),
+        )
+
     def apply(self):
         self.itself = SqlDataStore(self.conn_str, pool_size=self.pool_size,
-            echo_pool=self.echo_pool)
+            max_overflow=self.max_overflow, pool_timeout=self.pool_timeout,
+            pool_recycle=self.pool_recycle, echo_pool=self.echo_pool,
+            sqlite_pragmas=self.get_sqlite_pragmas())
+
+        if self.sync_pool:
+            # one thread per connection the sync pool can hand out.
+            from sqlalchemy.pool import QueuePool
+            if isinstance(self.itself.engine.pool, QueuePool):
+                num_threads = self.pool_size + self.max_overflow
+            else:
+                num_threads = 1
+            self.itself.add_executor(num_threads, timeout=self.pool_timeout)
+
+            self.itself.replica_policy = self.replica_policy
+            self.itself.read_your_writes_sec = self.read_your_writes_sec
+            for conn_str in self.replicas or []:
+                self.itself.add_replica(conn_str)
+
+            if self.pool_monitor:
+                monitor = self.itself.add_pool_monitor(
+                                 hold_threshold=self.pool_hold_warn_sec or None,
+                                 capture_stacks=self.pool_capture_stacks)
+                monitor.start()
+
+            if self.query_cache_size:
+                self.itself.add_query_cache(size=self.query_cache_size,
+                                            ttl=self.query_cache_ttl or None)
+
+            if self.prepared_statements:
+                if self.conn_str.startswith('postgres'):
+                    self.itself.add_statement_cache(self.prepared_statements)
+                else:
+                    logger.warning("Store '%s': prepared_statements is only "
+                                   "supported on PostgreSQL.", self.name)
+
         if not (self.async_pool or self.sync_pool):
             logger.debug("Store '%s' is disabled.", self.name)
 
         if self.async_pool:
             if self.conn_str.startswith('postgres'):
-                self.itself.add_txpool()
+                self.itself.add_txpool(min=self.async_pool_min,
+                                   max=max(self.async_pool_min,
+                                           self.async_pool_max),
+                                   idle_timeout=self.async_pool_idle_timeout)
             else:
                 self.async_pool = False
 
         if not self.sync_pool:
             self.itself.Session = None
+            self.itself.ReadOnlySession = None
             self.itself.metadata = None
             self.itself.engine.dispose()
             self.itself.engine = None
@@ -197,10 +292,66 @@ class Relational(StorageInfo):
 
         if self.sync_pool:
             self.itself.Session = None
+            self.itself.ReadOnlySession = None
             self.itself.metadata = None
             self.itself.engine.dispose()
             self.itself.engine = None
 
+            for engine in self.itself.replicas:
+                engine.dispose()
+            self.itself.replicas = []
+
+        self.itself = None
+
+        return self
+
+
+class Ldap(StorageInfo):
+    host = Unicode
+    port = UnsignedInteger16(default=389)
+    base_dn = Unicode
+    bind_dn = Unicode
+    password = Unicode
+
+    pool_size = UnsignedInteger(default=5)
+    network_timeout = Double(default=10.0,
+                                 help="Seconds to wait while connecting.")
+    timeout = Double(default=30.0,
+                     help="Seconds to wait for the result of an operation.")
+    checkout_timeout = Double(default=10.0,
+                              help="Seconds to wait for a free connection.")
+    health_check_interval = UnsignedInteger(default=60,
+                help="Idle connections are checked this often. 0 disables.")
+
+    cache_size = UnsignedInteger(default=0,
+                help="When nonzero, caches this many search results.")
+    cache_ttl = UnsignedInteger(default=300)
+    cache_negative_ttl = UnsignedInteger(default=30,
+                help="Seconds to cache searches that return nothing.")
+    bind_cache_ttl = UnsignedInteger(default=0,
+                help="When nonzero, successful binds are remembered as "
+                     "salted hashes for this many seconds.")
+
+    def __init__(self, *args, **kwargs):
+        super(Ldap, self).__init__(*args, **kwargs)
+        self.itself = None
+
+    def apply(self):
+        self.itself = PooledLdapDataStore(self.host, self.base_dn,
+                self.bind_dn, self.password, port=self.port,
+                network_timeout=self.network_timeout, pool_size=self.pool_size,
+                timeout=self.timeout, checkout_timeout=self.checkout_timeout,
+                health_check_interval=self.health_check_interval)
+
+        if self.cache_size:
+            self.itself.add_cache(size=self.cache_size, ttl=self.cache_ttl,
+                                    negative_ttl=self.cache_negative_ttl,
+                                    bind_ttl=self.bind_cache_ttl)
+
+        return self
+
+    def close(self):
+        self.itself.close()
         self.itself = None
 
         return self
@@ -314,6 +465,10 @@ class HttpListener(Listener):
     _type_info = [
         ('static_dir', Unicode),
         ('_subapps', Array(HttpApplication, sub_name='subapps')),
+        ('deadline', Double(help="Seconds a request to this listener can "
+                                 "take before its queries are cancelled. "
+                                 "Service methods can override this with "
+                                 "the @deadline decorator.")),
     ]
 
     def _push_asset_dir_overrides(self, obj):
@@ -382,7 +537,11 @@ class HttpListener(Listener):
             if subapp.url != '':
                 root.putChild(subapp.url, subapp.gen_resource())
 
-        return Site(root)
+        site = Site(root)
+        # read by neurons.base.event.get_deadline()
+        site.neurons_deadline = self.deadline
+
+        return site
 
     @property
     def _subapps(self):
@@ -545,6 +704,26 @@ class Daemon(ComplexModel):
             help=u"Prepend current memory usage to all logging messages. "
                  u"Requires psutil")),
 
+        ('blocking_guard', Unicode(
+            values=['off', 'count', 'log', 'raise'],
+            help=u"What to do when a known blocking call (sql connection "
+                 u"checkouts, ldap operations) is made in the reactor "
+                 u"thread. See neurons.daemon.blocking.")),
+
+        ('lag_monitor_ms', UnsignedInteger(
+            help=u"When set, monitors the reactor and logs the stack of the "
+                 u"reactor thread when it doesn't tick for this many "
+                 u"milliseconds. See neurons.daemon.lag.")),
+
+        ('password_scheme', Unicode(
+            help=u"Scheme for new password hashes. Hashes of other schemes "
+                 u"are upgraded on login. See neurons.base.hasher.")),
+
+        ('password_hash_workers', UnsignedInteger(
+            help=u"Number of processes that verify password hashes. When "
+                 u"set, they are started with the daemon. Otherwise one "
+                 u"process per cpu is started on first use.")),
+
         ('log_rpc', Boolean(help=u"Log raw rpc data.")),
         ('log_cust', Boolean(help=u"Log customization operations.")),
         ('log_interface', Boolean(help=u"Log interface build process.")),
@@ -884,6 +1063,16 @@ class Daemon(ComplexModel):
         self.apply_limits()
         self.apply_logging()
 
+        from neurons.daemon import blocking
+        blocking.set_mode(self.blocking_guard)
+
+        from neurons.base import hasher
+        if self.password_scheme is not None:
+            hasher.set_default_scheme(self.password_scheme)
+        if self.password_hash_workers:
+            # before any threads are started, see HashPool.
+            hasher.get_hash_pool(self.password_hash_workers).start()
+
         if self.pid_file is not None:
             pid = os.getpid()
             with open(self.pid_file, 'w') as f:
@@ -961,6 +1150,22 @@ class ServiceDaemon(Daemon):
                                     "neurons.TableModel's metadata to.")),
 
         ('gen_data', Boolean(help="Generates random data", no_file=True)),
+
+        ('gen_data_scale', UnsignedInteger(default=1000, no_file=True,
+            help="Number of random rows to generate for tables without "
+                 "foreign keys. See neurons.daemon.gendata.")),
+
+        ('gen_data_fanout', UnsignedInteger(default=5, no_file=True,
+            help="Tables with foreign keys get gen_data_scale times this "
+                 "many random rows.")),
+
+        ('migrate', Boolean(help="Runs pending data migrations and exits.",
+                            no_file=True)),
+
+        ('migrate_in_background', Boolean(
+            help="Runs pending data migrations in the background while "
+                 "serving requests. See neurons.daemon.migrate.")),
+
         ('_stores', Array(StorageInfo, sub_name='stores')),
     ]
 
@@ -1010,6 +1215,8 @@ class ServiceDaemon(Daemon):
                                                (daemon_name, getpass.getuser()),
                     sync_pool=True,
                     async_pool=True,
+                    async_pool_min=1,
+                    async_pool_max=10,
                 ),
             ],
             main_store=u'sql_main',
@@ -1038,12 +1245,30 @@ class ServiceDaemon(Daemon):
 
         return self
 
+    def get_storage_ready(self):
+        """Returns a Deferred that fires when the async pools of all stores
+        are ready, or None when there aren't any async pools to wait for."""
+
+        dl = []
+        for store in self._stores or []:
+            itself = getattr(store, 'itself', None)
+            d = getattr(itself, 'txpool_start_deferred', None)
+            if d is not None:
+                dl.append(d)
+
+        if len(dl) == 0:
+            return None
+
+        from twisted.internet.defer import gatherResults
+        return gatherResults(dl, consumeErrors=True)
+
     def apply(self, for_testing=False):
         """Daemonizes the process if requested, then sets up logging and pid
         files plus data stores.
-        """
 
-        # FIXME: apply_storage could return a deferred due to txpool init.
+        Async pools are still connecting when this returns. See
+        :meth:`get_storage_ready`.
+        """
 
         super(ServiceDaemon, self).apply(for_testing=for_testing)
 
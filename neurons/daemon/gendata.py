@@ -0,0 +1,427 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+"""Generates random rows for all tables of :class:`neurons.TableModel`, for
+reproducing production-scale data sets locally. See the ``--gen-data``
+daemon option."""
+
+import logging
+logger = logging.getLogger(__name__)
+
+import random
+import string
+
+from uuid import UUID
+from decimal import Decimal as D
+from datetime import date, time, datetime, timedelta
+
+from sqlalchemy import inspect, select, func, Integer, String, Boolean, \
+    DateTime, Date, Time, Float, Numeric, LargeBinary, Enum, Text
+
+from spyne import ModelBase
+
+from neurons import TableModel
+from neurons.daemon.bulk import bulk_load
+
+WORDS = (
+    u"lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    u"tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam "
+    u"quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo "
+    u"consequat duis aute irure in reprehenderit voluptate velit esse cillum "
+    u"eu fugiat nulla pariatur excepteur sint occaecat cupidatat non proident "
+    u"sunt culpa qui officia deserunt mollit anim id est laborum"
+).split()
+
+MAX_FK_SAMPLE = 100000
+"""Maximum number of non-integer primary key values to remember per table for
+filling foreign keys."""
+
+
+def get_table_classes(base=TableModel):
+    """Returns a dict of tables to the spyne classes they are mapped to.
+    Customized classes are skipped in favor of the originals."""
+
+    retval = {}
+    stack = [base]
+    while len(stack) > 0:
+        cls = stack.pop()
+        stack.extend(cls.__subclasses__())
+
+        table = cls.__dict__.get('__table__', None)
+        if table is None:
+            continue
+
+        mapper = inspect(cls, raiseerr=False)
+        if mapper is None or mapper.class_ is not cls:
+            continue
+
+        # subclasses in single table inheritance have the table of their
+        # parent as well. it belongs to the root of the hierarchy.
+        inherits = mapper.inherits
+        if inherits is not None and inherits.local_table is mapper.local_table:
+            continue
+
+        retval[table] = cls
+
+    return retval
+
+
+def _get_num(v, default):
+    if v is None:
+        return default
+
+    try:
+        v = float(v)
+    except (TypeError, ValueError):
+        return default
+
+    if v != v or v in (float('inf'), float('-inf')):
+        return default
+
+    return v
+
+
+class DataGenerator(object):
+    """Fills the tables of the given metadata with random rows.
+
+    Values follow the constraints of the spyne types where there is one:
+    ``values``, ``max_len``, ``ge``/``gt``/``le``/``lt`` and nullability.
+    Rows of polymorphic classes are spread over the classes in the hierarchy
+    with the right discriminator values. Foreign keys, including the ones
+    generated for ``store_as=table`` arrays, point to rows generated before,
+    so tables are filled in dependency order.
+
+    :param store: A :class:`neurons.daemon.store.SqlDataStore` instance.
+    :param base: The table model base class whose subclasses are used to
+        find the spyne types of the tables. Defaults to
+        :class:`neurons.TableModel`.
+    :param scale: Number of rows for tables without foreign keys.
+    :param fanout: Tables with foreign keys get ``scale * fanout`` rows.
+    :param counts: A dict of table names to row counts, overriding the above.
+    :param null_ratio: Ratio of ``None`` values in nullable columns.
+    """
+
+    def __init__(self, store, metadata=None, scale=1000, fanout=5,
+                    counts=None, null_ratio=0.1, batch_size=10000, seed=None,
+                                                                    base=None):
+        if base is None:
+            base = TableModel
+        if metadata is None:
+            metadata = base.Attributes.sqla_metadata
+
+        self.store = store
+        self.metadata = metadata
+        self.scale = scale
+        self.fanout = fanout
+        self.counts = counts or {}
+        self.null_ratio = null_ratio
+        self.batch_size = batch_size
+
+        self.random = random.Random(seed)
+        self.classes = get_table_classes(base)
+
+        # table name -> (min, max) for integer primary keys or a list of
+        # primary key values for the others
+        self.pks = {}
+
+    def get_count(self, table):
+        if table.name in self.counts:
+            return self.counts[table.name]
+
+        if len(table.foreign_keys) > 0:
+            return self.scale * self.fanout
+
+        return self.scale
+
+    def gen_string(self, max_len):
+        if max_len is None:
+            max_len = 64
+
+        words = []
+        length = 0
+        target = self.random.randint(1, max(1, max_len))
+        while length < target:
+            w = self.random.choice(WORDS)
+            words.append(w)
+            length += len(w) + 1
+
+        return u' '.join(words)[:max_len]
+
+    def gen_number(self, attrs, lo, hi, integer):
+        lo = max(lo, _get_num(attrs.ge, lo), _get_num(attrs.gt, lo - 1) + 1)
+        hi = min(hi, _get_num(attrs.le, hi), _get_num(attrs.lt, hi + 1) - 1)
+        if lo > hi:
+            lo = hi
+
+        if integer:
+            return self.random.randint(int(lo), int(hi))
+
+        return self.random.uniform(lo, hi)
+
+    def gen_fk(self, column):
+        fk = next(iter(column.foreign_keys))
+        pks = self.pks.get(fk.column.table.name, None)
+        if pks is None:
+            return None
+
+        if isinstance(pks, tuple):
+            return self.random.randint(*pks)
+
+        if len(pks) == 0:
+            return None
+
+        return self.random.choice(pks)
+
+    def gen_value(self, column, cls=None):
+        """Returns a random value for the given column. ``cls`` is the spyne
+        type of the column, if any."""
+
+        attrs = getattr(cls, 'Attributes', None)
+        if attrs is None:
+            attrs = ModelBase.Attributes
+
+        if column.nullable and self.random.random() < self.null_ratio:
+            return None
+
+        if len(column.foreign_keys) > 0:
+            return self.gen_fk(column)
+
+        values = getattr(attrs, 'values', None)
+        if values:
+            return self.random.choice(list(values))
+
+        type_ = column.type
+        if isinstance(type_, Enum):
+            return self.random.choice(type_.enums)
+
+        if isinstance(type_, Boolean):
+            return self.random.random() < 0.5
+
+        if isinstance(type_, Integer):
+            return self.gen_number(attrs, 0, 2 ** 31 - 1, True)
+
+        if isinstance(type_, Numeric):
+            v = self.gen_number(attrs, 0, 1e6, False)
+            if isinstance(type_, Float):
+                return v
+
+            scale = type_.scale if type_.scale is not None else 2
+            return D(v).quantize(D(10) ** -scale)
+
+        if isinstance(type_, DateTime):
+            return datetime(2000, 1, 1) + timedelta(
+                                seconds=self.random.randint(0, 30 * 365 * 86400))
+
+        if isinstance(type_, Date):
+            return date(2000, 1, 1) + timedelta(
+                                           days=self.random.randint(0, 30 * 365))
+
+        if isinstance(type_, Time):
+            return time(self.random.randint(0, 23), self.random.randint(0, 59),
+                                                      self.random.randint(0, 59))
+
+        if isinstance(type_, LargeBinary):
+            n = self.random.randint(1, 64)
+            return bytes(bytearray(self.random.getrandbits(8)
+                                                          for _ in range(n)))
+
+        if isinstance(type_, (String, Text)):
+            max_len = getattr(attrs, 'max_len', None)
+            if max_len is None or max_len == float('inf'):
+                max_len = getattr(type_, 'length', None)
+            if max_len is not None:
+                max_len = int(max_len)
+
+            if getattr(attrs, 'type_name', None) == 'uuid':
+                return str(UUID(int=self.random.getrandbits(128)))
+
+            return self.gen_string(max_len)
+
+        # json, xml and others get the zero value of their python type, if
+        # they can't be null.
+        try:
+            return type_.python_type()
+        except (NotImplementedError, TypeError):
+            return None
+
+    def _get_types(self, cls):
+        """Returns the mapper of the given class and a list of
+        ``(mapper, types, column_names)`` tuples, one for each class in its
+        polymorphic hierarchy. ``types`` maps attribute names to spyne
+        types."""
+
+        if cls is None:
+            return None, [(None, {}, None)]
+
+        mapper = inspect(cls)
+        choices = []
+        for m in mapper.self_and_descendants:
+            if m.polymorphic_identity is None and len(choices) > 0:
+                continue
+
+            types = {}
+            for k, v in m.class_.get_flat_type_info(m.class_).items():
+                types[k] = v
+
+            # columns of sibling classes in single table hierarchies
+            names = set([c.name for c in m.columns])
+
+            choices.append((m, types, names))
+
+        return mapper, choices
+
+    def gen_rows(self, table, num_rows, start_id=None):
+        """Yields ``num_rows`` random rows for the given table. Integer primary
+        keys are assigned sequentially starting from ``start_id``."""
+
+        cls = self.classes.get(table, None)
+        mapper, choices = self._get_types(cls)
+
+        pk_cols = list(table.primary_key.columns)
+        int_pk = None
+        if start_id is not None:
+            int_pk = pk_cols[0]
+
+        unique = set([c.name for c in table.columns if c.unique])
+        for index in table.indexes:
+            if index.unique and len(index.columns) == 1:
+                unique.update([c.name for c in index.columns])
+
+        seen = set()
+        attempts = 0
+        i = 0
+        while i < num_rows and attempts < num_rows * 10:
+            attempts += 1
+            m, types, names = self.random.choice(choices)
+
+            row = {}
+            for c in table.columns:
+                if int_pk is not None and c is int_pk:
+                    row[c.name] = start_id + i
+
+                elif names is not None and not (c.name in names) \
+                                                             and c.nullable:
+                    row[c.name] = None
+
+                elif c.name in unique:
+                    row[c.name] = self._gen_unique(c, i)
+
+                else:
+                    row[c.name] = self.gen_value(c, types.get(c.key, None))
+
+            if m is not None and m.polymorphic_on is not None:
+                row[m.polymorphic_on.name] = m.polymorphic_identity
+
+            # association tables etc. with composite primary keys. we give up
+            # when the key space looks exhausted.
+            if int_pk is None:
+                key = tuple([row[c.name] for c in pk_cols])
+                if None in key or key in seen:
+                    continue
+                seen.add(key)
+
+            i += 1
+            yield row
+
+    def _gen_unique(self, column, i):
+        if isinstance(column.type, Integer):
+            return i
+
+        return (u'%s-%d' % (column.name, i))[-(column.type.length or 64):]
+
+    def fill_table(self, table):
+        engine = self.store.engine
+        num_rows = self.get_count(table)
+
+        pk_cols = list(table.primary_key.columns)
+        start_id = None
+        with engine.connect() as conn:
+            empty = conn.scalar(select([func.count()]).select_from(table)) == 0
+
+            # primary keys that are also foreign keys (e.g. in joined table
+            # inheritance) are picked from the referenced table instead.
+            if len(pk_cols) == 1 and isinstance(pk_cols[0].type, Integer) \
+                                      and len(pk_cols[0].foreign_keys) == 0:
+                start_id = (conn.scalar(select([func.max(pk_cols[0])])) or 0) + 1
+
+        logger.info("Generating %d rows for %s...", num_rows, table.name)
+
+        if start_id is not None:
+            rows = self.gen_rows(table, num_rows, start_id)
+            num = bulk_load(engine, table, rows, batch_size=self.batch_size,
+                                                           defer_indexes=empty)
+            if num > 0:
+                self.pks[table.name] = (start_id, start_id + num - 1)
+                self._fix_sequence(table, pk_cols[0])
+
+        else:
+            pks = []
+
+            def _track(rows):
+                for row in rows:
+                    if len(pks) < MAX_FK_SAMPLE:
+                        pks.append(row[pk_cols[0].name])
+                    yield row
+
+            rows = _track(self.gen_rows(table, num_rows))
+            num = bulk_load(engine, table, rows, batch_size=self.batch_size,
+                                                           defer_indexes=empty)
+
+            if len(pk_cols) == 1 and len(pks) > 0:
+                self.pks[table.name] = pks
+
+        return num
+
+    def _fix_sequence(self, table, column):
+        engine = self.store.engine
+        if engine.dialect.name != 'postgresql':
+            return
+
+        with engine.begin() as conn:
+            conn.execute(select([func.setval(
+                func.pg_get_serial_sequence(table.name, column.name),
+                select([func.max(column)]).as_scalar()
+            )]))
+
+    def run(self):
+        """Fills all tables in dependency order.
+
+        :return: A dict of table names to number of generated rows.
+        """
+
+        retval = {}
+        for table in self.metadata.sorted_tables:
+            retval[table.name] = self.fill_table(table)
+
+        return retval
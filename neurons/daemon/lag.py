@@ -0,0 +1,225 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+"""Measures how late the reactor runs scheduled calls and captures what the
+reactor thread is doing when it stalls."""
+
+import logging
+logger = logging.getLogger(__name__)
+
+import sys
+import threading
+import traceback
+
+from time import time, sleep
+
+import neurons
+
+
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, None)
+"""Upper bounds of lag histogram buckets, in milliseconds. ``None`` is
+infinity."""
+
+MAX_STACKS = 64
+"""Maximum number of distinct blocking stacks to remember."""
+
+
+class ReactorLagMonitor(object):
+    """Has two parts:
+
+      * A LoopingCall that runs every ``interval`` seconds in the reactor and
+        records how late it was called into a histogram.
+      * A watchdog thread that notices when the LoopingCall hasn't run for
+        ``threshold`` seconds and captures the stack of the reactor thread.
+
+    :param interval: Seconds between ticks.
+    :param threshold: Seconds without a tick after which the reactor is
+        considered blocked.
+    """
+
+    def __init__(self, interval=0.1, threshold=0.5):
+        self.interval = interval
+        self.threshold = threshold
+
+        self.histogram = [0] * len(BUCKETS_MS)
+        self.max_lag_ms = 0
+        self.num_stalls = 0
+        self.stacks = {}
+
+        self._lock = threading.Lock()
+        self._task = None
+        self._thread = None
+        self._running = False
+        self._last_tick = None
+        self._expected = None
+        self._captured = False
+
+    def start(self):
+        """Must be called in the reactor thread."""
+
+        from twisted.internet import reactor
+
+        assert neurons.is_reactor_thread(), "Not in the reactor thread"
+
+        self._running = True
+        self.start_ticks(reactor)
+
+        self._thread = threading.Thread(target=self._watch,
+                                                      name='reactor-watchdog')
+        self._thread.daemon = True
+        self._thread.start()
+
+        reactor.addSystemEventTrigger('before', 'shutdown', self.stop)
+
+        logger.info("Reactor lag monitor started. Interval: %.3fs, "
+                           "threshold: %.3fs", self.interval, self.threshold)
+
+    def start_ticks(self, clock):
+        from twisted.internet.task import LoopingCall
+
+        self._task = LoopingCall(self._tick)
+        self._task.clock = clock
+        self._task.start(self.interval, now=False)
+
+        self._last_tick = time()
+        self._expected = self._task.starttime + self.interval
+
+    def stop(self):
+        self._running = False
+
+        if self._task is not None and self._task.running:
+            self._task.stop()
+        self._task = None
+
+    def _tick(self):
+        clock = self._task.clock
+        now = clock.seconds()
+        lag_ms = max(now - self._expected, 0) * 1000
+
+        idx = len(BUCKETS_MS) - 1
+        for i, limit in enumerate(BUCKETS_MS):
+            if limit is not None and lag_ms <= limit:
+                idx = i
+                break
+
+        with self._lock:
+            self.histogram[idx] += 1
+            if lag_ms > self.max_lag_ms:
+                self.max_lag_ms = lag_ms
+
+            self._last_tick = time()
+            self._captured = False
+
+        # LoopingCall schedules the next call at the first interval boundary
+        # after this one returns, counting from when it was started.
+        start = self._task.starttime
+        done = clock.seconds()
+        self._expected = start + self.interval * \
+                                      (int((done - start) / self.interval) + 1)
+
+    def _watch(self):
+        while self._running:
+            sleep(self.threshold / 2.0)
+
+            with self._lock:
+                stalled = time() - self._last_tick
+                if stalled < self.threshold or self._captured:
+                    continue
+                self._captured = True
+
+            self._capture(stalled)
+
+    def _capture(self, stalled):
+        thread = neurons.REACTOR_THREAD
+        if thread is None:
+            return
+
+        frame = sys._current_frames().get(thread.ident, None)
+        if frame is None:
+            return
+
+        stack = traceback.extract_stack(frame)[-16:]
+        del frame
+
+        # FrameSummary instances are not hashable.
+        key = tuple((f[0], f[1], f[2]) for f in stack)
+
+        with self._lock:
+            self.num_stalls += 1
+
+            num = self.stacks.get(key, None)
+            if num is not None:
+                self.stacks[key] = num + 1
+            elif len(self.stacks) < MAX_STACKS:
+                self.stacks[key] = 1
+
+        logger.warning("Reactor blocked for more than %dms in:\n%s",
+                     stalled * 1000, ''.join(traceback.format_list(stack)))
+
+    def get_stats(self, top=10):
+        """Returns the lag histogram as a list of ``(upper bound in ms,
+        count)`` tuples along with the stacks that blocked the reactor the
+        most."""
+
+        with self._lock:
+            histogram = list(zip(BUCKETS_MS, self.histogram))
+            stacks = sorted(self.stacks.items(), key=lambda x: -x[1])[:top]
+
+            return dict(
+                histogram=histogram,
+                max_lag_ms=self.max_lag_ms,
+                num_stalls=self.num_stalls,
+                stacks=[(''.join(traceback.format_list(
+                                            [f + (None,) for f in s])), n)
+                                                           for s, n in stacks],
+            )
+
+
+monitor = None
+"""The running :class:`ReactorLagMonitor` instance, if any."""
+
+
+def start_lag_monitor(threshold_ms, interval_ms=None):
+    global monitor
+
+    threshold = threshold_ms / 1000.0
+    if interval_ms is None:
+        interval = min(threshold / 5.0, 0.1)
+    else:
+        interval = interval_ms / 1000.0
+
+    monitor = ReactorLagMonitor(interval=interval, threshold=threshold)
+    monitor.start()
+
+    return monitor
@@ -0,0 +1,154 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+"""Caches ldap search results and, optionally, verified bind credentials."""
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import hmac
+import hashlib
+
+from time import time
+
+from neurons.base.cache import LruCache
+
+_MISSING = object()
+
+
+def _to_bytes(s):
+    if not isinstance(s, bytes):
+        return s.encode('utf8')
+    return s
+
+
+class LdapCache(object):
+    """A TTL cache for ldap search results keyed on
+    ``(base_dn, filter, scope, attrs)``.
+
+    Empty results are cached for ``negative_ttl`` seconds, which should be
+    shorter than ``ttl`` so that new entries show up soon enough.
+
+    When ``bind_ttl`` is nonzero, successful binds are remembered for that
+    many seconds as salted hmacs of the password, keyed with a random,
+    per-process secret. Plain passwords are never stored.
+    """
+
+    def __init__(self, size=10000, ttl=300, negative_ttl=30, bind_ttl=0,
+                                                              bind_size=10000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.bind_ttl = bind_ttl
+
+        self.searches = LruCache(size)
+        self.binds = LruCache(bind_size) if bind_ttl else None
+
+        self._secret = os.urandom(32)
+
+    @staticmethod
+    def get_key(base_dn, filterstr, scope, attrlist):
+        if attrlist is not None:
+            attrlist = tuple(sorted(attrlist))
+        return base_dn.lower(), filterstr, scope, attrlist
+
+    def get(self, key):
+        """Returns the cached result for the given key, or ``None`` on a
+        miss. Cached empty results are returned as empty lists. Results are
+        shared, callers must not modify them."""
+
+        retval = self.searches.get(key, _MISSING)
+        if retval is _MISSING:
+            return None
+        return retval
+
+    def put(self, key, result):
+        ttl = self.ttl if len(result) > 0 else self.negative_ttl
+        if ttl:
+            self.searches.put(key, result, expires_at=time() + ttl)
+
+    def invalidate(self, dn=None):
+        """Drops the cached searches whose base is the given dn or one of its
+        ancestors, i.e. the ones that could have returned it. Drops everything
+        when ``dn`` is ``None``."""
+
+        if dn is None:
+            self.searches.clear()
+            if self.binds is not None:
+                self.binds.clear()
+            return
+
+        dn = dn.lower()
+        for key in self.searches.keys():
+            base_dn = key[0]
+            if dn == base_dn or dn.endswith(',' + base_dn):
+                self.searches.pop(key)
+
+        self.invalidate_bind(dn)
+
+    def _digest(self, salt, password):
+        return hmac.new(self._secret, salt + _to_bytes(password),
+                                                      hashlib.sha256).digest()
+
+    def check_bind(self, dn, password):
+        """Returns True when the given credentials were verified in the last
+        ``bind_ttl`` seconds."""
+
+        if self.binds is None:
+            return False
+
+        entry = self.binds.get(dn.lower())
+        if entry is None:
+            return False
+
+        salt, digest = entry
+        return hmac.compare_digest(digest, self._digest(salt, password))
+
+    def remember_bind(self, dn, password):
+        if self.binds is None:
+            return
+
+        salt = os.urandom(16)
+        self.binds.put(dn.lower(), (salt, self._digest(salt, password)),
+                                              expires_at=time() + self.bind_ttl)
+
+    def invalidate_bind(self, dn):
+        if self.binds is not None:
+            self.binds.pop(dn.lower())
+
+    def get_stats(self):
+        retval = dict(searches=self.searches.get_stats())
+        if self.binds is not None:
+            retval['binds'] = self.binds.get_stats()
+        return retval
@@ -0,0 +1,350 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+"""A pool of bound LDAP connections whose blocking operations run in a
+dedicated thread pool."""
+
+import logging
+logger = logging.getLogger(__name__)
+
+import threading
+
+from time import time
+
+from spyne.util.six.moves.queue import Queue, Empty
+
+
+class LdapPoolTimeout(Exception):
+    """Raised when no LDAP connection could be checked out in time."""
+
+
+class LdapPool(object):
+    """Keeps up to ``size`` connections bound as ``bind_dn``. Operations are
+    run in a thread pool of the same size, and their Deferreds fire in the
+    reactor thread.
+
+    Broken connections are replaced. Operations that are safe to repeat, like
+    searches and binds, are then retried once. Every ``health_check_interval``
+    seconds, up to ``health_check_batch`` of the idle connections that were
+    idle the longest are checked.
+
+    :param network_timeout: Seconds to wait while connecting.
+    :param timeout: Seconds to wait for the result of an operation.
+    :param checkout_timeout: Seconds to wait for a free connection.
+    """
+
+    def __init__(self, uri, bind_dn, password, size=5, network_timeout=10.0,
+                    timeout=30.0, checkout_timeout=10.0,
+                               health_check_interval=60, health_check_batch=2):
+        assert size > 0
+
+        self.uri = uri
+        self.bind_dn = bind_dn
+        self.password = password
+        self.size = size
+        self.network_timeout = network_timeout
+        self.timeout = timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.health_check_batch = health_check_batch
+
+        self.threadpool = None
+
+        self.num_conns = 0
+        self.in_use = 0
+        self.num_ops = 0
+        self.num_failures = 0
+        self.num_reconnects = 0
+        self.num_timeouts = 0
+        self.queued = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        self._idle = Queue()
+        self._lock = threading.Lock()
+        self._health_check = None
+
+    def start(self):
+        from twisted.internet import reactor
+        from twisted.internet.task import LoopingCall
+        from twisted.python.threadpool import ThreadPool
+
+        if self.threadpool is not None:
+            return
+
+        self.threadpool = ThreadPool(minthreads=0, maxthreads=self.size,
+                                                                   name='ldap')
+        self.threadpool.start()
+        reactor.addSystemEventTrigger('during', 'shutdown', self.close)
+
+        if self.health_check_interval:
+            self._health_check = LoopingCall(self.check_health)
+            self._health_check.start(self.health_check_interval, now=False)
+
+        logger.debug("%r started for %s", self, self.uri)
+
+    def close(self):
+        if self._health_check is not None and self._health_check.running:
+            self._health_check.stop()
+        self._health_check = None
+
+        if self.threadpool is not None:
+            self.threadpool.stop()
+            self.threadpool = None
+
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+            self._discard(conn)
+
+    def connect(self):
+        """Returns a new connection bound as ``bind_dn``. Blocks."""
+
+        import ldap
+
+        conn = ldap.initialize(self.uri)
+        conn.set_option(ldap.OPT_NETWORK_TIMEOUT, self.network_timeout)
+        conn.set_option(ldap.OPT_TIMEOUT, self.timeout)
+        conn.protocol_version = ldap.VERSION3
+        conn.simple_bind_s(self.bind_dn, self.password)
+
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            self.num_conns -= 1
+
+        try:
+            conn.unbind_s()
+        except Exception as e:
+            logger.debug("Error while unbinding: %r", e)
+
+    def acquire(self):
+        """Checks out a connection, creating one if the pool isn't full.
+        Blocks.
+
+        :raise LdapPoolTimeout: When no connection is available in
+            ``checkout_timeout`` seconds.
+        """
+
+        try:
+            conn = self._idle.get_nowait()
+        except Empty:
+            conn = None
+
+        if conn is None:
+            with self._lock:
+                create = self.num_conns < self.size
+                if create:
+                    self.num_conns += 1
+
+            if create:
+                try:
+                    conn = self.connect()
+                except Exception:
+                    with self._lock:
+                        self.num_conns -= 1
+                    raise
+
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.checkout_timeout)
+                except Empty:
+                    with self._lock:
+                        self.num_timeouts += 1
+                    raise LdapPoolTimeout("No free ldap connection in %s "
+                                          "seconds" % self.checkout_timeout)
+
+        with self._lock:
+            self.in_use += 1
+
+        return conn
+
+    def release(self, conn, broken=False):
+        with self._lock:
+            self.in_use -= 1
+
+        if broken:
+            self._discard(conn)
+        else:
+            self._idle.put(conn)
+
+    def _run(self, queued_at, retry, f, args, kwargs):
+        import ldap
+
+        wait = time() - queued_at
+        with self._lock:
+            self.queued -= 1
+            self.num_ops += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+        for attempt in ((0, 1) if retry else (1,)):
+            conn = self.acquire()
+            try:
+                retval = f(conn, *args, **kwargs)
+
+            except (ldap.SERVER_DOWN, ldap.CONNECT_ERROR, ldap.TIMEOUT) as e:
+                self.release(conn, broken=True)
+                with self._lock:
+                    self.num_failures += 1
+
+                if attempt > 0:
+                    raise
+
+                logger.warning("Ldap connection to %s failed, reconnecting: "
+                                                         "%r", self.uri, e)
+                with self._lock:
+                    self.num_reconnects += 1
+                continue
+
+            except Exception:
+                self.release(conn)
+                raise
+
+            self.release(conn)
+            return retval
+
+    def run(self, f, *args, **kwargs):
+        """Runs ``f(conn, *args, **kwargs)`` with a pooled connection in the
+        pool's threads.
+
+        Pass ``retry=True`` to run ``f`` again with a new connection when the
+        server goes away. Only do this when ``f`` is safe to repeat: a write
+        may have been applied before the connection broke.
+
+        :return: A Deferred that fires with the return value of ``f``.
+        """
+
+        retry = kwargs.pop('retry', False)
+
+        from twisted.internet import reactor
+        from twisted.internet.threads import deferToThreadPool
+
+        if self.threadpool is None:
+            self.start()
+
+        with self._lock:
+            self.queued += 1
+
+        return deferToThreadPool(reactor, self.threadpool, self._run, time(),
+                                                       retry, f, args, kwargs)
+
+    def search(self, base_dn, scope, filterstr, attrlist=None):
+        return self.run(lambda conn: conn.search_s(base_dn, scope, filterstr,
+                                                       attrlist), retry=True)
+
+    def authenticate(self, dn, password):
+        """Checks the given credentials with a pooled connection, which is
+        bound back to ``bind_dn`` afterwards. Empty passwords are rejected
+        without asking the server, as binding with one is an anonymous bind
+        that most servers accept.
+
+        :return: A Deferred that fires with True or False.
+        """
+
+        if not dn or not password:
+            from twisted.internet.defer import succeed
+            return succeed(False)
+
+        def _auth(conn):
+            import ldap
+
+            try:
+                conn.simple_bind_s(dn, password)
+                return True
+
+            except ldap.INVALID_CREDENTIALS:
+                return False
+
+            finally:
+                try:
+                    conn.simple_bind_s(self.bind_dn, self.password)
+
+                except Exception as e:
+                    # never return a connection bound as someone else to
+                    # the pool. this makes _run() discard it.
+                    logger.warning("Could not rebind after authentication: "
+                                                                     "%r", e)
+                    raise ldap.SERVER_DOWN(dict(desc="rebind failed"))
+
+        return self.run(_auth, retry=True)
+
+    def _check_idle(self):
+        # the queue is fifo so the connections that were idle the longest are
+        # checked, and put back at the end. the rest stay available meanwhile.
+        num = 0
+        for _ in range(self.health_check_batch):
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+
+            num += 1
+            try:
+                conn.whoami_s()
+            except Exception as e:
+                logger.info("Dropping unhealthy ldap connection: %r", e)
+                self._discard(conn)
+            else:
+                self._idle.put(conn)
+
+        return num
+
+    def check_health(self):
+        """Pings up to ``health_check_batch`` idle connections in the pool's
+        threads and drops the ones that don't respond."""
+
+        from twisted.internet import reactor
+        from twisted.internet.threads import deferToThreadPool
+
+        if self.threadpool is None:
+            return
+
+        d = deferToThreadPool(reactor, self.threadpool, self._check_idle)
+        d.addErrback(lambda f: logger.error("Ldap health check failed: %s",
+                                                          f.getErrorMessage()))
+        return d
+
+    def get_stats(self):
+        with self._lock:
+            return dict(size=self.size, conns=self.num_conns,
+                in_use=self.in_use, idle=self._idle.qsize(),
+                queued=self.queued, ops=self.num_ops,
+                failures=self.num_failures, reconnects=self.num_reconnects,
+                timeouts=self.num_timeouts, max_wait=self.max_wait,
+                avg_wait=(self.total_wait / self.num_ops)
+                                                   if self.num_ops else 0.0)
@@ -180,6 +180,45 @@ def _do_drop_all_tables(config, init):
     return True
 
 
+def _do_migrate(config, init, migrator):
+    if migrator is None:
+        logger.error("This daemon has no migrations.")
+        return -1
+
+    config.apply()
+
+    # Run init so that all relevant models get imported
+    init(config)
+
+    try:
+        if migrator(config).run():
+            return True
+
+    except Exception as e:
+        logger.exception(e)
+        return -1
+
+    logger.error("Migration was stopped before it was complete.")
+    return -1
+
+
+def _do_gen_data(config, init):
+    config.apply()
+
+    # Run init so that all relevant models get imported
+    init(config)
+
+    from neurons.daemon.gendata import DataGenerator
+
+    gen = DataGenerator(config.get_main_store(), scale=config.gen_data_scale,
+                                                  fanout=config.gen_data_fanout)
+
+    for k, v in gen.run().items():
+        print(k, v)
+
+    return True
+
+
 def _do_start_shell(config):
     # Import db handle, session and other useful stuff to the shell's scope
     db = None
@@ -208,7 +247,7 @@ def _do_start_shell(config):
         return IPython.embed_kernel()
 
 
-def _inner_main(config, init, bootstrap, bootstrapper):
+def _inner_main(config, init, bootstrap, bootstrapper, migrator=None):
     # if requested, print version and exit
     if config.version:
         return _print_version(config)
@@ -221,6 +260,14 @@ def _inner_main(config, init, bootstrap, bootstrapper):
     if config.drop_all_tables:
         return _do_drop_all_tables(config, init)
 
+    # if requested, run data migrations and exit
+    if isinstance(config, ServiceDaemon) and config.migrate:
+        return _do_migrate(config, init, migrator)
+
+    # if requested, generate random data and exit
+    if isinstance(config, ServiceDaemon) and config.gen_data:
+        return _do_gen_data(config, init)
+
     config.apply()
     logger.info("Initialized '%s' version %s.", config.name,
                                                get_package_version(config.name))
@@ -241,21 +288,50 @@ def _inner_main(config, init, bootstrap, bootstrapper):
 
     # apply app-specific config
     handles = config._handles = {}
-    for k, v in items:
-        disabled = False
-        if k in config.services:
-            disabled = config.services[k].disabled
 
-        if disabled:
-            logger.info("Service '%s' is disabled in the config.", k)
-            continue
+    def _start_services(_=None):
+        for k, v in items:
+            disabled = False
+            if k in config.services:
+                disabled = config.services[k].disabled
 
-        try:
-            logger.info("Initializing service %s...", k)
+            if disabled:
+                logger.info("Service '%s' is disabled in the config.", k)
+                continue
 
-            handles[k] = v(config)
-        except ServiceDisabled:
-            logger.info("Service '%s' is disabled.", k)
+            try:
+                logger.info("Initializing service %s...", k)
+
+                handles[k] = v(config)
+            except ServiceDisabled:
+                logger.info("Service '%s' is disabled.", k)
+
+        if migrator is not None and config.migrate_in_background:
+            from neurons.daemon.migrate import start_background_migration
+            start_background_migration(migrator(config))
+
+    # Don't start listening before async pools are ready, unless we're going
+    # to exit right after initializing services.
+    ready = None
+    exits_early = config.write_config or config.shell or config.ikernel
+    if isinstance(config, ServiceDaemon):
+        exits_early = exits_early or config.write_wsdl or config.write_xsd
+        if not exits_early:
+            ready = config.get_storage_ready()
+
+    if ready is None:
+        _start_services()
+
+    else:
+        from twisted.internet import reactor
+
+        def _on_storage_error(f):
+            logger.error("Async pools could not be started: %s",
+                                                          f.getErrorMessage())
+            reactor.callWhenRunning(reactor.stop)
+
+        logger.info("Waiting for async pools before initializing services...")
+        ready.addCallbacks(_start_services, _on_storage_error)
 
     # if requested, write interface documents and exit
     if isinstance(config, ServiceDaemon):
@@ -276,6 +352,29 @@ def _inner_main(config, init, bootstrap, bootstrapper):
             return True
 
 
+def _run_concurrently(funcs):
+    """Runs the given callables in separate threads, waits for all of them and
+    re-raises the first error, if any."""
+
+    errors = []
+
+    def _run(f):
+        try:
+            f()
+        except Exception as e:
+            logger.exception(e)
+            errors.append(e)
+
+    threads = [threading.Thread(target=_run, args=(f,)) for f in funcs]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    if len(errors) > 0:
+        raise errors[0]
+
+
 class BootStrapper(object):
     def __init__(self, init):
         self.init = init
@@ -286,14 +385,41 @@ class BootStrapper(object):
     def after_tables(self, config):
         pass
 
-    def __call__(self, config):
-        for store in config.stores.values():
-            if database_exists(store.conn_str):
-                print(store.conn_str, "already exists.")
-                continue
+    def init_store(self, config, name, store):
+        """Called for every store after tables are created. Stores are
+        initialized concurrently so this must not depend on other stores'
+        state."""
+
+    def bulk_load(self, config, cls, rows, store_name=None, **kwargs):
+        """Loads seed data using :func:`neurons.daemon.bulk.bulk_load`. Meant
+        to be called from :meth:`after_tables` or :meth:`init_store`."""
+
+        from neurons.daemon.bulk import bulk_load
+
+        if store_name is None:
+            store = config.get_main_store()
+        else:
+            store = config.stores[store_name].itself
+
+        return bulk_load(store.engine, cls, rows, **kwargs)
+
+    def create_database(self, store):
+        conn_str = getattr(store, 'conn_str', None)
+        if conn_str is None:
+            return
 
-            create_database(store.conn_str)
-            print(store.conn_str, "did not exist, created.")
+        if database_exists(conn_str):
+            print(conn_str, "already exists.")
+            return
+
+        create_database(conn_str)
+        print(conn_str, "did not exist, created.")
+
+    def __call__(self, config):
+        _run_concurrently([
+            (lambda s=store: self.create_database(s))
+                                              for store in config.stores.values()
+        ])
 
         config.log_results = True
         config.apply()
@@ -308,6 +434,12 @@ class BootStrapper(object):
 
         TableModel.Attributes.sqla_metadata.create_all(checkfirst=True)
 
+        _run_concurrently([
+            (lambda k=k, v=v: self.init_store(config, k,
+                                                    getattr(v, 'itself', None)))
+                                                for k, v in config.stores.items()
+        ])
+
         self.after_tables(config)
 
 
@@ -316,8 +448,14 @@ def _set_reactor_thread():
     neurons.REACTOR_THREAD = threading.current_thread()
 
 
+def _start_lag_monitor(config):
+    if config.lag_monitor_ms:
+        from neurons.daemon.lag import start_lag_monitor
+        start_lag_monitor(config.lag_monitor_ms)
+
+
 def main(daemon_name, argv, init, bootstrap=None,
-                                  bootstrapper=BootStrapper, cls=ServiceDaemon):
+                  bootstrapper=BootStrapper, cls=ServiceDaemon, migrator=None):
     """A typical main function for daemons.
 
     :param daemon_name: Daemon name.
@@ -328,6 +466,9 @@ def main(daemon_name, argv, init, bootstrap=None,
     :param bootstrapper: A factory for a callable that bootstraps daemon's
         environment. This is supposed to be run once for every new deployment.
     :param cls: Daemon class
+    :param migrator: A callable that takes the config and returns a
+        :class:`neurons.daemon.migrate.Migrator` instance. Used by the
+        ``--migrate`` and ``--migrate-in-background`` options.
     :return: Exit code of the daemon as int.
     """
 
@@ -348,7 +489,7 @@ def main(daemon_name, argv, init, bootstrap=None,
         stores = list(config._stores)
 
     try:
-        retval = _inner_main(config, init, bootstrap, bootstrapper)
+        retval = _inner_main(config, init, bootstrap, bootstrapper, migrator)
 
         # if _inner_main did something other than initializing daemons
         if retval is not None:
@@ -395,6 +536,7 @@ def main(daemon_name, argv, init, bootstrap=None,
     logger.info("Starting reactor... Max. RSS: %f",
                     resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1000.0)
 
-    deferLater(reactor, 0, _set_reactor_thread)
+    deferLater(reactor, 0, _set_reactor_thread) \
+                               .addCallback(lambda _: _start_lag_monitor(config))
 
     return reactor.run()
@@ -0,0 +1,393 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+"""Online data migrations. Data is moved in small, keyset-iterated batches,
+each in its own transaction along with its progress, so that migrations
+can be interrupted and resumed and never hold locks for long."""
+
+import logging
+logger = logging.getLogger(__name__)
+
+import threading
+
+from time import sleep, time
+from datetime import datetime
+
+from sqlalchemy import tuple_, select, and_
+from sqlalchemy.exc import OperationalError
+
+from spyne import Integer32, Integer64, Unicode, Boolean, DateTime, AnyDict
+from spyne.util import memoize
+
+from neurons import TableModel
+
+
+@memoize
+def TMigrationProgress(prefix):
+    class MigrationProgress(TableModel):
+        __tablename__ = '%s_migration' % prefix
+
+        version = Integer32(primary_key=True)
+        step = Unicode(64, primary_key=True)
+        last_key = AnyDict(store_as='json')
+        num_rows = Integer64(default=0)
+        done = Boolean(default=False)
+        updated = DateTime(timezone=False)
+
+    return MigrationProgress
+
+
+class MigrationStep(object):
+    """A step that visits all rows of a table in primary key order, in
+    batches. Subclasses implement :meth:`migrate_batch`, or pass a callable
+    as ``migrate``.
+
+    Primary key values must be json-serializable as they are stored in the
+    progress table.
+
+    :param name: Step name, unique within its migration.
+    :param cls: The TableModel subclass whose table is iterated.
+    :param migrate: A callable with the same signature as
+        :meth:`migrate_batch`.
+    :param where: An optional filter for the rows to visit.
+    :param batch_size: Number of rows per batch.
+    :param sleep: Seconds to sleep between batches.
+    """
+
+    def __init__(self, name, cls, migrate=None, where=None, batch_size=1000,
+                                                                    sleep=0.0):
+        self.name = name
+        self.cls = cls
+        self.where = where
+        self.batch_size = batch_size
+        self.sleep = sleep
+
+        if migrate is not None:
+            self.migrate_batch = migrate
+
+    def migrate_batch(self, conn, keys):
+        """Migrates the rows with the given primary keys.
+
+        :param conn: The connection of the batch transaction.
+        :param keys: A list of primary key tuples.
+        """
+
+        raise NotImplementedError()
+
+    def get_key_columns(self):
+        return list(self.cls.__table__.primary_key.columns)
+
+    def next_keys(self, conn, last_key):
+        """Returns the primary keys of the next batch after ``last_key``."""
+
+        cols = self.get_key_columns()
+
+        conds = []
+        if self.where is not None:
+            conds.append(self.where)
+
+        if last_key is not None:
+            if len(cols) == 1:
+                conds.append(cols[0] > last_key[0])
+            else:
+                conds.append(tuple_(*cols) > tuple_(*last_key))
+
+        q = select(cols).order_by(*cols).limit(self.batch_size)
+        if len(conds) > 0:
+            q = q.where(and_(*conds))
+
+        return [tuple(row) for row in conn.execute(q)]
+
+
+class Migration(object):
+    """Brings the data to ``version`` from the previous one.
+
+    :param version: The version after this migration.
+    :param steps: A sequence of :class:`MigrationStep` instances, run in
+        order.
+    """
+
+    def __init__(self, version, steps):
+        self.version = version
+        self.steps = list(steps)
+
+        names = [s.name for s in self.steps]
+        assert len(set(names)) == len(names), "Step names must be unique."
+
+
+class Migrator(object):
+    """Runs the migrations newer than the version in the given version table.
+
+    Before every batch, the migrator waits while the replicas are behind by
+    more than ``max_lag`` seconds or more than ``max_lock_waits`` sessions
+    are waiting on locks. Both are only checked on PostgreSQL. Batches that
+    can't get their locks in ``lock_timeout_ms`` or fail otherwise with an
+    ``OperationalError`` are retried up to ``max_retries`` times in a row,
+    waiting twice as long each time, starting from ``throttle_sleep``
+    seconds.
+
+    :param store: A :class:`neurons.daemon.store.SqlDataStore` instance.
+    :param Version: A class returned by :func:`neurons.model.TVersion`.
+    :param migrations: A sequence of :class:`Migration` instances.
+    :param prefix: Prefix of the progress table. Defaults to the one of the
+        version table.
+    """
+
+    def __init__(self, store, Version, migrations, prefix=None, max_lag=5.0,
+                   max_lock_waits=5, lock_timeout_ms=2000, throttle_sleep=1.0,
+                                                                max_retries=8):
+        self.store = store
+        self.Version = Version
+        self.migrations = sorted(migrations, key=lambda m: m.version)
+
+        if prefix is None:
+            prefix = Version.__tablename__[:-len('_version')]
+        self.Progress = TMigrationProgress(prefix)
+
+        self.max_lag = max_lag
+        self.max_lock_waits = max_lock_waits
+        self.lock_timeout_ms = lock_timeout_ms
+        self.throttle_sleep = throttle_sleep
+        self.max_retries = max_retries
+
+        self.num_batches = 0
+        self.num_rows = 0
+        self.num_throttled = 0
+        self.num_retries = 0
+        self.current = None
+
+        self._stop = threading.Event()
+
+    @property
+    def is_postgres(self):
+        return self.store.engine.dialect.name == 'postgresql'
+
+    def stop(self):
+        """Makes :meth:`run` return after the current batch."""
+
+        self._stop.set()
+
+    def get_version(self):
+        table = self.Version.__table__
+
+        with self.store.engine.begin() as conn:
+            row = conn.execute(select([table.c.version])
+                                        .order_by(table.c.id).limit(1)).first()
+            if row is None:
+                # spyne defaults are not column defaults
+                default = self.Version.get_flat_type_info(self.Version) \
+                                                   ['version'].Attributes.default
+                conn.execute(table.insert(), dict(id=1, version=default))
+                row = conn.execute(select([table.c.version])
+                                        .order_by(table.c.id).limit(1)).first()
+
+        return row[0]
+
+    def get_pending(self):
+        version = self.get_version()
+        return [m for m in self.migrations if m.version > version]
+
+    def _get_progress(self, conn, version, step):
+        table = self.Progress.__table__
+        return conn.execute(table.select().where(and_(
+                    table.c.version == version, table.c.step == step))).first()
+
+    def _save_progress(self, conn, version, step, last_key, num_rows, done):
+        table = self.Progress.__table__
+        values = dict(last_key=dict(key=last_key), num_rows=num_rows,
+                                            done=done, updated=datetime.now())
+
+        result = conn.execute(table.update().where(and_(
+            table.c.version == version, table.c.step == step)).values(**values))
+
+        if result.rowcount == 0:
+            conn.execute(table.insert(), dict(version=version, step=step,
+                                                                     **values))
+
+    def _wait_for_replicas(self):
+        if not self.is_postgres:
+            return
+
+        while not self._stop.is_set():
+            with self.store.engine.connect() as conn:
+                lag = conn.scalar(
+                    "SELECT COALESCE(MAX(EXTRACT(EPOCH FROM replay_lag)), 0) "
+                    "FROM pg_stat_replication")
+                lock_waits = conn.scalar(
+                    "SELECT COUNT(*) FROM pg_stat_activity "
+                    "WHERE wait_event_type = 'Lock'")
+
+            if lag <= self.max_lag and lock_waits <= self.max_lock_waits:
+                return
+
+            logger.debug("Throttling migration: replication lag: %.1fs, "
+                                     "lock waits: %d", lag, lock_waits)
+            self.num_throttled += 1
+            sleep(self.throttle_sleep)
+
+    def _run_batch(self, migration, step, last_key, num_rows):
+        with self.store.engine.begin() as conn:
+            if self.is_postgres and self.lock_timeout_ms:
+                conn.execute("SET LOCAL lock_timeout = %d" %
+                                                       int(self.lock_timeout_ms))
+
+            keys = step.next_keys(conn, last_key)
+            if len(keys) > 0:
+                step.migrate_batch(conn, keys)
+                last_key = list(keys[-1])
+                num_rows += len(keys)
+
+            done = len(keys) < step.batch_size
+            self._save_progress(conn, migration.version, step.name, last_key,
+                                                                 num_rows, done)
+
+        self.num_batches += 1
+        self.num_rows += len(keys)
+
+        return last_key, num_rows, done
+
+    def run_step(self, migration, step):
+        """Runs the given step from where it was left.
+
+        :return: ``True`` if the step is complete, ``False`` if it was
+            stopped.
+        """
+
+        with self.store.engine.connect() as conn:
+            progress = self._get_progress(conn, migration.version, step.name)
+
+        last_key = None
+        num_rows = 0
+        if progress is not None:
+            if progress.done:
+                return True
+
+            last_key = (progress.last_key or {}).get('key', None)
+            num_rows = progress.num_rows or 0
+
+            logger.info("Resuming step '%s' of migration %d after %d rows.",
+                                        step.name, migration.version, num_rows)
+
+        done = False
+        failures = 0
+        while not done:
+            if self._stop.is_set():
+                return False
+
+            self._wait_for_replicas()
+
+            try:
+                last_key, num_rows, done = self._run_batch(migration, step,
+                                                            last_key, num_rows)
+
+            except OperationalError as e:
+                # most likely a lock timeout. the batch was rolled back along
+                # with its progress, so it's safe to retry.
+                failures += 1
+                if failures > self.max_retries:
+                    logger.error("Batch of step '%s' failed %d times, "
+                                               "giving up.", step.name, failures)
+                    raise
+
+                delay = self.throttle_sleep * 2 ** (failures - 1)
+                logger.warning("Batch of step '%s' failed, retrying in %.1fs: "
+                                                     "%s", step.name, delay, e)
+                self.num_retries += 1
+                self._stop.wait(delay)
+                continue
+
+            failures = 0
+
+            if step.sleep > 0 and not done:
+                sleep(step.sleep)
+
+        logger.info("Step '%s' of migration %d done, %d rows.", step.name,
+                                                  migration.version, num_rows)
+        return True
+
+    def run(self):
+        """Runs all pending migrations. Blocks.
+
+        :return: ``True`` if all pending migrations were completed, ``False``
+            if stopped before that.
+        """
+
+        self.Version.__table__.create(self.store.engine, checkfirst=True)
+        self.Progress.__table__.create(self.store.engine, checkfirst=True)
+
+        table = self.Version.__table__
+        for migration in self.get_pending():
+            self.current = migration.version
+            logger.info("Running migration %d", migration.version)
+            start = time()
+
+            for step in migration.steps:
+                if not self.run_step(migration, step):
+                    logger.info("Migration %d stopped.", migration.version)
+                    return False
+
+            with self.store.engine.begin() as conn:
+                conn.execute(table.update().values(version=migration.version))
+
+            logger.info("Migration %d done in %.1fs.", migration.version,
+                                                                time() - start)
+
+        self.current = None
+        return True
+
+    def get_stats(self):
+        return dict(current=self.current, num_batches=self.num_batches,
+                       num_rows=self.num_rows, num_throttled=self.num_throttled,
+                                                   num_retries=self.num_retries)
+
+
+def start_background_migration(migrator):
+    """Runs the given migrator in a thread of the reactor's thread pool. It's
+    stopped when the reactor shuts down.
+
+    :return: A Deferred that fires with the return value of
+        :meth:`Migrator.run`.
+    """
+
+    from twisted.internet import reactor
+    from twisted.internet.threads import deferToThread
+
+    reactor.addSystemEventTrigger('before', 'shutdown', migrator.stop)
+
+    def _on_error(f):
+        logger.error("Background migration failed: %s", f.getErrorMessage())
+
+    d = deferToThread(migrator.run)
+    d.addErrback(_on_error)
+    return d
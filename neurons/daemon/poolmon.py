@@ -0,0 +1,273 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+"""Keeps track of who checks out connections from sqlalchemy pools and for
+how long, to find the culprits of pool exhaustion."""
+
+import logging
+logger = logging.getLogger(__name__)
+
+import threading
+import traceback
+
+from time import time
+
+
+def _get_request():
+    from neurons.base.context import get_current_context
+
+    ctx = get_current_context()
+    if ctx is None:
+        return None
+
+    name = getattr(ctx.descriptor, 'name', None)
+    user = getattr(ctx.udc, 'user', None)
+    return "%s (user: %s)" % (name, user)
+
+
+class PoolMonitor(object):
+    """Records checkout and checkin events of the pools of the engines it's
+    installed to.
+
+    For every connection that is checked out, it remembers when, by which
+    thread and which request and, if ``capture_stacks`` is set, from where.
+    Connections held longer than ``hold_threshold`` seconds are logged with
+    that information, once when :meth:`check` notices them and again when
+    they are returned.
+
+    There is no pool event for the time spent waiting for a connection, so
+    it's measured by timing the public methods of the pool that engines and
+    sessions check out connections with.
+
+    :param hold_threshold: Seconds after which a checked out connection is
+        reported. ``None`` disables the reports.
+    :param capture_stacks: Record the stack of every checkout. Useful but
+        costly, so off by default.
+    """
+
+    def __init__(self, hold_threshold=30.0, capture_stacks=False,
+                                                               stack_depth=16):
+        self.hold_threshold = hold_threshold
+        self.capture_stacks = capture_stacks
+        self.stack_depth = stack_depth
+
+        self.checkouts = 0
+        self.checkins = 0
+        self.long_holds = 0
+
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_hold = 0.0
+        self.max_hold = 0.0
+        self.max_overflow = 0
+
+        self._outstanding = {}
+        self._engines = []
+        self._lock = threading.Lock()
+        self._task = None
+
+    def install(self, engine):
+        from sqlalchemy import event
+
+        pool = engine.pool
+
+        def _on_checkout(dbapi_connection, connection_record,
+                                                            connection_proxy):
+            self._on_checkout(pool, connection_record)
+
+        event.listen(pool, 'checkout', _on_checkout)
+        event.listen(pool, 'checkin', self._on_checkin)
+
+        # engine.connect() uses unique_connection() on older sqlalchemy
+        # versions, sessions use connect().
+        for name in ('connect', 'unique_connection'):
+            f = getattr(pool, name, None)
+            if f is not None:
+                setattr(pool, name, self._get_timed(f))
+
+        self._engines.append(engine)
+
+    def _get_timed(self, f):
+        def _timed():
+            start = time()
+            try:
+                return f()
+            finally:
+                self._on_wait(time() - start)
+
+        return _timed
+
+    def _on_wait(self, wait):
+        with self._lock:
+            self.waits += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def _on_checkout(self, pool, connection_record):
+        stack = None
+        if self.capture_stacks:
+            # the innermost frames belong to sqlalchemy, hence the extra depth
+            stack = traceback.extract_stack(limit=self.stack_depth + 8)[:-1]
+
+        entry = dict(
+            checked_out_at=time(),
+            thread=threading.current_thread().name,
+            request=_get_request(),
+            stack=stack,
+            warned=False,
+        )
+
+        overflow = 0
+        if pool is not None and hasattr(pool, 'overflow'):
+            overflow = max(0, pool.overflow())
+
+        with self._lock:
+            self.checkouts += 1
+            self.max_overflow = max(self.max_overflow, overflow)
+            self._outstanding[id(connection_record)] = entry
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            entry = self._outstanding.pop(id(connection_record), None)
+            if entry is None:
+                return
+
+            self.checkins += 1
+            hold = time() - entry['checked_out_at']
+            self.total_hold += hold
+            self.max_hold = max(self.max_hold, hold)
+
+            long_hold = self.hold_threshold is not None and \
+                                                     hold > self.hold_threshold
+            if long_hold:
+                self.long_holds += 1
+
+        if long_hold:
+            logger.warning("Connection returned after %.1fs. %s", hold,
+                                                      self._format(entry))
+
+    def _format(self, entry):
+        retval = ["Thread: %s, request: %s" % (entry['thread'],
+                                                             entry['request'])]
+        if entry['stack'] is not None:
+            retval.append("Checked out at:\n" +
+                               ''.join(traceback.format_list(entry['stack'])))
+
+        return '\n'.join(retval)
+
+    def check(self):
+        """Logs the connections that are held longer than
+        ``hold_threshold`` and that were not reported before.
+
+        :return: Number of such connections.
+        """
+
+        if self.hold_threshold is None:
+            return 0
+
+        now = time()
+        with self._lock:
+            entries = [e for e in self._outstanding.values()
+                              if not e['warned'] and
+                                now - e['checked_out_at'] > self.hold_threshold]
+            for e in entries:
+                e['warned'] = True
+
+        for e in entries:
+            logger.warning("Connection held for %.1fs and counting. %s",
+                                     now - e['checked_out_at'], self._format(e))
+
+        return len(entries)
+
+    def start(self, interval=None):
+        """Calls :meth:`check` periodically from the reactor."""
+
+        from twisted.internet.task import LoopingCall
+
+        if self._task is not None or self.hold_threshold is None:
+            return
+
+        if interval is None:
+            interval = max(1.0, self.hold_threshold / 2.0)
+
+        self._task = LoopingCall(self.check)
+        self._task.start(interval, now=False)
+
+    def stop(self):
+        if self._task is not None and self._task.running:
+            self._task.stop()
+        self._task = None
+
+    def get_outstanding(self):
+        """Returns information about the checked out connections, oldest
+        first."""
+
+        now = time()
+        with self._lock:
+            entries = sorted(self._outstanding.values(),
+                                          key=lambda e: e['checked_out_at'])
+
+        return [dict(age=now - e['checked_out_at'], thread=e['thread'],
+                     request=e['request'],
+                     stack=None if e['stack'] is None else
+                                    ''.join(traceback.format_list(e['stack'])))
+                                                              for e in entries]
+
+    def get_stats(self):
+        retval = dict(
+            checkouts=self.checkouts,
+            checkins=self.checkins,
+            outstanding=len(self._outstanding),
+            long_holds=self.long_holds,
+            max_wait=self.max_wait,
+            avg_wait=(self.total_wait / self.waits) if self.waits else 0.0,
+            max_hold=self.max_hold,
+            avg_hold=(self.total_hold / self.checkins) if self.checkins else 0.0,
+            max_overflow=self.max_overflow,
+        )
+
+        pools = []
+        for engine in self._engines:
+            pool = engine.pool
+            pools.append(dict(
+                url=repr(engine.url),
+                status=pool.status(),
+                checked_out=pool.checkedout()
+                                        if hasattr(pool, 'checkedout') else None,
+                overflow=pool.overflow() if hasattr(pool, 'overflow') else None,
+            ))
+        retval['pools'] = pools
+
+        return retval
@@ -0,0 +1,240 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+"""Server-side prepared statements for PostgreSQL connections, so that small,
+repeated queries are parsed and planned once per connection."""
+
+import logging
+logger = logging.getLogger(__name__)
+
+import re
+import threading
+
+from collections import OrderedDict
+
+from neurons.base.cache import LruCache
+
+_PARAM_RE = re.compile(r"%\(([^)]+)\)s|%%")
+
+_PREPARABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+_DDL = ('CREATE', 'ALTER', 'DROP', 'TRUNCATE', 'COMMENT')
+
+
+def to_prepared(statement):
+    """Converts a statement with pyformat placeholders to one with positional
+    ones that can be used with ``PREPARE``.
+
+    :return: A ``(statement, names)`` tuple where ``names`` are the parameter
+        names in positional order.
+    """
+
+    names = []
+    index = {}
+
+    def _sub(match):
+        name = match.group(1)
+        if name is None:
+            return '%'
+
+        i = index.get(name, None)
+        if i is None:
+            names.append(name)
+            i = index[name] = len(names)
+
+        return '$%d' % i
+
+    return _PARAM_RE.sub(_sub, statement), names
+
+
+class _ConnectionCache(object):
+    def __init__(self, generation):
+        self.generation = generation
+        self.statements = OrderedDict()
+        self.counter = 0
+
+
+class PreparedStatementCache(object):
+    """Keeps up to ``size`` prepared statements per connection, keyed on the
+    compiled sql. Least recently used ones are deallocated.
+
+    All prepared statements are deallocated when a DDL statement is run
+    through an engine this cache is installed to, or when
+    :meth:`invalidate` is called.
+
+    Statements run with executemany() or with positional parameters are not
+    prepared. Statements that PostgreSQL can't prepare, e.g. because the type
+    of a parameter can't be inferred, are remembered and run as usual.
+
+    :param size: Maximum number of prepared statements per connection.
+    :param unpreparable_size: Maximum number of statements that couldn't be
+        prepared to remember.
+    """
+
+    def __init__(self, size=100, unpreparable_size=1000):
+        assert size > 0
+
+        self.size = size
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.failures = 0
+        self.invalidations = 0
+
+        self._unpreparable = LruCache(unpreparable_size)
+        self._lock = threading.Lock()
+
+    def install(self, engine):
+        from sqlalchemy import event
+
+        assert engine.dialect.name == 'postgresql', \
+                            "Prepared statement cache only works on PostgreSQL"
+
+        event.listen(engine, 'before_cursor_execute', self._before_execute,
+                                                                   retval=True)
+
+    def uninstall(self, engine):
+        from sqlalchemy import event
+
+        event.remove(engine, 'before_cursor_execute', self._before_execute)
+
+    def invalidate(self):
+        """Makes all connections deallocate their prepared statements before
+        running their next statement."""
+
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+
+    def _get_cache(self, conn, cursor):
+        cache = conn.info.get('neurons_prepared', None)
+        if cache is None:
+            cache = conn.info['neurons_prepared'] = \
+                                              _ConnectionCache(self.generation)
+
+        elif cache.generation != self.generation:
+            if len(cache.statements) > 0:
+                cursor.execute("DEALLOCATE ALL")
+            cache.statements.clear()
+            cache.generation = self.generation
+
+        return cache
+
+    def _prepare(self, cache, cursor, statement):
+        sql, names = to_prepared(statement)
+
+        cache.counter += 1
+        name = 'neurons_ps_%d' % cache.counter
+
+        # a failed PREPARE would abort the transaction so it's wrapped in a
+        # savepoint, unless there is no transaction.
+        in_tx = not getattr(cursor.connection, 'autocommit', False)
+        if in_tx:
+            cursor.execute("SAVEPOINT neurons_prepare")
+
+        try:
+            cursor.execute("PREPARE %s AS %s" % (name, sql))
+
+        except Exception as e:
+            if in_tx:
+                cursor.execute("ROLLBACK TO SAVEPOINT neurons_prepare")
+            logger.debug("Could not prepare %r: %r", statement, e)
+
+            with self._lock:
+                self.failures += 1
+            self._unpreparable.put(statement, True)
+            return None
+
+        if in_tx:
+            cursor.execute("RELEASE SAVEPOINT neurons_prepare")
+
+        if len(cache.statements) >= self.size:
+            _, (old_name, _) = cache.statements.popitem(last=False)
+            cursor.execute("DEALLOCATE %s" % old_name)
+            with self._lock:
+                self.evictions += 1
+
+        cache.statements[statement] = (name, names)
+        return name, names
+
+    def _before_execute(self, conn, cursor, statement, parameters, context,
+                                                                  executemany):
+        head = statement.lstrip()[:8].upper()
+        if head.startswith(_DDL):
+            self.invalidate()
+            return statement, parameters
+
+        if executemany or not head.startswith(_PREPARABLE):
+            return statement, parameters
+
+        if not (parameters is None or isinstance(parameters, dict)):
+            return statement, parameters
+
+        if self._unpreparable.get(statement, False):
+            return statement, parameters
+
+        cache = self._get_cache(conn, cursor)
+
+        entry = cache.statements.get(statement, None)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            entry = self._prepare(cache, cursor, statement)
+            if entry is None:
+                return statement, parameters
+
+        else:
+            with self._lock:
+                self.hits += 1
+
+            # move to the most recently used end
+            del cache.statements[statement]
+            cache.statements[statement] = entry
+
+        name, names = entry
+        if len(names) == 0:
+            return "EXECUTE %s" % name, parameters
+
+        args = ', '.join(['%%(%s)s' % n for n in names])
+        return "EXECUTE %s (%s)" % (name, args), parameters
+
+    def get_stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return dict(size=self.size, hits=self.hits, misses=self.misses,
+                hit_rate=(float(self.hits) / total) if total > 0 else None,
+                evictions=self.evictions, failures=self.failures,
+                invalidations=self.invalidations,
+                unpreparable=len(self._unpreparable))
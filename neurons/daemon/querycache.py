@@ -0,0 +1,277 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+"""Caches results of read queries until a commit touches one of the tables
+they read from."""
+
+import logging
+logger = logging.getLogger(__name__)
+
+import threading
+
+from time import time
+
+from neurons.base.cache import LruCache
+
+_MISSING = object()
+
+
+def _freeze(params):
+    retval = []
+    for k, v in sorted(params.items()):
+        try:
+            hash(v)
+        except TypeError:
+            v = repr(v)
+        retval.append((k, v))
+
+    return tuple(retval)
+
+
+class _InFlight(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = _MISSING
+        self.error = None
+
+
+class QueryCache(object):
+    """Caches the rows returned by select statements, keyed on their
+    compiled sql and parameters.
+
+    Each entry remembers the tables its statement reads from. Inserts,
+    updates and deletes run through the engine are tracked per connection
+    and entries that read from the affected tables are dropped after the
+    connection commits, when it's returned to the pool or starts its next
+    transaction. Changes made by other processes or with textual sql
+    are not seen, so entries also expire after ``ttl`` seconds.
+
+    Concurrent misses for the same key run the query once; the others wait
+    for its result.
+
+    Queries run with a connection that has uncommitted writes bypass the
+    cache, as they may see rows that are never committed.
+
+    :param size: Maximum number of cached results.
+    :param ttl: Seconds after which entries expire. ``None`` means never.
+    :param max_rows: Results with more rows than this are not cached.
+    """
+
+    def __init__(self, size=1000, ttl=300, max_rows=1000):
+        self.ttl = ttl
+        self.max_rows = max_rows
+
+        self.cache = LruCache(size)
+
+        self.waits = 0
+        self.invalidations = 0
+        self.uncacheable = 0
+        self.bypassed = 0
+
+        self._versions = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._engine = None
+
+    def install(self, engine):
+        from sqlalchemy import event
+
+        self._engine = engine
+
+        event.listen(engine, 'after_execute', self._after_execute)
+        event.listen(engine, 'commit', self._on_commit)
+        event.listen(engine, 'rollback', self._on_rollback)
+        event.listen(engine, 'begin', self._on_begin)
+        event.listen(engine, 'checkin', self._on_checkin)
+
+    def uninstall(self, engine):
+        from sqlalchemy import event
+
+        event.remove(engine, 'after_execute', self._after_execute)
+        event.remove(engine, 'commit', self._on_commit)
+        event.remove(engine, 'rollback', self._on_rollback)
+        event.remove(engine, 'begin', self._on_begin)
+        event.remove(engine, 'checkin', self._on_checkin)
+
+        self._engine = None
+
+    def _after_execute(self, conn, clauseelement, multiparams, params, result):
+        from sqlalchemy.sql.dml import UpdateBase
+
+        if isinstance(clauseelement, UpdateBase):
+            table = getattr(clauseelement, 'table', None)
+            name = getattr(table, 'name', None)
+            if name is not None:
+                conn.info.setdefault('neurons_written', set()).add(name)
+
+    def _on_commit(self, conn):
+        # this runs before the actual commit. invalidating now would let a
+        # reader cache the old rows under the new versions, so the tables
+        # are invalidated once the connection is used or returned again.
+        tables = conn.info.pop('neurons_written', None)
+        if tables:
+            conn.info.setdefault('neurons_committed', set()).update(tables)
+
+    def _on_rollback(self, conn):
+        conn.info.pop('neurons_written', None)
+
+    def _on_begin(self, conn):
+        self._flush_committed(conn.info)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        if connection_record is not None:
+            self._flush_committed(connection_record.info)
+
+    def _flush_committed(self, info):
+        tables = info.pop('neurons_committed', None)
+        if tables:
+            self.invalidate(tables)
+
+    def invalidate(self, tables=None):
+        """Drops entries that read from any of the given table names, or all
+        entries when ``tables`` is ``None``."""
+
+        with self._lock:
+            self.invalidations += 1
+
+            if tables is None:
+                self._versions.clear()
+                self.cache.clear()
+                return
+
+            for t in tables:
+                self._versions[t] = self._versions.get(t, 0) + 1
+
+        if tables is None:
+            return
+
+        tables = set(tables)
+        for key in self.cache.keys():
+            if not tables.isdisjoint(key[2]):
+                self.cache.pop(key)
+
+    def _get_versions(self, tables):
+        with self._lock:
+            return tuple([self._versions.get(t, 0) for t in tables])
+
+    def get_key(self, stmt, params=None):
+        from sqlalchemy.sql.util import find_tables
+
+        compiled = stmt.compile(dialect=self._engine.dialect)
+
+        all_params = dict(compiled.params)
+        if params:
+            all_params.update(params)
+
+        tables = frozenset([t.name for t in find_tables(stmt)])
+
+        return str(compiled), _freeze(all_params), tables
+
+    def execute(self, stmt, params=None, conn=None):
+        """Returns the rows of the given select statement as a list, from the
+        cache if possible.
+
+        :param conn: Connection to run the query with on a miss. A new one
+            is checked out from the engine when ``None``.
+        """
+
+        if conn is not None:
+            self._flush_committed(conn.info)
+
+        if conn is not None and conn.info.get('neurons_written'):
+            # its own writes must neither be cached nor hidden by the cache.
+            with self._lock:
+                self.bypassed += 1
+            return conn.execute(stmt, params or {}).fetchall()
+
+        key = self.get_key(stmt, params)
+
+        retval = self.cache.get(key, _MISSING)
+        if retval is not _MISSING:
+            return retval
+
+        with self._lock:
+            in_flight = self._in_flight.get(key, None)
+            owner = in_flight is None
+            if owner:
+                in_flight = self._in_flight[key] = _InFlight()
+            else:
+                self.waits += 1
+
+        if not owner:
+            in_flight.event.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            return in_flight.result
+
+        try:
+            tables = sorted(key[2])
+            versions = self._get_versions(tables)
+
+            if conn is None:
+                with self._engine.connect() as conn:
+                    rows = conn.execute(stmt, params or {}).fetchall()
+            else:
+                rows = conn.execute(stmt, params or {}).fetchall()
+
+            in_flight.result = rows
+
+            # don't cache results that may have been read before a commit
+            # that touched their tables.
+            if len(rows) > self.max_rows or \
+                                     versions != self._get_versions(tables):
+                self.uncacheable += 1
+
+            else:
+                expires_at = None
+                if self.ttl is not None:
+                    expires_at = time() + self.ttl
+                self.cache.put(key, rows, expires_at=expires_at)
+
+            return rows
+
+        except Exception as e:
+            in_flight.error = e
+            raise
+
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            in_flight.event.set()
+
+    def get_stats(self):
+        retval = self.cache.get_stats()
+        retval.update(waits=self.waits, invalidations=self.invalidations,
+                          uncacheable=self.uncacheable, bypassed=self.bypassed)
+        return retval
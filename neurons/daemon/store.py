@@ -35,14 +35,42 @@
 import logging
 logger = logging.getLogger(__name__)
 
+import threading
+
+from time import time
+
+from neurons.daemon import blocking
+
 
 class DataStoreBase(object):
     def __init__(self, type):
         self.type = type
 
 
+class _GuardedLdapConnection(object):
+    """Passes synchronous ldap calls through the blocking call guard."""
+
+    def __init__(self, conn):
+        self.__dict__['_conn'] = conn
+
+    def __getattr__(self, key):
+        retval = getattr(self._conn, key)
+
+        if key.endswith('_s') and callable(retval):
+            def _guarded(*args, **kwargs):
+                blocking.check('ldap', key)
+                return retval(*args, **kwargs)
+            return _guarded
+
+        return retval
+
+    def __setattr__(self, key, value):
+        setattr(self._conn, key, value)
+
+
 class LdapDataStore(DataStoreBase):
-    def __init__(self, host, base_dn, bind_dn, password, port=389):
+    def __init__(self, host, base_dn, bind_dn, password, port=389,
+                                                          network_timeout=10.0):
         DataStoreBase.__init__(self, type='ldap')
 
         self.host = host
@@ -50,16 +78,79 @@ class LdapDataStore(DataStoreBase):
         self.base_dn = base_dn
         self.bind_dn = bind_dn
         self.password = password
+        self.network_timeout = network_timeout
         self.conn = None
 
+        self.cache = None
+        """Search and bind result cache. Added when `add_cache` is called."""
+
+    def add_cache(self, size=10000, ttl=300, negative_ttl=30, bind_ttl=0):
+        """Caches search results and, if ``bind_ttl`` is nonzero, verified
+        credentials. See :class:`neurons.daemon.ldapcache.LdapCache`."""
+
+        from neurons.daemon.ldapcache import LdapCache
+
+        self.cache = LdapCache(size=size, ttl=ttl, negative_ttl=negative_ttl,
+                                                              bind_ttl=bind_ttl)
+        return self.cache
+
+    def invalidate(self, dn=None):
+        """Drops cached results that could contain the given dn. Should be
+        called after modifying an entry. Drops everything when ``dn`` is
+        ``None``."""
+
+        if self.cache is not None:
+            self.cache.invalidate(dn)
+
+    def get_cache_stats(self):
+        if self.cache is None:
+            return None
+        return self.cache.get_stats()
+
+    def _get_search_args(self, base_dn, scope):
+        import ldap
+
+        if base_dn is None:
+            base_dn = self.base_dn
+        if scope is None:
+            scope = ldap.SCOPE_SUBTREE
+
+        return base_dn, scope
+
+    def search_s(self, filterstr, attrlist=None, base_dn=None, scope=None):
+        """Runs a cached, synchronous search on the connection returned by
+        :meth:`simple_bind`. ``base_dn`` defaults to the store's and
+        ``scope`` to ``SCOPE_SUBTREE``."""
+
+        base_dn, scope = self._get_search_args(base_dn, scope)
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.get_key(base_dn, filterstr, scope, attrlist)
+            retval = self.cache.get(key)
+            if retval is not None:
+                return retval
+
+        if self.conn is None:
+            self.simple_bind()
+
+        retval = self.conn.search_s(base_dn, scope, filterstr, attrlist)
+
+        if key is not None:
+            self.cache.put(key, retval)
+
+        return retval
+
     def simple_bind(self):
         import ldap
 
         if self.conn is not None:
             self.close()
 
-        self.conn = ldap.open(self.host, port=self.port)
-        self.conn.set_option(ldap.OPT_NETWORK_TIMEOUT, 10.0)
+        blocking.check('ldap', 'simple_bind')
+
+        self.conn = _GuardedLdapConnection(ldap.open(self.host, port=self.port))
+        self.conn.set_option(ldap.OPT_NETWORK_TIMEOUT, self.network_timeout)
         self.conn.protocol_version = ldap.VERSION3
         self.conn.simple_bind_s(self.bind_dn, self.password)
 
@@ -74,6 +165,185 @@ class LdapDataStore(DataStoreBase):
         return retval
 
 
+class PooledLdapDataStore(LdapDataStore):
+    """An ldap store whose operations run on a pool of connections in a
+    dedicated thread pool and return Deferreds. See
+    :class:`neurons.daemon.ldappool.LdapPool` for the pool parameters.
+
+    :meth:`simple_bind` still returns a separate, synchronous connection.
+    """
+
+    def __init__(self, host, base_dn, bind_dn, password, port=389,
+                 network_timeout=10.0, pool_size=5, timeout=30.0,
+                                checkout_timeout=10.0, health_check_interval=60):
+        super(PooledLdapDataStore, self).__init__(host, base_dn, bind_dn,
+                                password, port=port,
+                                network_timeout=network_timeout)
+
+        from neurons.daemon.ldappool import LdapPool
+
+        self.pool = LdapPool('ldap://%s:%d' % (host, port), bind_dn, password,
+                size=pool_size, network_timeout=network_timeout,
+                timeout=timeout, checkout_timeout=checkout_timeout,
+                health_check_interval=health_check_interval)
+
+    def start(self):
+        self.pool.start()
+
+    def run(self, f, *args, **kwargs):
+        """Runs ``f(conn, *args, **kwargs)`` with a pooled connection.
+
+        :return: A Deferred that fires with the return value of ``f``.
+        """
+
+        return self.pool.run(f, *args, **kwargs)
+
+    def search(self, filterstr, attrlist=None, base_dn=None, scope=None):
+        """Returns a Deferred that fires with the result of ``search_s``,
+        from the cache if possible. ``base_dn`` defaults to the store's and
+        ``scope`` to ``SCOPE_SUBTREE``."""
+
+        from twisted.internet.defer import succeed
+
+        base_dn, scope = self._get_search_args(base_dn, scope)
+
+        if self.cache is None:
+            return self.pool.search(base_dn, scope, filterstr, attrlist)
+
+        key = self.cache.get_key(base_dn, filterstr, scope, attrlist)
+        retval = self.cache.get(key)
+        if retval is not None:
+            return succeed(retval)
+
+        def _put(result):
+            self.cache.put(key, result)
+            return result
+
+        return self.pool.search(base_dn, scope, filterstr, attrlist) \
+                                                            .addCallback(_put)
+
+    def authenticate(self, dn, password):
+        """Returns a Deferred that fires with True if the given credentials
+        are valid. Successful binds are cached when the cache has a
+        ``bind_ttl``."""
+
+        from twisted.internet.defer import succeed
+
+        # binding with an empty password is an anonymous bind that succeeds
+        if not dn or not password:
+            return succeed(False)
+
+        if self.cache is None:
+            return self.pool.authenticate(dn, password)
+
+        if self.cache.check_bind(dn, password):
+            return succeed(True)
+
+        def _remember(valid):
+            if valid:
+                self.cache.remember_bind(dn, password)
+            else:
+                self.cache.invalidate_bind(dn)
+            return valid
+
+        return self.pool.authenticate(dn, password).addCallback(_remember)
+
+    def close(self):
+        self.pool.close()
+        if self.conn is not None:
+            return super(PooledLdapDataStore, self).close()
+
+    def get_pool_stats(self):
+        return self.pool.get_stats()
+
+
+def _on_read_only_begin(session, transaction, connection):
+    dialect = connection.dialect.name
+
+    if dialect == 'postgresql':
+        connection.execute("SET TRANSACTION READ ONLY")
+
+    elif dialect == 'sqlite':
+        from sqlalchemy.pool import StaticPool, SingletonThreadPool
+
+        # these pools share the connection with writers
+        if not isinstance(connection.engine.pool,
+                                            (StaticPool, SingletonThreadPool)):
+            connection.execute("PRAGMA query_only = ON")
+            connection.info['neurons_query_only'] = True
+
+
+def _on_read_only_flush(session, flush_context, instances):
+    if session.new or session.dirty or session.deleted:
+        from neurons.base.error import ReadOnlyContextError
+        raise ReadOnlyContextError()
+
+
+SQLITE_PRAGMAS = (
+    ('busy_timeout', 5000),
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -65536),
+    ('mmap_size', 268435456),
+)
+"""Default pragmas for file-backed SQLite databases, applied in this order.
+busy_timeout comes first as switching to WAL needs a lock."""
+
+
+def is_sqlite_memory(connection_string):
+    return connection_string in ('sqlite://', 'sqlite:///') \
+                            or connection_string.endswith(':memory:') \
+                            or 'mode=memory' in connection_string
+
+
+def _get_sqlite_pragma_setter(pragmas):
+    def _on_sqlite_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for k, v in pragmas:
+            if v is not None:
+                cursor.execute("PRAGMA %s = %s" % (k, v))
+        cursor.close()
+
+    return _on_sqlite_connect
+
+
+def _on_sqlite_checkin(dbapi_connection, connection_record):
+    if connection_record is None:
+        return
+
+    if connection_record.info.pop('neurons_query_only', False):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only = OFF")
+        cursor.close()
+
+    # set by ReadContext to enforce request deadlines
+    if connection_record.info.pop('neurons_progress_handler', False):
+        dbapi_connection.set_progress_handler(None, 0)
+
+
+_ReadOnlySession = None
+
+def get_read_only_session_class():
+    """Returns a Session subclass that runs its transactions as read-only
+    ones and refuses to flush changes."""
+
+    global _ReadOnlySession
+
+    if _ReadOnlySession is None:
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session
+
+        class ReadOnlySession(Session):
+            pass
+
+        event.listen(ReadOnlySession, 'after_begin', _on_read_only_begin)
+        event.listen(ReadOnlySession, 'before_flush', _on_read_only_flush)
+
+        _ReadOnlySession = ReadOnlySession
+
+    return _ReadOnlySession
+
+
 # FIXME: get rid of the overly complicated property setters.
 class SqlDataStore(DataStoreBase):
     def __init__(self, connection_string=None, engine=None, metadata=None, **kwargs):
@@ -88,14 +358,23 @@ class SqlDataStore(DataStoreBase):
         if metadata is not None:
             assert isinstance(metadata, MetaData)
 
+        self.sqlite_pragmas = kwargs.pop('sqlite_pragmas', SQLITE_PRAGMAS)
+        """Pragmas to set on new connections of file-backed SQLite
+        databases, as a sequence of ``(name, value)`` pairs. Pairs with
+        ``None`` values are skipped."""
+
         self.__kwargs = kwargs
         self.__metadata = None
         self.__engine = None
+        self.__async_dialect = None
         self.Session = None
+        self.ReadOnlySession = None
 
         self.metadata = metadata or MetaData()
         self.engine = engine
         self.Session = sessionmaker()
+        self.ReadOnlySession = sessionmaker(
+                           class_=get_read_only_session_class(), autoflush=False)
         self.connection_string = connection_string
 
         self.txpool = None
@@ -104,31 +383,412 @@ class SqlDataStore(DataStoreBase):
         self.txpool_start_deferred = None
         """Deferred from TxPostgres pool start()."""
 
-    def add_txpool(self):
-        from txpostgres.txpostgres import Connection, ConnectionPool
-        from txpostgres.reconnection import DeadConnectionDetector
+        self.replicas = []
+        """Engines for read-only replicas. Added when `add_replica` is
+        called."""
+
+        self.replica_policy = 'round_robin'
+        """How to pick a replica. One of 'round_robin' or
+        'least_checked_out'."""
+
+        self.read_your_writes_sec = 5
+        """Users who wrote to this store in the last this many seconds read
+        from the primary."""
 
-        class LoggingDeadConnectionDetector(DeadConnectionDetector):
-            def startReconnecting(self, f):
-                logger.warning('TxPool database connection down: %r)', f.value)
-                return DeadConnectionDetector.startReconnecting(self, f)
+        self.executor = None
+        """Twisted ThreadPool that runs blocking work for this store. Added
+        when `add_executor` is called."""
 
-            def reconnect(self):
-                logger.warning('TxPool reconnecting...')
-                return DeadConnectionDetector.reconnect(self)
+        self.executor_timeout = None
+        """Seconds a call can wait in the executor queue before it fails with
+        DatabaseBusyError. None means forever."""
 
-            def connectionRecovered(self):
-                logger.warning('TxPool connection recovered')
-                return DeadConnectionDetector.connectionRecovered(self)
+        self.executor_waiting = 0
+        self.executor_timeouts = 0
+        self.__executor_lock = threading.Lock()
 
-        dsn = self.engine.raw_connection().connection.dsn
+        self.statement_cache = None
+        """Per-connection prepared statement cache. Added when
+        `add_statement_cache` is called."""
+
+        self.query_cache = None
+        """Select result cache. Added when `add_query_cache` is called."""
+
+        self.pool_monitor = None
+        """Connection pool instrumentation. Added when `add_pool_monitor` is
+        called."""
+
+        self.__replica_idx = 0
+        self.__last_writes = {}
+        self.__replica_lock = threading.Lock()
+
+    def add_replica(self, connection_string):
+        from sqlalchemy.engine import create_engine
 
-        self.txpool = ConnectionPool("heleleley", dsn, min=1)
+        engine = create_engine(connection_string, **self.__kwargs)
+        blocking.install_sqlalchemy(engine)
+        if engine.dialect.name == 'sqlite':
+            from sqlalchemy import event
+            event.listen(engine, 'checkin', _on_sqlite_checkin)
+
+            if self.sqlite_pragmas and \
+                                    not is_sqlite_memory(connection_string):
+                event.listen(engine, 'connect',
+                                  _get_sqlite_pragma_setter(self.sqlite_pragmas))
+
+        if self.pool_monitor is not None:
+            self.pool_monitor.install(engine)
+
+        self.replicas.append(engine)
+        logger.info("%r added as replica with: %r", engine, self.kwargs)
+
+        return engine
+
+    def get_replica(self):
+        """Returns one of the replica engines according to
+        `replica_policy`, or None if there aren't any."""
+
+        if len(self.replicas) == 0:
+            return None
+
+        if self.replica_policy == 'least_checked_out':
+            return min(self.replicas, key=lambda e: e.pool.checkedout())
+
+        with self.__replica_lock:
+            self.__replica_idx = (self.__replica_idx + 1) % len(self.replicas)
+            return self.replicas[self.__replica_idx]
+
+    def note_write(self, user):
+        """Makes given user read from the primary for the next
+        `read_your_writes_sec` seconds."""
+
+        now = time()
+
+        with self.__replica_lock:
+            last_writes = self.__last_writes
+            if len(last_writes) > 10000:
+                limit = now - self.read_your_writes_sec
+                for k, v in list(last_writes.items()):
+                    if v < limit:
+                        del last_writes[k]
+
+            last_writes[user] = now
+
+    def wrote_recently(self, user):
+        last_write = self.__last_writes.get(user, None)
+        if last_write is None:
+            return False
+
+        return time() - last_write < self.read_your_writes_sec
+
+    def get_read_bind(self, user):
+        """Returns the engine to read from on behalf of the given user."""
+
+        if len(self.replicas) == 0 or self.wrote_recently(user):
+            return self.__engine
+
+        return self.get_replica()
+
+    def add_statement_cache(self, size=100):
+        """Makes connections of the primary engine prepare the statements
+        they run and reuse them, up to ``size`` statements per connection.
+        Only works on PostgreSQL. See
+        :class:`neurons.daemon.prepared.PreparedStatementCache`."""
+
+        from neurons.daemon.prepared import PreparedStatementCache
+
+        if self.statement_cache is not None:
+            self.statement_cache.uninstall(self.engine)
+
+        self.statement_cache = PreparedStatementCache(size)
+        self.statement_cache.install(self.engine)
+
+        logger.debug("%r: Prepared statement cache enabled with size %d",
+                                                                    self, size)
+
+        return self.statement_cache
+
+    def get_statement_cache_stats(self):
+        if self.statement_cache is None:
+            return None
+        return self.statement_cache.get_stats()
+
+    def add_query_cache(self, size=1000, ttl=300, max_rows=1000):
+        """Enables :meth:`select_cached`. See
+        :class:`neurons.daemon.querycache.QueryCache`."""
+
+        from neurons.daemon.querycache import QueryCache
+
+        if self.query_cache is not None:
+            self.query_cache.uninstall(self.engine)
+
+        self.query_cache = QueryCache(size=size, ttl=ttl, max_rows=max_rows)
+        self.query_cache.install(self.engine)
+
+        return self.query_cache
+
+    def select_cached(self, stmt, params=None, conn=None):
+        """Returns the rows of the given select statement as a list, from the
+        query cache when there is one. Blocks. The rows are shared with other
+        callers and must not be modified.
+
+        :param conn: Connection to run the query with. The cache is bypassed
+            when it has uncommitted writes.
+        """
+
+        if self.query_cache is None:
+            if conn is None:
+                with self.engine.connect() as conn:
+                    return conn.execute(stmt, params or {}).fetchall()
+            return conn.execute(stmt, params or {}).fetchall()
+
+        return self.query_cache.execute(stmt, params, conn)
+
+    def get_query_cache_stats(self):
+        if self.query_cache is None:
+            return None
+        return self.query_cache.get_stats()
+
+    def add_pool_monitor(self, hold_threshold=30.0, capture_stacks=False):
+        """Starts tracking connection checkouts from the pools of this store
+        and its replicas. Connections held longer than ``hold_threshold``
+        seconds are logged along with where and by which request they were
+        checked out. See :class:`neurons.daemon.poolmon.PoolMonitor`."""
+
+        from neurons.daemon.poolmon import PoolMonitor
+
+        if self.pool_monitor is not None:
+            return self.pool_monitor
+
+        self.pool_monitor = PoolMonitor(hold_threshold=hold_threshold,
+                                                  capture_stacks=capture_stacks)
+        self.pool_monitor.install(self.engine)
+        for engine in self.replicas:
+            self.pool_monitor.install(engine)
+
+        return self.pool_monitor
+
+    def get_pool_stats(self):
+        if self.pool_monitor is None:
+            return None
+
+        retval = self.pool_monitor.get_stats()
+        retval['outstanding_connections'] = \
+                                          self.pool_monitor.get_outstanding()
+        return retval
+
+    def add_txpool(self, min=1, max=10, idle_timeout=300):
+        """Starts a :class:`neurons.daemon.txpool.TxPool` for this store.
+
+        :return: The Deferred that fires when ``min`` connections are ready.
+            It's also stored in ``txpool_start_deferred``.
+        """
+
+        from contextlib import closing
+        from neurons.daemon.txpool import TxPool
+
+        with closing(self.engine.raw_connection()) as conn:
+            dsn = conn.connection.dsn
+
+        self.txpool = TxPool(dsn, min=min, max=max, idle_timeout=idle_timeout)
         self.txpool_start_deferred = self.txpool.start()
         self.txpool_start_deferred.addCallback(
                                  lambda p: logger.info("TxPool %r started.", p))
         return self.txpool_start_deferred
 
+    def add_executor(self, size, timeout=None):
+        """Adds a thread pool to run blocking database work for this store.
+
+        :param size: Number of threads. Should match the number of connections
+            the sync pool can hand out, so that calls wait in the executor
+            queue instead of in threads blocked on pool checkouts.
+        :param timeout: Seconds a call can wait in the queue before failing
+            with :class:`neurons.base.error.DatabaseBusyError`.
+        """
+
+        from twisted.python.threadpool import ThreadPool
+
+        self.executor = ThreadPool(minthreads=0, maxthreads=size,
+                                          name='db-%x' % id(self))
+        self.executor_timeout = timeout
+
+        return self.executor
+
+    def run_in_executor(self, f, *args, **kwargs):
+        """Runs ``f(*args, **kwargs)`` in the store's executor. If the call
+        can't start within ``executor_timeout`` seconds, the Deferred fails
+        with :class:`neurons.base.error.DatabaseBusyError` and the call is
+        dropped.
+
+        :return: A Deferred that fires with the return value of ``f``.
+        """
+
+        return self.defer_to_executor(self.executor_timeout, f,
+                                                               *args, **kwargs)
+
+    def defer_to_executor(self, timeout, f, *args, **kwargs):
+        """Same as :meth:`run_in_executor` but with the given queue timeout.
+        ``None`` waits forever."""
+
+        from twisted.internet import reactor
+        from twisted.internet.defer import Deferred
+        from twisted.internet.threads import deferToThreadPool
+        from twisted.python.failure import Failure
+        from neurons.base.error import DatabaseBusyError
+
+        executor = self.executor
+        assert executor is not None, "No executor. Call add_executor() first."
+
+        if not executor.started:
+            executor.start()
+            reactor.addSystemEventTrigger('during', 'shutdown', executor.stop)
+
+        queued_at = time()
+        state = dict(started=False, timed_out=False)
+
+        with self.__executor_lock:
+            self.executor_waiting += 1
+
+        def _run():
+            with self.__executor_lock:
+                if state['timed_out']:
+                    return
+
+                # the reactor may be too busy to notice the timeout in time
+                if timeout and time() - queued_at > timeout:
+                    state['timed_out'] = True
+                    self.executor_timeouts += 1
+                else:
+                    state['started'] = True
+
+                self.executor_waiting -= 1
+
+            if state['timed_out']:
+                raise DatabaseBusyError()
+
+            return f(*args, **kwargs)
+
+        retval = Deferred()
+
+        def _on_timeout():
+            with self.__executor_lock:
+                if state['started'] or state['timed_out']:
+                    return
+
+                state['timed_out'] = True
+                self.executor_timeouts += 1
+                self.executor_waiting -= 1
+
+            retval.errback(DatabaseBusyError())
+
+        call = None
+        if timeout:
+            call = reactor.callLater(timeout, _on_timeout)
+
+        def _on_done(result):
+            if call is not None and call.active():
+                call.cancel()
+
+            if not retval.called:
+                if isinstance(result, Failure):
+                    retval.errback(result)
+                else:
+                    retval.callback(result)
+
+        deferToThreadPool(reactor, executor, _run).addBoth(_on_done)
+
+        return retval
+
+    def get_executor_stats(self):
+        if self.executor is None:
+            return None
+
+        return dict(
+            size=self.executor.max,
+            waiting=self.executor_waiting,
+            timeouts=self.executor_timeouts,
+        )
+
+    def get_txpool_stats(self):
+        if self.txpool is None:
+            return None
+        return self.txpool.get_stats()
+
+    def get_async_dialect(self):
+        """Returns the SQLAlchemy dialect that statements for the txpool
+        are compiled with."""
+
+        if self.__engine is not None:
+            return self.__engine.dialect
+
+        if self.__async_dialect is None:
+            from sqlalchemy.dialects.postgresql.psycopg2 import \
+                                                              PGDialect_psycopg2
+            self.__async_dialect = PGDialect_psycopg2()
+
+        return self.__async_dialect
+
+    def select_async(self, stmt, cls=None):
+        """Runs the given SQLAlchemy Core select statement using the
+        TxPostgres connection pool without blocking the reactor.
+
+        :param stmt: A select statement, typically built from
+            ``cls.__table__``.
+        :param cls: When not None, rows are returned as instances of this
+            class. Columns that don't match any field of ``cls`` are ignored.
+        :return: A Deferred that fires with a list of ``cls`` instances, or a
+            list of tuples if ``cls`` is None.
+        """
+
+        assert self.txpool is not None, "No txpool. Call add_txpool() first."
+
+        dialect = self.get_async_dialect()
+        compiled = stmt.compile(dialect=dialect)
+
+        params = compiled.construct_params()
+        for bindparam in compiled.binds.values():
+            k = compiled.bind_names[bindparam]
+            if k not in params:
+                continue
+
+            proc = bindparam.type.dialect_impl(dialect) \
+                                                       .bind_processor(dialect)
+            if proc is not None:
+                params[k] = proc(params[k])
+
+        columns = list(stmt.c)
+        procs = [c.type.result_processor(dialect, None) for c in columns]
+        if all([p is None for p in procs]):
+            procs = None
+
+        if cls is None:
+            names = None
+        else:
+            fti = cls.get_flat_type_info(cls)
+            names = [(c.key if c.key in fti else None) for c in columns]
+
+        def _process(rows):
+            retval = []
+
+            for row in rows:
+                if procs is not None:
+                    row = tuple([(v if p is None else p(v))
+                                                 for p, v in zip(procs, row)])
+
+                if names is not None:
+                    inst = cls()
+                    for k, v in zip(names, row):
+                        if k is not None:
+                            setattr(inst, k, v)
+                    row = inst
+
+                retval.append(row)
+
+            return retval
+
+        return self.txpool.runQuery(str(compiled), params) \
+                                                        .addCallback(_process)
+
     def connect(self):
         return self.__engine.connect()
 
@@ -158,6 +818,16 @@ class SqlDataStore(DataStoreBase):
                 self.metadata.bind = engine
             if self.Session is not None:
                 self.Session.configure(bind=engine, expire_on_commit=False)
+            if self.ReadOnlySession is not None:
+                self.ReadOnlySession.configure(bind=engine,
+                                                        expire_on_commit=False)
+
+            blocking.install_sqlalchemy(engine)
+
+            if engine.dialect.name == 'sqlite':
+                from sqlalchemy import event
+                if not event.contains(engine, 'checkin', _on_sqlite_checkin):
+                    event.listen(engine, 'checkin', _on_sqlite_checkin)
 
     @property
     def kwargs(self):
@@ -176,23 +846,46 @@ class SqlDataStore(DataStoreBase):
             self.engine = None
 
         else:
-            if what.startswith('sqlite://') or what.endswith(":memory:"):
+            is_sqlite = what.startswith('sqlite')
+            is_memory = is_sqlite_memory(what)
+
+            if is_sqlite:
+                self.__kwargs['connect_args'] = {'check_same_thread': False}
+
+            if is_memory:
+                # every connection would get its own empty database otherwise
                 from sqlalchemy.pool import StaticPool
 
                 self.__kwargs['poolclass'] = StaticPool
 
-                if what.startswith('sqlite'):
-                    self.__kwargs['connect_args'] = {'check_same_thread': False}
-                if 'pool_size' in self.__kwargs:
-                    del self.__kwargs['pool_size']
+                for k in ('pool_size', 'max_overflow', 'pool_timeout'):
+                    if k in self.__kwargs:
+                        del self.__kwargs[k]
+
+            elif is_sqlite:
+                # older sqlalchemy versions default to NullPool for
+                # file-backed sqlite databases.
+                from sqlalchemy.pool import QueuePool
+
+                self.__kwargs.setdefault('poolclass', QueuePool)
+
+            engine = create_engine(what, **self.__kwargs)
+
+            if is_sqlite and not is_memory and self.sqlite_pragmas:
+                from sqlalchemy import event
+
+                event.listen(engine, 'connect',
+                                  _get_sqlite_pragma_setter(self.sqlite_pragmas))
 
-            self.engine = create_engine(what, **self.__kwargs)
+            self.engine = engine
             logger.info("%r started with: %r", self.engine, self.kwargs)
 
 
 def get_data_store(type, *args, **kwargs):
     if type == 'ldap':
         return LdapDataStore(*args, **kwargs)
+    elif type == 'ldap_pool':
+        return PooledLdapDataStore(*args, **kwargs)
     elif type == 'sqlalchemy':
         return SqlDataStore(*args, **kwargs)
     else:
@@ -0,0 +1,93 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import threading
+import unittest
+
+import neurons
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+from neurons.daemon import blocking
+from neurons.daemon.blocking import ReactorBlockedError
+
+
+class TestBlockingGuard(unittest.TestCase):
+    def setUp(self):
+        self.reactor_thread = neurons.REACTOR_THREAD
+        neurons.REACTOR_THREAD = threading.current_thread()
+        blocking.reset_stats()
+
+    def tearDown(self):
+        neurons.REACTOR_THREAD = self.reactor_thread
+        blocking.set_mode('off')
+        blocking.reset_stats()
+
+    def test_checkout(self):
+        engine = create_engine('sqlite://', poolclass=QueuePool)
+        blocking.install_sqlalchemy(engine)
+        blocking.set_mode('raise')
+
+        # must not raise from inside the pool event
+        conn = engine.connect()
+        assert conn.execute("SELECT 1").scalar() == 1
+        conn.close()
+
+        stats = blocking.get_stats()
+        assert stats['counts'] == {'sql': 1}
+        assert len(stats['sites']) == 1
+        assert 'test_blocking.py' in stats['sites'][0][0]
+
+        self.assertEqual(engine.pool.checkedout(), 0)
+
+    def test_raise(self):
+        blocking.set_mode('raise')
+        self.assertRaises(ReactorBlockedError, blocking.check, 'sql_session')
+
+        blocking.set_mode('count')
+        blocking.check('sql_session')
+        assert blocking.get_stats()['counts'] == {'sql_session': 2}
+
+    def test_other_thread(self):
+        blocking.set_mode('raise')
+        neurons.REACTOR_THREAD = None
+
+        blocking.check('sql_session')
+        assert blocking.get_stats()['counts'] == {}
+
+
+if __name__ == '__main__':
+    unittest.main()
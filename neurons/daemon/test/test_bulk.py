@@ -0,0 +1,89 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import unittest
+
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, \
+    Unicode, Index, LargeBinary, inspect
+
+from neurons.daemon.bulk import bulk_load, _get_processors
+
+
+class TestBulkLoad(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        metadata = MetaData()
+        self.table = Table('t', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('name', Unicode(16), nullable=False, default=u'x'),
+            Index('t_name', 'name'),
+        )
+        metadata.create_all(self.engine)
+
+    def _count(self):
+        return self.engine.execute(self.table.count()).scalar()
+
+    def test_load(self):
+        rows = ({'id': i} for i in range(10))
+
+        assert bulk_load(self.engine, self.table, rows, batch_size=3) == 10
+        assert self._count() == 10
+
+    def test_mismatched_rows(self):
+        rows = [{'id': 1}, {'id': 2, 'name': u'y'}]
+
+        self.assertRaises(ValueError, bulk_load, self.engine, self.table, rows)
+        assert self._count() == 0
+
+    def test_indexes_restored_on_error(self):
+        rows = [{'id': 1}, {'id': 1}]
+
+        self.assertRaises(Exception, bulk_load, self.engine, self.table, rows,
+                                                            defer_indexes=True)
+        indexes = inspect(self.engine).get_indexes('t')
+        assert [i['name'] for i in indexes] == ['t_name']
+
+    def test_processors(self):
+        from sqlalchemy.dialects import postgresql
+
+        table = Table('b', MetaData(), Column('id', Integer),
+                                                    Column('data', LargeBinary))
+        procs = _get_processors(postgresql.dialect(), table, ['data', 'id'])
+
+        assert [binary for _, binary in procs] == [True, False]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import threading
+
+from sqlalchemy import event
+from twisted.internet import reactor
+from twisted.internet.task import deferLater
+from twisted.trial import unittest
+
+from neurons.base.context import WriteContext, call_and_finalize
+from neurons.base.error import DatabaseBusyError
+from neurons.daemon.store import SqlDataStore
+
+
+class _Namespace(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class TestExecutor(unittest.TestCase):
+    def setUp(self):
+        self.store = SqlDataStore('sqlite://')
+        self.store.add_executor(1, timeout=0.1)
+
+    def tearDown(self):
+        self.store.executor.stop()
+
+    def test_run(self):
+        d = self.store.run_in_executor(lambda x: x + 1, 41)
+        d.addCallback(lambda retval: self.assertEqual(retval, 42))
+        return d
+
+    def test_timeout(self):
+        release = threading.Event()
+        called = []
+
+        self.store.run_in_executor(release.wait)
+        d = self.store.run_in_executor(called.append, 1)
+
+        # fails while the only thread is still busy
+        d = self.assertFailure(d, DatabaseBusyError)
+
+        def _check(_):
+            assert self.store.get_executor_stats()['timeouts'] == 1
+            release.set()
+
+            # the dropped call must not run once a thread is free
+            return deferLater(reactor, 0.2, lambda: None)
+
+        d.addCallback(_check)
+        d.addCallback(lambda _: self.assertEqual(called, []))
+        d.addBoth(lambda retval: (release.set(), retval)[1])
+        return d
+
+    def _get_ctx(self):
+        return _Namespace(udc=WriteContext(None))
+
+    def test_commit_in_executor(self):
+        threads = []
+
+        def _call(ctx):
+            session = ctx.udc.get_session(self.store)
+            event.listen(session, 'after_commit',
+                   lambda _: threads.append(threading.current_thread().name))
+            session.execute("SELECT 1")
+            return 42
+
+        def _check(retval):
+            # committed before the result is handed back
+            assert retval == 42
+            assert len(threads) == 1
+            assert self.store.executor.name in threads[0]
+
+        d = self.store.run_in_executor(call_and_finalize, _call,
+                                                               self._get_ctx())
+        return d.addCallback(_check)
+
+    def test_commit_error(self):
+        def _call(ctx):
+            session = ctx.udc.get_session(self.store)
+            session.execute("SELECT 1")
+
+            def _fail(_):
+                raise ValueError("commit failed")
+            event.listen(session, 'before_commit', _fail)
+
+        ctx = self._get_ctx()
+        d = self.store.run_in_executor(call_and_finalize, _call, ctx)
+        d = self.assertFailure(d, ValueError)
+        d.addCallback(lambda _: self.assertEqual(len(ctx.udc.sqla_sessions),
+                                                                           0))
+        return d
@@ -0,0 +1,126 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from collections import Counter
+
+from sqlalchemy import MetaData, select
+from spyne import Integer32, Unicode, TTableModel
+
+from neurons.daemon.gendata import DataGenerator, get_table_classes
+from neurons.daemon.store import SqlDataStore
+
+
+TableModel = TTableModel(MetaData())
+
+
+class Animal(TableModel):
+    __tablename__ = 'animal'
+    __mapper_args__ = {
+        'polymorphic_on': 'type',
+        'polymorphic_identity': 'animal',
+    }
+
+    id = Integer32(primary_key=True)
+    type = Unicode(16)
+    name = Unicode(32)
+
+
+class Dog(Animal):
+    __mapper_args__ = {'polymorphic_identity': 'dog'}
+
+    bark = Unicode(16)
+
+
+class Cat(Animal):
+    __mapper_args__ = {'polymorphic_identity': 'cat'}
+
+    lives = Integer32
+
+
+class Empty(TableModel):
+    __tablename__ = 'empty'
+
+    id = Integer32(primary_key=True)
+
+
+class Owner(TableModel):
+    __tablename__ = 'owner'
+
+    id = Integer32(primary_key=True)
+    empty_id = Integer32(fk='empty.id')
+
+
+class TestDataGenerator(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = SqlDataStore('sqlite:///%s' %
+                                       os.path.join(self.tmpdir, 'test.db'))
+        self.metadata = TableModel.Attributes.sqla_metadata
+        self.metadata.create_all(self.store.engine)
+
+    def tearDown(self):
+        self.store.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def test_single_table_inheritance(self):
+        assert get_table_classes(TableModel)[Animal.__table__] is Animal
+
+        gen = DataGenerator(self.store, scale=60, counts={'empty': 0},
+                                                      seed=0, base=TableModel)
+        result = gen.run()
+        assert result['animal'] == 60
+
+        with self.store.engine.connect() as conn:
+            types = Counter([r[0] for r in
+                           conn.execute(select([Animal.__table__.c.type]))])
+
+        assert set(types) == set(['animal', 'dog', 'cat'])
+
+    def test_empty_table(self):
+        gen = DataGenerator(self.store, scale=5, counts={'empty': 0},
+                                                      seed=0, base=TableModel)
+        result = gen.run()
+
+        assert result['empty'] == 0
+        assert result['owner'] == 25
+
+
+if __name__ == '__main__':
+    unittest.main()
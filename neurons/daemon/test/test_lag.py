@@ -0,0 +1,84 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import threading
+import unittest
+
+import neurons
+
+from twisted.internet.task import Clock
+
+from neurons.daemon.lag import ReactorLagMonitor
+
+
+class TestReactorLagMonitor(unittest.TestCase):
+    def test_lag(self):
+        clock = Clock()
+        clock.advance(1000.05)
+
+        m = ReactorLagMonitor(interval=0.1, threshold=0.5)
+        m.start_ticks(clock)
+
+        # due at 1000.15, called at 1000.4
+        clock.advance(0.35)
+        assert 249 < m.max_lag_ms < 251
+
+        # due at the next interval boundary, 1000.45
+        clock.advance(0.05)
+        assert sum(m.histogram) == 2
+        assert m.histogram[0] == 1
+
+        m.stop()
+
+    def test_capture(self):
+        reactor_thread = neurons.REACTOR_THREAD
+        neurons.REACTOR_THREAD = threading.current_thread()
+
+        try:
+            m = ReactorLagMonitor()
+            for _ in range(2):
+                m._capture(1.0)
+
+        finally:
+            neurons.REACTOR_THREAD = reactor_thread
+
+        stats = m.get_stats()
+        assert stats['num_stalls'] == 2
+        assert len(stats['stacks']) == 1
+        assert 'test_lag.py' in stats['stacks'][0][0]
+
+
+if __name__ == '__main__':
+    unittest.main()
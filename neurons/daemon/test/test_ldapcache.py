@@ -0,0 +1,93 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+import unittest
+
+from neurons.daemon.ldapcache import LdapCache
+
+
+class TestLdapCache(unittest.TestCase):
+    def test_search(self):
+        c = LdapCache(ttl=60, negative_ttl=10)
+        key = c.get_key('dc=example,dc=com', '(uid=x)', 2, ['mail', 'cn'])
+
+        assert key == c.get_key('DC=example,DC=com', '(uid=x)', 2,
+                                                                ['cn', 'mail'])
+        assert c.get(key) is None
+
+        c.put(key, [])
+        assert c.get(key) == []
+
+    def test_no_negative_caching(self):
+        c = LdapCache(ttl=60, negative_ttl=0)
+        key = c.get_key('dc=example,dc=com', '(uid=x)', 2, None)
+
+        c.put(key, [])
+        assert c.get(key) is None
+
+    def test_invalidate(self):
+        c = LdapCache()
+        k1 = c.get_key('dc=example,dc=com', '(uid=x)', 2, None)
+        k2 = c.get_key('ou=people,dc=example,dc=com', '(uid=x)', 2, None)
+        k3 = c.get_key('ou=groups,dc=example,dc=com', '(cn=x)', 2, None)
+        for k in (k1, k2, k3):
+            c.put(k, [('dn', {})])
+
+        c.invalidate('uid=x,ou=people,dc=example,dc=com')
+
+        assert c.get(k1) is None
+        assert c.get(k2) is None
+        assert c.get(k3) is not None
+
+    def test_bind(self):
+        c = LdapCache(bind_ttl=60)
+        dn = 'uid=x,dc=example,dc=com'
+
+        assert not c.check_bind(dn, 'secret')
+        c.remember_bind(dn, 'secret')
+        assert c.check_bind(dn, 'secret')
+        assert not c.check_bind(dn, 'wrong')
+
+        c.invalidate_bind(dn)
+        assert not c.check_bind(dn, 'secret')
+
+    def test_bind_disabled(self):
+        c = LdapCache(bind_ttl=0)
+        c.remember_bind('uid=x', 'secret')
+
+        assert not c.check_bind('uid=x', 'secret')
+
+
+if __name__ == '__main__':
+    unittest.main()
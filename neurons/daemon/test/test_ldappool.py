@@ -0,0 +1,135 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import unittest
+
+from time import time
+
+from neurons.daemon.ldappool import LdapPool
+
+try:
+    import ldap
+except ImportError:
+    ldap = None
+
+
+class _Connection(object):
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.pings = 0
+        self.unbound = False
+
+    def whoami_s(self):
+        self.pings += 1
+        if not self.healthy:
+            raise Exception("server down")
+        return ''
+
+    def unbind_s(self):
+        self.unbound = True
+
+
+class TestLdapPool(unittest.TestCase):
+    def test_empty_password(self):
+        pool = LdapPool('ldap://localhost', 'cn=admin', 'secret')
+        results = []
+
+        pool.authenticate('uid=someone', '').addCallback(results.append)
+        pool.authenticate('uid=someone', None).addCallback(results.append)
+
+        assert results == [False, False]
+        assert pool.threadpool is None  # the server was never asked
+
+    def test_health_check_batch(self):
+        pool = LdapPool('ldap://localhost', 'cn=admin', 'secret', size=4,
+                                                        health_check_batch=2)
+        conns = [_Connection(), _Connection(healthy=False), _Connection(),
+                                                                 _Connection()]
+        pool.num_conns = len(conns)
+        for conn in conns:
+            pool._idle.put(conn)
+
+        assert pool._check_idle() == 2
+        assert [c.pings for c in conns] == [1, 1, 0, 0]
+        assert conns[1].unbound
+        assert pool.get_stats()['conns'] == 3
+        assert pool.get_stats()['idle'] == 3
+
+        # the ones that were not checked come first next time
+        assert pool._check_idle() == 2
+        assert [c.pings for c in conns] == [1, 1, 1, 1]
+
+    def _get_pool(self, num_conns):
+        pool = LdapPool('ldap://localhost', 'cn=admin', 'secret', size=2)
+        pool.num_conns = num_conns
+        for _ in range(num_conns):
+            pool._idle.put(_Connection())
+        return pool
+
+    @unittest.skipIf(ldap is None, "python-ldap is not installed")
+    def test_retry(self):
+        pool = self._get_pool(2)
+        calls = []
+
+        def _search(conn):
+            calls.append(conn)
+            if len(calls) == 1:
+                raise ldap.SERVER_DOWN(dict(desc="gone"))
+            return 'result'
+
+        assert pool._run(time(), True, _search, (), {}) == 'result'
+        assert len(calls) == 2
+        assert calls[0].unbound
+        assert pool.get_stats()['reconnects'] == 1
+
+    @unittest.skipIf(ldap is None, "python-ldap is not installed")
+    def test_no_retry(self):
+        pool = self._get_pool(2)
+        calls = []
+
+        def _modify(conn):
+            calls.append(conn)
+            raise ldap.SERVER_DOWN(dict(desc="gone"))
+
+        self.assertRaises(ldap.SERVER_DOWN, pool._run, time(), False,
+                                                              _modify, (), {})
+        assert len(calls) == 1
+        assert calls[0].unbound
+        assert pool.get_stats()['reconnects'] == 0
+        assert pool.get_stats()['conns'] == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+from spyne import Integer32, Unicode
+
+from neurons import TableModel
+from neurons.model import TVersion
+from neurons.daemon.migrate import Migrator, Migration, MigrationStep
+from neurons.daemon.store import SqlDataStore
+
+
+Version = TVersion('test_migrate', 0)
+
+
+class MigrateItem(TableModel):
+    __tablename__ = 'test_migrate_item'
+
+    id = Integer32(pk=True)
+    name = Unicode(32)
+
+
+class TestMigrator(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = SqlDataStore('sqlite:///%s' %
+                                       os.path.join(self.tmpdir, 'test.db'))
+
+        table = MigrateItem.__table__
+        table.create(self.store.engine)
+        with self.store.engine.begin() as conn:
+            conn.execute(table.insert(),
+                                [dict(id=i, name=u'x') for i in range(1, 11)])
+
+    def tearDown(self):
+        self.store.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def test_run(self):
+        table = MigrateItem.__table__
+
+        def _migrate(conn, keys):
+            conn.execute(table.update()
+                         .where(table.c.id.in_([k[0] for k in keys]))
+                         .values(name=u'y'))
+
+        step = MigrationStep('rename', MigrateItem, _migrate, batch_size=3)
+        migrator = Migrator(self.store, Version, [Migration(1, [step])])
+
+        assert migrator.run()
+        assert migrator.get_version() == 1
+        assert migrator.get_stats()['num_rows'] == 10
+
+        with self.store.engine.connect() as conn:
+            names = set([r[0] for r in conn.execute(select([table.c.name]))])
+        assert names == set([u'y'])
+
+    def test_retries_are_bounded(self):
+        calls = []
+
+        def _migrate(conn, keys):
+            calls.append(keys)
+            raise OperationalError("UPDATE", {}, Exception("locked"))
+
+        step = MigrationStep('fail', MigrateItem, _migrate)
+        migrator = Migrator(self.store, Version, [Migration(1, [step])],
+                                            throttle_sleep=0.001, max_retries=3)
+
+        self.assertRaises(OperationalError, migrator.run)
+        assert len(calls) == 4
+        assert migrator.get_version() == 0
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import unittest
+
+from time import time
+
+from neurons.daemon.poolmon import PoolMonitor
+
+
+class _Record(object):
+    pass
+
+
+class TestPoolMonitor(unittest.TestCase):
+    def test_checkout_checkin(self):
+        m = PoolMonitor(hold_threshold=None, capture_stacks=True)
+        rec = _Record()
+
+        m._on_checkout(None, rec)
+        outstanding = m.get_outstanding()
+        assert len(outstanding) == 1
+        assert outstanding[0]['stack'] is not None
+        assert outstanding[0]['request'] is None
+
+        m._on_checkin(None, rec)
+        stats = m.get_stats()
+        assert stats['checkouts'] == 1
+        assert stats['checkins'] == 1
+        assert stats['outstanding'] == 0
+        assert stats['long_holds'] == 0
+
+    def test_engine(self):
+        from sqlalchemy import create_engine
+        from sqlalchemy.pool import QueuePool
+
+        engine = create_engine('sqlite://', poolclass=QueuePool)
+
+        m = PoolMonitor(hold_threshold=None)
+        m.install(engine)
+
+        conn = engine.connect()
+        outstanding = m.get_outstanding()
+        assert len(outstanding) == 1
+        assert outstanding[0]['stack'] is None
+
+        conn.close()
+        stats = m.get_stats()
+        assert stats['checkouts'] == 1
+        assert stats['checkins'] == 1
+        assert stats['pools'][0]['checked_out'] == 0
+
+    def test_wait(self):
+        import threading
+
+        from sqlalchemy import create_engine
+        from sqlalchemy.pool import QueuePool
+
+        engine = create_engine('sqlite://', poolclass=QueuePool,
+                      pool_size=1, max_overflow=0,
+                      connect_args={'check_same_thread': False})
+
+        m = PoolMonitor(hold_threshold=None)
+        m.install(engine)
+
+        conn = engine.connect()
+        timer = threading.Timer(0.2, conn.close)
+        timer.start()
+
+        # waits until the timer returns the only connection
+        engine.connect().close()
+        timer.join()
+
+        stats = m.get_stats()
+        assert stats['max_wait'] >= 0.15
+        assert stats['checkouts'] == 2
+
+    def test_long_hold(self):
+        m = PoolMonitor(hold_threshold=10, capture_stacks=False)
+        rec = _Record()
+
+        m._on_checkout(None, rec)
+        assert m.check() == 0
+
+        m._outstanding[id(rec)]['checked_out_at'] = time() - 60
+        assert m.check() == 1
+        assert m.check() == 0  # reported once
+
+        m._on_checkin(None, rec)
+        assert m.get_stats()['long_holds'] == 1
+        assert m.get_stats()['max_hold'] >= 60
+
+
+if __name__ == '__main__':
+    unittest.main()
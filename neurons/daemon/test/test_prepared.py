@@ -0,0 +1,122 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+import unittest
+
+from neurons.daemon.prepared import to_prepared, PreparedStatementCache
+
+
+class TestToPrepared(unittest.TestCase):
+    def test_positional(self):
+        sql, names = to_prepared(
+            "SELECT a FROM t WHERE id = %(id_1)s AND b > %(b_1)s")
+
+        assert sql == "SELECT a FROM t WHERE id = $1 AND b > $2"
+        assert names == ['id_1', 'b_1']
+
+    def test_repeated(self):
+        sql, names = to_prepared("SELECT %(x)s + %(y)s + %(x)s")
+
+        assert sql == "SELECT $1 + $2 + $1"
+        assert names == ['x', 'y']
+
+    def test_escaped_percent(self):
+        sql, names = to_prepared("SELECT a FROM t WHERE a LIKE 'x%%' "
+                                                          "AND b = %(b)s")
+
+        assert sql == "SELECT a FROM t WHERE a LIKE 'x%' AND b = $1"
+        assert names == ['b']
+
+
+class _Connection(object):
+    def __init__(self):
+        self.info = {}
+
+
+class _Cursor(object):
+    connection = None
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement):
+        if statement.startswith("PREPARE") and 'bad' in statement:
+            raise Exception("could not determine data type of parameter $1")
+        self.statements.append(statement)
+
+
+class TestPreparedStatementCache(unittest.TestCase):
+    def _execute(self, cache, conn, cursor, statement):
+        return cache._before_execute(conn, cursor, statement, {}, None,
+                                                                         False)
+
+    def test_hit(self):
+        cache = PreparedStatementCache()
+        conn, cursor = _Connection(), _Cursor()
+
+        sql, _ = self._execute(cache, conn, cursor, "SELECT 1")
+        assert sql == "EXECUTE neurons_ps_1"
+        sql, _ = self._execute(cache, conn, cursor, "SELECT 1")
+        assert sql == "EXECUTE neurons_ps_1"
+
+        stats = cache.get_stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+
+    def test_unpreparable(self):
+        cache = PreparedStatementCache(unpreparable_size=2)
+        conn, cursor = _Connection(), _Cursor()
+
+        for i in range(3):
+            statement = "SELECT bad_%d" % i
+            sql, _ = self._execute(cache, conn, cursor, statement)
+            assert sql == statement
+
+        stats = cache.get_stats()
+        assert stats['failures'] == 3
+        assert stats['unpreparable'] == 2
+
+        # remembered ones aren't tried again
+        num_statements = len(cursor.statements)
+        self._execute(cache, conn, cursor, "SELECT bad_2")
+        assert len(cursor.statements) == num_statements
+        assert cache.get_stats()['failures'] == 3
+
+        # the least recently used one was forgotten
+        self._execute(cache, conn, cursor, "SELECT bad_0")
+        assert cache.get_stats()['failures'] == 4
+
+
+if __name__ == '__main__':
+    unittest.main()
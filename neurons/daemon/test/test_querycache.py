@@ -0,0 +1,120 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, \
+    select
+
+from neurons.daemon.querycache import QueryCache
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.engine = create_engine('sqlite:///%s' %
+                                       os.path.join(self.tmpdir, 'test.db'))
+
+        metadata = MetaData()
+        self.table = Table('some_table', metadata,
+            Column('id', Integer, primary_key=True),
+        )
+        metadata.create_all(self.engine)
+
+        with self.engine.begin() as conn:
+            conn.execute(self.table.insert(), id=1)
+
+        self.cache = QueryCache()
+        self.cache.install(self.engine)
+
+    def tearDown(self):
+        self.cache.uninstall(self.engine)
+        self.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def test_commit_invalidates(self):
+        stmt = select([self.table.c.id])
+
+        assert len(self.cache.execute(stmt)) == 1
+        assert len(self.cache.execute(stmt)) == 1
+        assert self.cache.get_stats()['hits'] == 1
+
+        with self.engine.begin() as conn:
+            conn.execute(self.table.insert(), id=2)
+
+        assert len(self.cache.execute(stmt)) == 2
+
+    def test_read_during_commit(self):
+        from sqlalchemy import event
+
+        stmt = select([self.table.c.id])
+        assert len(self.cache.execute(stmt)) == 1
+
+        def _read(conn):
+            # the commit event fires before the commit, so another
+            # connection still sees the old rows here.
+            assert len(self.cache.execute(stmt)) == 1
+
+        event.listen(self.engine, 'commit', _read)
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(self.table.insert(), id=2)
+
+        finally:
+            event.remove(self.engine, 'commit', _read)
+
+        assert len(self.cache.execute(stmt)) == 2
+
+    def test_rollback_not_cached(self):
+        stmt = select([self.table.c.id])
+
+        conn = self.engine.connect()
+        trans = conn.begin()
+        conn.execute(self.table.insert(), id=2)
+
+        assert len(self.cache.execute(stmt, conn=conn)) == 2
+        assert self.cache.get_stats()['bypassed'] == 1
+
+        trans.rollback()
+        conn.close()
+
+        assert len(self.cache.execute(stmt)) == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import shutil
+import tempfile
+import unittest
+
+from os.path import join
+
+from sqlalchemy import MetaData
+from sqlalchemy.exc import OperationalError
+from spyne import Integer32, Unicode, TTableModel
+
+from neurons.base.context import ReadContext, WriteContext
+from neurons.base.error import ReadOnlyContextError
+from neurons.daemon.store import SqlDataStore
+
+
+TableModel = TTableModel(MetaData())
+
+
+class Item(TableModel):
+    __tablename__ = 'item'
+
+    id = Integer32(primary_key=True)
+    name = Unicode(32)
+
+
+class TestReadOnlyContext(unittest.TestCase):
+    def setUp(self):
+        # file-backed so that the engine gets a QueuePool
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = SqlDataStore('sqlite:///' + join(self.tmpdir, 'db'))
+        TableModel.Attributes.sqla_metadata.create_all(self.store.engine)
+
+    def tearDown(self):
+        self.store.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def _count(self):
+        ctx = ReadContext(None)
+        try:
+            return ctx.get_session(self.store).query(Item).count()
+        finally:
+            ctx.close()
+
+    def test_flush(self):
+        ctx = ReadContext(None)
+        session = ctx.get_session(self.store)
+        session.add(Item(name=u'x'))
+
+        self.assertRaises(ReadOnlyContextError, session.flush)
+        ctx.close()
+
+        assert self._count() == 0
+
+    def test_query_only(self):
+        ctx = ReadContext(None)
+        session = ctx.get_session(self.store)
+
+        self.assertRaises(OperationalError, session.execute,
+                                     "INSERT INTO item (name) VALUES ('x')")
+        ctx.close()
+
+        # the connection is writable again once it's back in the pool
+        ctx = WriteContext(None)
+        ctx.get_session(self.store).add(Item(name=u'x'))
+        ctx.close()
+
+        assert self._count() == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
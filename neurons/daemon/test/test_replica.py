@@ -0,0 +1,107 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import shutil
+import tempfile
+import unittest
+
+from os.path import join
+
+from neurons.base.context import ReadContext, WriteContext
+from neurons.daemon.store import SqlDataStore
+
+
+class TestReplicas(unittest.TestCase):
+    def setUp(self):
+        # file-backed so that the engines get a QueuePool
+        self.tmpdir = tempfile.mkdtemp()
+        url = 'sqlite:///' + join(self.tmpdir, '%s.db')
+
+        self.store = SqlDataStore(url % 'primary')
+        self.replicas = [self.store.add_replica(url % 'replica1'),
+                         self.store.add_replica(url % 'replica2')]
+
+    def tearDown(self):
+        for engine in [self.store.engine] + self.replicas:
+            engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_robin(self):
+        picked = [self.store.get_replica() for _ in range(4)]
+
+        assert set(picked) == set(self.replicas)
+        assert picked[0] is picked[2]
+        assert picked[1] is picked[3]
+
+    def test_least_checked_out(self):
+        self.store.replica_policy = 'least_checked_out'
+
+        conn = self.replicas[0].connect()
+        try:
+            assert self.store.get_replica() is self.replicas[1]
+        finally:
+            conn.close()
+
+    def test_read_your_writes(self):
+        assert self.store.get_read_bind(u'alice') in self.replicas
+
+        ctx = WriteContext(None)
+        ctx.user = u'alice'
+        ctx.get_session(self.store).execute("SELECT 1")
+        ctx.close()
+
+        # alice reads from the primary, others still use the replicas
+        ctx = ReadContext(None)
+        ctx.user = u'alice'
+        assert ctx.get_session(self.store).bind is self.store.engine
+        ctx.close()
+
+        ctx = ReadContext(None)
+        ctx.user = u'bob'
+        assert ctx.get_session(self.store).bind in self.replicas
+        ctx.close()
+
+        self.store.read_your_writes_sec = 0
+        assert self.store.get_read_bind(u'alice') in self.replicas
+
+    def test_no_replicas(self):
+        store = SqlDataStore('sqlite://')
+
+        assert store.get_replica() is None
+        assert store.get_read_bind(u'alice') is store.engine
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import unittest
+
+from sqlalchemy import MetaData, select, bindparam
+from sqlalchemy.types import TypeDecorator, String
+from spyne import Integer32, Unicode, TTableModel
+
+from twisted.internet.defer import succeed
+
+from neurons.daemon.store import SqlDataStore
+
+
+TableModel = TTableModel(MetaData())
+
+
+class Item(TableModel):
+    __tablename__ = 'item'
+
+    id = Integer32(primary_key=True)
+    name = Unicode(32)
+
+
+class _Upper(TypeDecorator):
+    impl = String
+
+    def process_bind_param(self, value, dialect):
+        return value.upper()
+
+
+class _TxPool(object):
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def runQuery(self, query, params):
+        self.queries.append((query, params))
+        return succeed(self.rows)
+
+
+class TestSelectAsync(unittest.TestCase):
+    def setUp(self):
+        self.store = SqlDataStore()
+        self.store.txpool = _TxPool([(1, u'a'), (2, u'b')])
+
+    def _run(self, stmt, cls=None):
+        retval = []
+        self.store.select_async(stmt, cls).addCallback(retval.extend)
+        return retval
+
+    def test_compile(self):
+        t = Item.__table__
+        self._run(select([t.c.id, t.c.name]).where(t.c.id > 0))
+
+        (query, params), = self.store.txpool.queries
+        assert '%(id_1)s' in query
+        assert params == {'id_1': 0}
+
+    def test_bind_processors(self):
+        t = Item.__table__
+        self._run(select([t.c.id]).where(
+                                t.c.name == bindparam('n', u'x', type_=_Upper)))
+
+        (query, params), = self.store.txpool.queries
+        assert params == {'n': u'X'}
+
+    def test_tuples(self):
+        t = Item.__table__
+        rows = self._run(select([t.c.id, t.c.name]))
+
+        assert rows == [(1, u'a'), (2, u'b')]
+
+    def test_instances(self):
+        t = Item.__table__
+        items = self._run(select([t.c.id, t.c.name]), Item)
+
+        assert [type(i) for i in items] == [Item, Item]
+        assert [(i.id, i.name) for i in items] == [(1, u'a'), (2, u'b')]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from os.path import join
+
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from neurons.daemon.store import SqlDataStore, is_sqlite_memory
+
+
+class TestSqlite(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_is_memory(self):
+        assert is_sqlite_memory('sqlite://')
+        assert is_sqlite_memory('sqlite:///:memory:')
+        assert is_sqlite_memory('sqlite:///file:db?mode=memory&uri=true')
+        assert not is_sqlite_memory('sqlite:////tmp/db')
+
+    def test_memory(self):
+        store = SqlDataStore('sqlite://', pool_size=5)
+
+        assert isinstance(store.engine.pool, StaticPool)
+
+    def test_file(self):
+        store = SqlDataStore('sqlite:///' + join(self.tmpdir, 'db'),
+                   sqlite_pragmas=(('busy_timeout', 1234),
+                                   ('journal_mode', 'WAL'),
+                                   ('cache_size', None)))
+
+        try:
+            assert isinstance(store.engine.pool, QueuePool)
+
+            conn = store.engine.connect()
+            try:
+                assert conn.execute("PRAGMA busy_timeout").scalar() == 1234
+                assert conn.execute("PRAGMA journal_mode").scalar() == 'wal'
+
+                # skipped, so it's still sqlite's default
+                default = sqlite3.connect(':memory:') \
+                                     .execute("PRAGMA cache_size").fetchone()
+                assert conn.execute("PRAGMA cache_size").scalar() == default[0]
+
+            finally:
+                conn.close()
+
+        finally:
+            store.engine.dispose()
+
+    def test_replica(self):
+        store = SqlDataStore('sqlite:///' + join(self.tmpdir, 'primary'))
+        replica = store.add_replica('sqlite:///' + join(self.tmpdir, 'replica'))
+
+        try:
+            conn = replica.connect()
+            try:
+                assert conn.execute("PRAGMA journal_mode").scalar() == 'wal'
+            finally:
+                conn.close()
+
+        finally:
+            replica.dispose()
+            store.engine.dispose()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import unittest
+
+from twisted.internet import defer
+from twisted.internet.task import Clock
+
+from neurons.daemon.txpool import TxPool
+
+
+class _Connection(object):
+    closed = False
+
+    def runQuery(self, query):
+        return defer.succeed([(query,)])
+
+    def close(self):
+        self.closed = True
+
+
+class _TxPool(TxPool):
+    def _connect(self):
+        conn = _Connection()
+        self.connections.add(conn)
+        return defer.succeed(conn)
+
+
+class TestTxPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = _TxPool('', min=1, max=2, idle_timeout=10, reactor=Clock())
+        self.pool.start()
+
+    def test_grow_and_wait(self):
+        pool = self.pool
+        assert pool.get_stats()['size'] == 1
+
+        conns = []
+        for _ in range(3):
+            pool._acquire().addCallback(conns.append)
+
+        # max is 2, the third request waits for a connection
+        assert len(conns) == 2
+        assert pool.get_stats()['waiting'] == 1
+
+        pool._release(conns[0])
+        assert conns[2] is conns[0]
+        assert pool.get_stats()['waiting'] == 0
+
+    def test_query(self):
+        result = []
+        self.pool.runQuery('SELECT 1').addCallback(result.append)
+
+        assert result == [[('SELECT 1',)]]
+        assert self.pool.in_use == 0
+
+    def test_shrink(self):
+        pool = self.pool
+
+        conns = []
+        for _ in range(2):
+            pool._acquire().addCallback(conns.append)
+        for conn in conns:
+            pool._release(conn)
+
+        assert pool.size == 2
+
+        # pretend they've been idle for a while
+        pool.free = type(pool.free)([(c, 0) for c, _ in pool.free])
+        pool.shrink()
+
+        assert pool.size == 1
+        assert len([c for c in conns if c.closed]) == 1
+
+    def test_close(self):
+        pool = self.pool
+
+        errors = []
+        for _ in range(3):
+            pool._acquire().addErrback(errors.append)
+
+        pool.close()
+
+        assert len(errors) == 1
+        assert pool._acquire().addErrback(errors.append) is not None
+        assert len(errors) == 2
+
+
+if __name__ == '__main__':
+    unittest.main()
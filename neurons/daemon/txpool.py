@@ -0,0 +1,241 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+"""An elastic connection pool built on txpostgres connections."""
+
+import logging
+logger = logging.getLogger(__name__)
+
+from time import time
+from collections import deque
+
+from txpostgres.txpostgres import Connection
+from txpostgres.reconnection import DeadConnectionDetector
+
+from twisted.internet import defer
+
+
+class LoggingDeadConnectionDetector(DeadConnectionDetector):
+    def startReconnecting(self, f):
+        logger.warning('TxPool database connection down: %r)', f.value)
+        return DeadConnectionDetector.startReconnecting(self, f)
+
+    def reconnect(self):
+        logger.warning('TxPool reconnecting...')
+        return DeadConnectionDetector.reconnect(self)
+
+    def connectionRecovered(self):
+        logger.warning('TxPool connection recovered')
+        return DeadConnectionDetector.connectionRecovered(self)
+
+
+class TxPool(object):
+    """A pool of txpostgres connections that has ``min`` connections open at
+    all times and grows up to ``max`` connections on demand. Connections that
+    stay idle for longer than ``idle_timeout`` seconds are closed as long as
+    there are more than ``min`` connections.
+
+    Every connection gets its own :class:`LoggingDeadConnectionDetector` so
+    that broken connections are reconnected automatically.
+
+    Requests that arrive when all ``max`` connections are in use wait in a
+    FIFO queue.
+
+    It has the query interface of :class:`txpostgres.txpostgres.ConnectionPool`.
+    """
+
+    def __init__(self, dsn, min=1, max=10, idle_timeout=300, reactor=None):
+        assert 0 < min <= max, "Invalid pool size: min=%r max=%r" % (min, max)
+
+        if reactor is None:
+            from twisted.internet import reactor
+
+        self.dsn = dsn
+        self.min = min
+        self.max = max
+        self.idle_timeout = idle_timeout
+        self.reactor = reactor
+
+        self.connections = set()
+        self.free = deque()
+        self.waiting = deque()
+        self.connecting = 0
+        self.closed = False
+
+        self._shrink_task = None
+
+    @property
+    def size(self):
+        return len(self.connections) + self.connecting
+
+    @property
+    def in_use(self):
+        return len(self.connections) - len(self.free)
+
+    def get_stats(self):
+        return dict(
+            size=self.size,
+            free=len(self.free),
+            in_use=self.in_use,
+            waiting=len(self.waiting),
+            connecting=self.connecting,
+            min=self.min,
+            max=self.max,
+        )
+
+    def start(self):
+        """Opens ``min`` connections.
+
+        :return: A Deferred that fires with the pool when all of them are
+            connected.
+        """
+
+        from twisted.internet.task import LoopingCall
+
+        dl = []
+        for _ in range(self.min):
+            d = self._connect()
+            d.addCallback(self._release)
+            dl.append(d)
+
+        if self.idle_timeout:
+            self._shrink_task = LoopingCall(self.shrink)
+            self._shrink_task.clock = self.reactor
+            self._shrink_task.start(max(self.idle_timeout / 2.0, 1), now=False)
+
+        return defer.gatherResults(dl, consumeErrors=True) \
+                                                     .addCallback(lambda _: self)
+
+    def close(self):
+        self.closed = True
+
+        if self._shrink_task is not None and self._shrink_task.running:
+            self._shrink_task.stop()
+        self._shrink_task = None
+
+        while len(self.waiting) > 0:
+            self.waiting.popleft().errback(Exception("Pool closed."))
+
+        for conn in self.connections:
+            conn.close()
+
+        self.connections.clear()
+        self.free.clear()
+
+    def shrink(self):
+        """Closes connections that have been idle for longer than
+        ``idle_timeout`` seconds."""
+
+        limit = time() - self.idle_timeout
+
+        # the least recently used connections are at the left end
+        while len(self.free) > 0 and len(self.connections) > self.min:
+            conn, last_used = self.free[0]
+            if last_used > limit:
+                break
+
+            self.free.popleft()
+            self.connections.discard(conn)
+            conn.close()
+            logger.debug("%r: Closed idle connection %r", self, conn)
+
+    def _connect(self):
+        conn = Connection(reactor=self.reactor,
+                                       detector=LoggingDeadConnectionDetector())
+        self.connecting += 1
+
+        def _on_connected(_):
+            self.connecting -= 1
+            self.connections.add(conn)
+            logger.debug("%r: New connection %r", self, conn)
+            return conn
+
+        def _on_error(f):
+            self.connecting -= 1
+            logger.error("%r: Connection failed: %s", self, f.getErrorMessage())
+            return f
+
+        return conn.connect(self.dsn).addCallbacks(_on_connected, _on_error)
+
+    def _acquire(self):
+        if self.closed:
+            return defer.fail(Exception("Pool closed."))
+
+        if len(self.free) > 0:
+            # the most recently used connection is the most likely to be warm
+            conn, _ = self.free.pop()
+            return defer.succeed(conn)
+
+        if self.size < self.max:
+            return self._connect()
+
+        d = defer.Deferred()
+        self.waiting.append(d)
+        return d
+
+    def _release(self, conn):
+        if self.closed:
+            conn.close()
+            return
+
+        if len(self.waiting) > 0:
+            self.waiting.popleft().callback(conn)
+        else:
+            self.free.append((conn, time()))
+
+    def _run(self, method_name, *args, **kwargs):
+        def _call(conn):
+            d = defer.maybeDeferred(getattr(conn, method_name), *args, **kwargs)
+
+            def _put_back(result):
+                self._release(conn)
+                return result
+
+            return d.addBoth(_put_back)
+
+        return self._acquire().addCallback(_call)
+
+    def runQuery(self, *args, **kwargs):
+        return self._run('runQuery', *args, **kwargs)
+
+    def runOperation(self, *args, **kwargs):
+        return self._run('runOperation', *args, **kwargs)
+
+    def runInteraction(self, interaction, *args, **kwargs):
+        return self._run('runInteraction', interaction, *args, **kwargs)
+
+    def __repr__(self):
+        return "<TxPool %d/%d (min=%d max=%d) waiting=%d>" % (self.in_use,
+                          len(self.connections), self.min, self.max,
+                                                             len(self.waiting))
@@ -53,6 +53,9 @@ from neurons.form.form import HtmlForm
 
 from neurons.form.table import HtmlFormTable
 
+from neurons.form.eager import get_loader_options
+from neurons.form.eager import get_rendered_fields
+
 def tou(name):
     if name is not None:
         return name.encode('utf8')
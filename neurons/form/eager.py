@@ -0,0 +1,194 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+"""Works out which relations and columns a form is going to render, so that
+they can be loaded upfront instead of lazily, one query per row, while the
+form is being rendered."""
+
+import logging
+logger = logging.getLogger(__name__)
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import selectinload, joinedload, load_only
+
+from spyne import ComplexModelBase, Array
+
+from neurons.form.widget import ComplexRenderWidget
+
+
+def _get_attrs(prot, cls):
+    if prot is None:
+        return cls.Attributes
+    return prot.get_cls_attrs(cls)
+
+
+def _unwrap(cls):
+    if issubclass(cls, Array):
+        return next(iter(cls._type_info.values()))
+    return cls
+
+
+def _split_fields(fields):
+    retval = {}
+    for f in fields:
+        head, _, rest = f.partition('.')
+        sub = retval.setdefault(head, set())
+        if rest:
+            sub.add(rest)
+
+    return retval
+
+
+def get_rendered_fields(cls, prot=None, fields=None, max_depth=3):
+    """Returns the fields of ``cls`` that ``prot`` would render as a nested
+    dict. Values are ``None`` for simple fields and dicts of the same kind
+    for complex ones.
+
+    Fields with ``exc=True`` are skipped. Hidden simple fields are kept as
+    their values end up in hidden inputs. Complex fields rendered with a
+    :class:`ComplexRenderWidget` subclass (href, select widgets, etc.) only
+    need the fields that widget displays.
+
+    :param prot: The output protocol instance, to resolve protocol-specific
+        attributes. ``None`` uses the class' own attributes.
+    :param fields: When not ``None``, an iterable of field names to limit the
+        result to. Dotted names limit nested fields, e.g. ``vehicles.owner``.
+    :param max_depth: Complex fields deeper than this are not followed.
+    """
+
+    retval = {}
+    if max_depth < 0:
+        return retval
+
+    limit = None
+    if fields is not None:
+        limit = _split_fields(fields)
+
+    for k, v in cls.get_flat_type_info(cls).items():
+        if limit is not None and not (k in limit):
+            continue
+
+        attrs = _get_attrs(prot, v)
+        if attrs.exc:
+            continue
+
+        v = _unwrap(v)
+        if not issubclass(v, ComplexModelBase):
+            retval[k] = None
+            continue
+
+        subfields = None
+        if limit is not None and len(limit[k]) > 0:
+            subfields = limit[k]
+
+        widget = getattr(attrs, 'prot', None)
+        if isinstance(widget, ComplexRenderWidget):
+            names = [widget.id_field, widget.text_field]
+            names.extend(widget.hidden_fields or ())
+            retval[k] = dict([(n, None) for n in names if n is not None])
+
+        else:
+            retval[k] = get_rendered_fields(v, prot, subfields, max_depth - 1)
+
+    return retval
+
+
+def _is_polymorphic(mapper):
+    return mapper.inherits is not None or len(mapper.polymorphic_map) > 1
+
+
+def _build(path):
+    retval = None
+    for strategy, attr in path:
+        if retval is None:
+            retval = strategy(attr)
+        else:
+            retval = getattr(retval, strategy.__name__)(attr)
+
+    return retval
+
+
+def _plan(mapper, rendered, path, retval):
+    cols = [k for k in rendered if k in mapper.column_attrs]
+
+    # polymorphic loads need the discriminator and subclass columns, so leave
+    # them alone.
+    if len(cols) > 0 and not _is_polymorphic(mapper):
+        if len(path) == 0:
+            retval.append(load_only(*cols))
+        else:
+            retval.append(_build(path).load_only(*cols))
+
+    for k, sub in rendered.items():
+        if not (k in mapper.relationships):
+            if sub is not None and not (k in mapper.column_attrs):
+                logger.debug("%r is not a relationship of %r, skipping",
+                                                                   k, mapper)
+            continue
+
+        rel = mapper.relationships[k]
+        attr = getattr(mapper.class_, k)
+
+        # joins against polymorphic targets get wide, and joins against
+        # collections multiply rows. a separate SELECT ... IN is cheaper.
+        if rel.uselist or _is_polymorphic(rel.mapper):
+            strategy = selectinload
+        else:
+            strategy = joinedload
+
+        subpath = path + ((strategy, attr),)
+        retval.append(_build(subpath))
+
+        _plan(rel.mapper, sub or {}, subpath, retval)
+
+    return retval
+
+
+def get_loader_options(cls, prot=None, fields=None, max_depth=3):
+    """Returns a list of SQLAlchemy loader options that load what ``prot``
+    would render for ``cls`` upfront. Relations are loaded with
+    ``selectinload`` when they are collections or polymorphic and with
+    ``joinedload`` otherwise. Columns of non-polymorphic classes are limited
+    with ``load_only``.
+
+    Usage: ::
+
+        opts = get_loader_options(Garage, ctx.out_protocol)
+        return session.query(Garage).options(*opts).all()
+
+    See :func:`get_rendered_fields` for the parameters.
+    """
+
+    rendered = get_rendered_fields(cls, prot, fields, max_depth)
+    return _plan(inspect(cls), rendered, (), [])
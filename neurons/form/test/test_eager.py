@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Burak Arslan <burak.arslan@arskom.com.tr>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the {organization} nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+from __future__ import absolute_import, print_function
+
+import unittest
+
+from spyne import Unicode, Integer, ComplexModel, Array
+
+from neurons.form import ComplexHrefWidget, get_rendered_fields
+
+
+class Owner(ComplexModel):
+    id = Integer
+    name = Unicode
+    phone = Unicode
+
+
+class Vehicle(ComplexModel):
+    id = Integer
+    plate = Unicode
+    secret = Unicode(exc=True)
+    owner = Owner
+
+
+class Garage(ComplexModel):
+    id = Integer
+    vehicles = Array(Vehicle)
+    manager = Owner.customize(prot=ComplexHrefWidget('name', 'id',
+                                                            url='/owner'))
+
+
+class TestEagerPlanner(unittest.TestCase):
+    def test_rendered_fields(self):
+        rendered = get_rendered_fields(Garage)
+
+        assert rendered == {
+            'id': None,
+            'vehicles': {
+                'id': None,
+                'plate': None,
+                'owner': {'id': None, 'name': None, 'phone': None},
+            },
+            'manager': {'id': None, 'name': None},
+        }
+
+    def test_limit_fields(self):
+        rendered = get_rendered_fields(Garage, fields=['vehicles.plate'])
+
+        assert rendered == {'vehicles': {'plate': None}}
+
+    def test_max_depth(self):
+        rendered = get_rendered_fields(Garage, max_depth=1)
+
+        assert rendered['vehicles']['owner'] == {}
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -863,7 +863,8 @@ class SelectWidgetBase(ComplexRenderWidget):
             if is_autogen:
                 logger.debug("Auto-generating combobox contents for %r", cls)
                 db = ctx.app.config.stores['sql_main'].itself
-                # FIXME: this blocks the reactor
+                # FIXME: this blocks the reactor. It's reported by
+                # neurons.daemon.blocking when the guard is enabled.
                 with closing(db.Session()) as session:
                     q = session.query(cls.__orig__ or cls)
                     if self.others_order_by is not None:
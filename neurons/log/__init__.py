@@ -33,3 +33,7 @@
 
 
 from neurons.log import model
+from neurons.log.writer import LogWriter
+from neurons.log.writer import get_log_writer
+from neurons.log.partition import LogPartitions
+from neurons.log.maintenance import LogMaintenance
@@ -0,0 +1,260 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+import logging
+logger = logging.getLogger(__name__)
+
+from math import floor
+from datetime import datetime, timedelta
+from collections import defaultdict
+
+from neurons.log.partition import get_log_partitions, is_partitioned
+
+
+ONE_MINUTE = timedelta(minutes=1)
+
+
+def _floor_minute(t):
+    return t.replace(second=0, microsecond=0)
+
+
+def _percentile(sorted_values, p):
+    """Percentile of an already sorted, non-empty list, interpolated between
+    the closest ranks like PostgreSQL's ``percentile_cont``."""
+
+    pos = p * (len(sorted_values) - 1)
+    lo = int(floor(pos))
+    hi = min(lo + 1, len(sorted_values) - 1)
+
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) \
+                                                                  * (pos - lo)
+
+
+def _round(value):
+    if value is None:
+        return None
+    return int(round(value))
+
+
+class LogMaintenance(object):
+    """Keeps per-minute rollups of a log table up to date and drops expired
+    log partitions.
+
+    Rollups contain the number of calls, the number of errors and the p50/p95
+    durations per method per minute. Only whole minutes that are older than
+    ``lag`` are rolled up, so that entries still waiting in a
+    :class:`neurons.log.LogWriter` queue are not missed.
+
+    Run this in only one process per database.
+
+    :param store: A :class:`neurons.daemon.store.SqlDataStore` instance.
+    :param cls: The log entry class.
+    :param rollup_cls: The rollup class, see
+        :func:`neurons.log.model.TLogRollup`.
+    :param lag: How long to wait before rolling up a minute.
+    :param max_span: Maximum time range that is rolled up in one go.
+    :param rollup_retention: Rollups older than this are deleted. ``None``
+        means keep them forever.
+    """
+
+    def __init__(self, store, cls, rollup_cls, lag=timedelta(minutes=2),
+                         max_span=timedelta(hours=1), rollup_retention=None):
+        self.store = store
+        self.cls = cls
+        self.rollup_cls = rollup_cls
+        self.lag = lag
+        self.max_span = max_span
+        self.rollup_retention = rollup_retention
+
+        self.partitions = None
+        if is_partitioned(cls):
+            self.partitions = get_log_partitions(store, cls)
+
+        self._last = None
+        self._pending_last = None
+        self._task = None
+
+    def get_tables(self, conn, start, end):
+        if self.partitions is None:
+            return [self.cls.__table__]
+        return self.partitions.get_tables(conn, start, end)
+
+    def rollup(self, conn, now=None):
+        """Rolls up the minutes that are not rolled up yet.
+
+        :return: The number of rollup rows inserted.
+        """
+
+        from sqlalchemy import select, func
+
+        rt = self.rollup_cls.__table__
+
+        if now is None:
+            now = datetime.now()
+
+        end = _floor_minute(now - self.lag)
+
+        start = self._last
+        if start is None:
+            last = conn.execute(select([func.max(rt.c.minute)])).scalar()
+            if last is None:
+                start = end - self.max_span
+            else:
+                start = last + ONE_MINUTE
+
+        end = min(end, start + self.max_span)
+        if start >= end:
+            return 0
+
+        tables = self.get_tables(conn, start, end)
+        if conn.dialect.name == 'postgresql':
+            rows = self._aggregate_sql(conn, tables, start, end)
+        else:
+            rows = self._aggregate_python(conn, tables, start, end)
+
+        if len(rows) > 0:
+            conn.execute(rt.insert(), rows)
+
+        # only becomes self._last once the caller commits, see run()
+        self._pending_last = end
+
+        logger.debug("Rolled up %d rows for [%s, %s)", len(rows), start, end)
+        return len(rows)
+
+    def _aggregate_sql(self, conn, tables, start, end):
+        from sqlalchemy import select, func, case, literal_column
+
+        rows = []
+        for table in tables:
+            c = table.c
+            minute = func.date_trunc(literal_column("'minute'"), c.time)
+            q = select([
+                    minute, c.method, func.count(),
+                    func.count(case([(c.err_code != 0, 1)])),
+                    func.percentile_cont(0.50).within_group(c.duration),
+                    func.percentile_cont(0.95).within_group(c.duration),
+                ]) \
+                .where(c.time >= start) \
+                .where(c.time < end) \
+                .group_by(minute, c.method)
+
+            for t, method, num_calls, num_errors, p50, p95 in conn.execute(q):
+                rows.append(dict(minute=t, method=method,
+                          num_calls=num_calls, num_errors=num_errors,
+                          p50_duration=_round(p50), p95_duration=_round(p95)))
+
+        return rows
+
+    def _aggregate_python(self, conn, tables, start, end):
+        """Fallback for databases without ordered-set aggregates, like
+        SQLite."""
+
+        from sqlalchemy import select
+
+        data = defaultdict(lambda: [0, 0, []])
+        for table in tables:
+            c = table.c
+            q = select([c.time, c.method, c.err_code, c.duration]) \
+                                      .where(c.time >= start) \
+                                      .where(c.time < end)
+
+            for t, method, err_code, duration in conn.execute(q):
+                entry = data[_floor_minute(t), method]
+                entry[0] += 1
+                if err_code:
+                    entry[1] += 1
+                if duration is not None:
+                    # integers may come back as Decimals
+                    entry[2].append(int(duration))
+
+        rows = []
+        for (minute, method), (num_calls, num_errors, durations) in \
+                                                                  data.items():
+            p50 = p95 = None
+            if len(durations) > 0:
+                durations.sort()
+                p50 = _round(_percentile(durations, 0.50))
+                p95 = _round(_percentile(durations, 0.95))
+
+            rows.append(dict(minute=minute, method=method,
+                      num_calls=num_calls, num_errors=num_errors,
+                                      p50_duration=p50, p95_duration=p95))
+
+        return rows
+
+    def apply_retention(self, conn, now=None):
+        if now is None:
+            now = datetime.now()
+
+        if self.partitions is not None:
+            self.partitions.drop_expired(conn, now)
+
+        if self.rollup_retention is not None:
+            rt = self.rollup_cls.__table__
+            conn.execute(rt.delete()
+                              .where(rt.c.minute < now - self.rollup_retention))
+
+    def run(self, now=None):
+        """Runs one round of maintenance. Blocks, so call this in a thread."""
+
+        with self.store.engine.begin() as conn:
+            self.rollup(conn, now)
+
+        # committed, so the next round can start where this one ended.
+        self._last = self._pending_last
+
+        with self.store.engine.begin() as conn:
+            self.apply_retention(conn, now)
+
+    def start(self, interval=60):
+        """Runs :meth:`run` in a worker thread every ``interval`` seconds."""
+
+        from twisted.internet.task import LoopingCall
+        from twisted.internet.threads import deferToThread
+
+        def _run():
+            d = deferToThread(self.run)
+            d.addErrback(lambda f: logger.error("Log maintenance failed: %s",
+                                                       f.getErrorMessage()))
+            return d
+
+        self._task = LoopingCall(_run)
+        self._task.start(interval)
+
+        return self._task
+
+    def stop(self):
+        if self._task is not None and self._task.running:
+            self._task.stop()
+        self._task = None
@@ -43,7 +43,7 @@ class LogEntryMixin(TableModel):
     __table_args__ = {"sqlite_autoincrement": True}
 
     id = Integer64(primary_key=True)
-    time = DateTime(timezone=False)
+    time = DateTime(timezone=False, index='btree')
     user = Unicode(256, index='btree')
     method = Unicode(64, index='btree')
     req_xml = AnyXml
@@ -55,8 +55,55 @@ class LogEntryMixin(TableModel):
 
 
 @memoize
-def TLogEntry():
+def _TLogEntry():
     class LogEntry(LogEntryMixin):
         __namespace__ = 'neurons.base'
         __tablename__ = 'neurons_log'
     return LogEntry
+
+
+@memoize
+def _TPartitionedLogEntry():
+    class LogEntry(LogEntryMixin):
+        __namespace__ = 'neurons.base'
+        __tablename__ = 'neurons_log'
+        __table_args__ = {"postgresql_partition_by": "RANGE (time)"}
+
+        # PostgreSQL wants the partition key to be part of the primary key.
+        id = Integer64(primary_key=True,
+                                    sqla_column_args=dict(autoincrement=True))
+        time = DateTime(timezone=False, primary_key=True, index='btree')
+
+    return LogEntry
+
+
+def TLogEntry(partitioned=False):
+    """Returns the log entry class for the ``neurons_log`` table.
+
+    :param partitioned: When ``True``, the table is partitioned by time.
+        Natively on PostgreSQL, using rotating tables elsewhere. See
+        :class:`neurons.log.partition.LogPartitions`.
+    """
+
+    if partitioned:
+        return _TPartitionedLogEntry()
+    return _TLogEntry()
+
+
+class LogRollupMixin(TableModel):
+    __mixin__ = True
+
+    minute = DateTime(timezone=False, primary_key=True)
+    method = Unicode(64, primary_key=True)
+    num_calls = Integer
+    num_errors = Integer
+    p50_duration = Integer
+    p95_duration = Integer
+
+
+@memoize
+def TLogRollup():
+    class LogRollup(LogRollupMixin):
+        __namespace__ = 'neurons.base'
+        __tablename__ = 'neurons_log_rollup'
+    return LogRollup
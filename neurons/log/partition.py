@@ -0,0 +1,236 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+import logging
+logger = logging.getLogger(__name__)
+
+import re
+import threading
+
+from datetime import datetime, timedelta
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _total_seconds(td):
+    return td.days * 86400 + td.seconds + td.microseconds / 1e6
+
+
+def is_partitioned(cls):
+    """Returns ``True`` when the table of the given class is declared to be
+    partitioned by range."""
+
+    opts = cls.__table__.dialect_options['postgresql']
+    return opts.get('partition_by', None) is not None
+
+
+class LogPartitions(object):
+    """Manages time-based partitions of a log table.
+
+    On PostgreSQL, partitions are native partitions of the parent table. On
+    other databases, they are emulated as standalone tables with the same
+    columns, named after the parent table and the start of the range they
+    cover. Either way, old data is removed by dropping whole partitions instead
+    of running ``DELETE`` statements.
+
+    :param store: A :class:`neurons.daemon.store.SqlDataStore` instance.
+    :param cls: The log entry class.
+    :param size: The time range that each partition covers, as a timedelta.
+    :param retention: Partitions that end before ``now - retention`` are
+        dropped by :meth:`drop_expired`.
+    """
+
+    def __init__(self, store, cls, size=timedelta(days=1),
+                                                 retention=timedelta(days=30)):
+        from sqlalchemy import MetaData
+
+        self.store = store
+        self.cls = cls
+        self.table = cls.__table__
+        self.size = size
+        self.retention = retention
+
+        self._known = {}
+        self._lock = threading.Lock()
+        self._meta = MetaData()
+        self._name_re = re.compile('^%s_p([0-9]{12})$' %
+                                                  re.escape(self.table.name))
+
+    @property
+    def native(self):
+        return self.store.engine.dialect.name == 'postgresql'
+
+    def get_start(self, t):
+        num = int(_total_seconds(t - EPOCH) // _total_seconds(self.size))
+        return EPOCH + num * self.size
+
+    def get_name(self, start):
+        return '%s_p%s' % (self.table.name, start.strftime('%Y%m%d%H%M'))
+
+    def get_table(self, conn, t):
+        """Returns the table that a row with the given time should be inserted
+        to. Creates the partition if it does not exist.
+        """
+
+        start = self.get_start(t)
+        name = self.get_name(start)
+
+        with self._lock:
+            retval = self._known.get(name, None)
+            if retval is None:
+                retval = self._known[name] = self._create(conn, start, name)
+
+        return retval
+
+    def reset(self):
+        """Forgets about known partitions. Call this when a transaction that
+        could have created a partition is rolled back."""
+
+        with self._lock:
+            self._known.clear()
+
+    def get_tables(self, conn, start, end):
+        """Returns the tables that contain rows with time in [start, end)."""
+
+        if self.native:
+            return [self.table]
+
+        retval = []
+        for name, pstart in self.get_partitions(conn):
+            if pstart < end and pstart + self.size > start:
+                retval.append(self._get_emulated_table(name))
+
+        return retval
+
+    def get_partitions(self, conn):
+        """Returns a sorted list of ``(name, start)`` tuples of existing
+        partitions."""
+
+        if self.native:
+            names = conn.execute(
+                "SELECT c.relname FROM pg_inherits i "
+                         "JOIN pg_class c ON c.oid = i.inhrelid "
+                         "JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = %(name)s", name=self.table.name)
+        else:
+            names = conn.execute(
+                        "SELECT name FROM sqlite_master WHERE type = 'table'")
+
+        retval = []
+        for name, in names:
+            m = self._name_re.match(name)
+            if m is not None:
+                retval.append(
+                           (name, datetime.strptime(m.group(1), '%Y%m%d%H%M')))
+
+        retval.sort(key=lambda x: x[1])
+        return retval
+
+    def drop_expired(self, conn, now=None):
+        """Drops the partitions that are older than the retention period.
+
+        :return: The names of the dropped partitions.
+        """
+
+        if now is None:
+            now = datetime.now()
+
+        limit = now - self.retention
+
+        retval = []
+        for name, start in self.get_partitions(conn):
+            if start + self.size > limit:
+                break
+
+            conn.execute('DROP TABLE "%s"' % name)
+            retval.append(name)
+            logger.info("Dropped log partition %r", name)
+
+            with self._lock:
+                self._known.pop(name, None)
+                table = self._meta.tables.get(name, None)
+                if table is not None:
+                    self._meta.remove(table)
+
+        return retval
+
+    def _create(self, conn, start, name):
+        if self.native:
+            end = start + self.size
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS "%s" PARTITION OF "%s" '
+                "FOR VALUES FROM ('%s') TO ('%s')" % (name, self.table.name,
+                                  start.strftime('%Y-%m-%d %H:%M:%S'),
+                                  end.strftime('%Y-%m-%d %H:%M:%S')))
+            return self.table
+
+        retval = self._get_emulated_table(name)
+        retval.create(conn, checkfirst=True)
+        return retval
+
+    def _get_emulated_table(self, name):
+        from sqlalchemy import Table, Column, Integer
+
+        retval = self._meta.tables.get(name, None)
+        if retval is not None:
+            return retval
+
+        cols = []
+        for c in self.table.columns:
+            if c.name == 'id':
+                # the rowid alias
+                cols.append(Column('id', Integer, primary_key=True))
+            else:
+                cols.append(Column(c.name, c.type, index=(c.name == 'time')))
+
+        return Table(name, self._meta, *cols)
+
+
+_partitions = {}
+_partitions_lock = threading.Lock()
+
+
+def get_log_partitions(store, cls, **kwargs):
+    """Returns the :class:`LogPartitions` instance for the given store and log
+    entry class, creating it if necessary."""
+
+    key = (id(store), cls)
+
+    with _partitions_lock:
+        retval = _partitions.get(key, None)
+        if retval is None:
+            retval = _partitions[key] = LogPartitions(store, cls, **kwargs)
+
+    return retval
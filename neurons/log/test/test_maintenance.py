@@ -0,0 +1,129 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import shutil
+import tempfile
+import unittest
+
+from os.path import join
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from neurons.daemon.store import SqlDataStore
+from neurons.log.maintenance import LogMaintenance, _percentile
+from neurons.log.model import TLogEntry, TLogRollup
+
+
+NOW = datetime(2026, 1, 1, 12, 0)
+
+
+class TestLogMaintenance(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = SqlDataStore('sqlite:///' + join(self.tmpdir, 'db'))
+        self.cls = TLogEntry(partitioned=True)
+        self.rollup_cls = TLogRollup()
+        self.rollup_cls.__table__.create(self.store.engine)
+
+        self.m = LogMaintenance(self.store, self.cls, self.rollup_cls)
+
+        # partitions are shared per store id, which may be reused.
+        self.m.partitions.reset()
+
+        rows = []
+        for i in range(1, 11):
+            rows.append(dict(time=NOW - timedelta(minutes=5, seconds=-i),
+                                method=u'a', err_code=i % 2, duration=i))
+        rows.append(dict(time=NOW - timedelta(minutes=4), method=u'b',
+                                                    err_code=0, duration=None))
+
+        with self.store.engine.begin() as conn:
+            for row in rows:
+                t = self.m.partitions.get_table(conn, row['time'])
+                conn.execute(t.insert(), row)
+
+    def tearDown(self):
+        self.store.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def _get_rollups(self):
+        t = self.rollup_cls.__table__
+        with self.store.engine.connect() as conn:
+            return conn.execute(select([t.c.minute, t.c.method, t.c.num_calls,
+                    t.c.num_errors, t.c.p50_duration, t.c.p95_duration])
+                                    .order_by(t.c.minute, t.c.method)).fetchall()
+
+    def test_percentile(self):
+        assert _percentile([1, 2, 3, 4], 0.5) == 2.5
+        assert _percentile([7], 0.95) == 7
+        assert abs(_percentile(list(range(1, 11)), 0.95) - 9.55) < 1e-9
+
+    def test_rollup(self):
+        self.m.run(NOW)
+
+        assert self._get_rollups() == [
+            (datetime(2026, 1, 1, 11, 55), u'a', 10, 5, 6, 10),
+            (datetime(2026, 1, 1, 11, 56), u'b', 1, 0, None, None),
+        ]
+        assert self.m._last == datetime(2026, 1, 1, 11, 58)
+
+        # nothing new to roll up
+        with self.store.engine.begin() as conn:
+            assert self.m.rollup(conn, NOW) == 0
+
+    def test_failed_commit(self):
+        dialect = self.store.engine.dialect
+
+        def _fail(dbapi_connection):
+            dbapi_connection.rollback()
+            raise ValueError("commit failed")
+
+        dialect.do_commit = _fail
+        try:
+            self.assertRaises(ValueError, self.m.run, NOW)
+        finally:
+            del dialect.do_commit
+
+        # the cursor did not move, so the same minutes are rolled up again
+        assert self.m._last is None
+        assert self._get_rollups() == []
+
+        self.m.run(NOW)
+        assert len(self._get_rollups()) == 2
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import unittest
+
+from datetime import datetime, timedelta
+
+from neurons.daemon.store import SqlDataStore
+from neurons.log.model import TLogEntry
+from neurons.log.partition import LogPartitions, is_partitioned
+
+
+class TestLogPartitions(unittest.TestCase):
+    def setUp(self):
+        self.store = SqlDataStore('sqlite://')
+        self.cls = TLogEntry(partitioned=True)
+        self.partitions = LogPartitions(self.store, self.cls,
+                                                  retention=timedelta(days=2))
+
+    def test_is_partitioned(self):
+        assert is_partitioned(self.cls)
+
+    def test_routing(self):
+        with self.store.engine.begin() as conn:
+            t1 = self.partitions.get_table(conn, datetime(2026, 1, 1, 10, 30))
+            t2 = self.partitions.get_table(conn, datetime(2026, 1, 1, 23, 59))
+            t3 = self.partitions.get_table(conn, datetime(2026, 1, 2, 0, 0))
+
+            assert t1 is t2
+            assert t1.name == 'neurons_log_p202601010000'
+            assert t3.name == 'neurons_log_p202601020000'
+
+            conn.execute(t1.insert(), time=datetime(2026, 1, 1, 10, 30),
+                                                          method=u'm')
+
+            assert self.partitions.get_partitions(conn) == [
+                (t1.name, datetime(2026, 1, 1)),
+                (t3.name, datetime(2026, 1, 2)),
+            ]
+
+            tables = self.partitions.get_tables(conn,
+                            datetime(2026, 1, 1, 12), datetime(2026, 1, 1, 13))
+            assert [t.name for t in tables] == [t1.name]
+
+            tables = self.partitions.get_tables(conn,
+                                 datetime(2026, 1, 1, 12), datetime(2026, 1, 3))
+            assert [t.name for t in tables] == [t1.name, t3.name]
+
+    def test_drop_expired(self):
+        with self.store.engine.begin() as conn:
+            for day in (1, 2, 3, 4):
+                self.partitions.get_table(conn, datetime(2026, 1, day, 12))
+
+            # partitions that end before Jan 2nd 12:00 are expired
+            dropped = self.partitions.drop_expired(conn,
+                                                 now=datetime(2026, 1, 4, 12))
+            assert dropped == ['neurons_log_p202601010000']
+
+            assert [name for name, _ in
+                                 self.partitions.get_partitions(conn)] == [
+                'neurons_log_p202601020000',
+                'neurons_log_p202601030000',
+                'neurons_log_p202601040000',
+            ]
+
+            # dropped partitions are created again when needed
+            t = self.partitions.get_table(conn, datetime(2026, 1, 1, 12))
+            conn.execute(t.insert(), time=datetime(2026, 1, 1, 12))
+
+
+if __name__ == '__main__':
+    unittest.main()
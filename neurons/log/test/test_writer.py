@@ -0,0 +1,86 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+import threading
+
+from sqlalchemy import MetaData, Table, Column, Integer, Unicode, select, \
+    func
+
+from twisted.trial import unittest
+
+from neurons.daemon.store import SqlDataStore
+from neurons.log.writer import LogWriter
+
+
+_metadata = MetaData()
+
+
+class _Entry(object):
+    __table__ = Table('log', _metadata,
+        Column('id', Integer, primary_key=True),
+        Column('method', Unicode(64)),
+    )
+
+
+class TestLogWriter(unittest.TestCase):
+    def test_stop_drains_queue(self):
+        store = SqlDataStore('sqlite://')
+        _metadata.create_all(store.engine)
+
+        writer = LogWriter(store, _Entry)
+        release = threading.Event()
+
+        write = writer._write
+        def _write(batch):
+            release.wait()
+            return write(batch)
+        writer._write = _write
+
+        writer._queue.append((dict(method=u'a'), None))
+        writer.flush()
+
+        # queued while the first batch is being written
+        writer._queue.append((dict(method=u'b'), None))
+
+        d = writer.stop()
+        release.set()
+
+        def _check(_):
+            assert writer.written == 2
+            assert writer.queued == 0
+            q = select([func.count()]).select_from(_Entry.__table__)
+            assert store.engine.execute(q).scalar() == 2
+
+        return d.addCallback(_check)
@@ -0,0 +1,267 @@
+# encoding: utf8
+#
+# This file is part of the Neurons project.
+# Copyright (c), Arskom Ltd. (arskom.com.tr),
+#                Burak Arslan <burak.arslan@arskom.com.tr>.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the Arskom Ltd. nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+import logging
+logger = logging.getLogger(__name__)
+
+import json
+import threading
+
+from collections import deque, OrderedDict
+
+from spyne.util.dictdoc import get_object_as_json
+
+from neurons.log.partition import get_log_partitions, is_partitioned
+
+
+class LogWriter(object):
+    """Queues log entries in memory and writes them to the database in batches.
+
+    A batch is written either when ``batch_size`` entries have accumulated or
+    every ``flush_interval`` seconds, whichever comes first. The queue never
+    grows beyond ``max_queue`` entries -- the excess is dropped and counted in
+    ``dropped``.
+
+    :param store: A :class:`neurons.daemon.store.SqlDataStore` instance.
+    :param cls: The ``LogEntry`` class whose table is written to.
+    """
+
+    def __init__(self, store, cls, max_queue=10000, batch_size=500,
+                                                            flush_interval=1.0):
+        self.store = store
+        self.cls = cls
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._task = None
+        self._started = False
+        self._flushing = False
+        self._flush_pending = False
+        self._flush_waiters = []
+
+        self.partitions = None
+        if is_partitioned(cls):
+            self.partitions = get_log_partitions(store, cls)
+
+    def put(self, entry, req=None):
+        """Queues the given entry. Never blocks.
+
+        :param entry: A dict of column values.
+        :param req: An optional ``(cls, inst)`` tuple. It's serialized to
+            ``req_json`` in the writer thread and not in the caller's.
+        :return: ``False`` if the entry was dropped, ``True`` otherwise.
+        """
+
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                return False
+
+            self._queue.append((entry, req))
+
+            start = not self._started
+            self._started = True
+
+            flush = len(self._queue) >= self.batch_size \
+                                                    and not self._flush_pending
+            if flush:
+                self._flush_pending = True
+
+        if start or flush:
+            from twisted.internet import reactor
+
+            if start:
+                reactor.callFromThread(self.start)
+            if flush:
+                reactor.callFromThread(self.flush)
+
+        return True
+
+    def start(self):
+        from twisted.internet import reactor
+        from twisted.internet.task import LoopingCall
+
+        if self._task is not None:
+            return
+
+        self._task = LoopingCall(self.flush)
+        self._task.start(self.flush_interval, now=False)
+        reactor.addSystemEventTrigger('before', 'shutdown', self.stop)
+
+        logger.debug("%r started.", self)
+
+    def stop(self):
+        if self._task is not None and self._task.running:
+            self._task.stop()
+        self._task = None
+
+        # returning the deferred delays the shutdown until the last batch is
+        # written.
+        return self.drain()
+
+    def drain(self):
+        """Writes all queued entries to the database like :meth:`flush`, but
+        if a batch is being written, waits for it to finish first instead of
+        leaving the rest in the queue.
+
+        :return: A Deferred that fires when the queue is written.
+        """
+
+        from twisted.internet.defer import Deferred
+
+        if not self._flushing:
+            return self.flush()
+
+        d = Deferred()
+        d.addCallback(lambda _: self.drain())
+        self._flush_waiters.append(d)
+
+        return d
+
+    def flush(self):
+        """Writes all queued entries to the database in a worker thread.
+
+        :return: A Deferred that fires with the number of written entries.
+        """
+
+        from twisted.internet.defer import succeed
+        from twisted.internet.threads import deferToThread
+
+        with self._lock:
+            self._flush_pending = False
+            if self._flushing or len(self._queue) == 0:
+                return succeed(0)
+
+            self._flushing = True
+            batch = list(self._queue)
+            self._queue.clear()
+
+        d = deferToThread(self._write, batch)
+        d.addCallbacks(self._on_written, self._on_failed, errbackArgs=(batch,))
+        return d
+
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    def get_stats(self):
+        return dict(queued=self.queued, written=self.written,
+                                     dropped=self.dropped, failed=self.failed)
+
+    def _to_row(self, names, entry, req):
+        if req is not None:
+            cls, inst = req
+            try:
+                entry['req_json'] = json.loads(get_object_as_json(inst, cls))
+            except Exception as e:
+                logger.debug("Could not serialize request of %r: %r", cls, e)
+
+        # executemany() needs every row to have the same keys.
+        return dict([(k, entry.get(k, None)) for k in names])
+
+    def _write(self, batch):
+        table = self.cls.__table__
+        names = [c.name for c in table.columns if not c.primary_key]
+        if self.partitions is not None:
+            names.append('time')
+
+        rows = [self._to_row(names, entry, req) for entry, req in batch]
+
+        with self.store.engine.begin() as conn:
+            if self.partitions is None:
+                self._insert(conn, table, rows)
+
+            else:
+                by_table = OrderedDict()
+                for row in rows:
+                    t = self.partitions.get_table(conn, row['time'])
+                    by_table.setdefault(t, []).append(row)
+
+                for t, t_rows in by_table.items():
+                    self._insert(conn, t, t_rows)
+
+        return len(rows)
+
+    def _insert(self, conn, table, rows):
+        insert = table.insert()
+        for i in range(0, len(rows), self.batch_size):
+            # a list of dicts makes sqlalchemy use executemany()
+            conn.execute(insert, rows[i:i + self.batch_size])
+
+    def _on_flushed(self):
+        self._flushing = False
+
+        waiters, self._flush_waiters = self._flush_waiters, []
+        for d in waiters:
+            d.callback(None)
+
+    def _on_written(self, num):
+        self.written += num
+        self._on_flushed()
+        return num
+
+    def _on_failed(self, failure, batch):
+        self.failed += len(batch)
+        if self.partitions is not None:
+            self.partitions.reset()
+
+        logger.error("Dropping %d log entries: %s", len(batch),
+                                                     failure.getErrorMessage())
+        self._on_flushed()
+        return 0
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_log_writer(store, cls, **kwargs):
+    """Returns the :class:`LogWriter` instance for the given store and log entry
+    class, creating it if necessary."""
+
+    key = (id(store), cls)
+
+    with _writers_lock:
+        retval = _writers.get(key, None)
+        if retval is None:
+            retval = _writers[key] = LogWriter(store, cls, **kwargs)
+
+    return retval
@@ -31,8 +31,13 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
+from time import time
 from contextlib import closing
 
+from sqlalchemy import tuple_
+from sqlalchemy.orm import class_mapper, object_mapper
+from sqlalchemy.orm.exc import NoResultFound, UnmappedInstanceError
+
 from spyne import TTableModel, Integer32
 from spyne.store.relational import get_pk_columns
 
@@ -49,20 +54,169 @@ def TVersion(prefix, default_version):
     return Version
 
 
+respawn_cache = None
+"""Shared cache of respawned instances keyed by their identity key. Off by
+default, see :func:`enable_respawn_cache`."""
+
+
+def _on_after_flush(session, flush_context):
+    keys = session.info.setdefault('respawn_dirty', set())
+    for obj in list(session.dirty) + list(session.deleted):
+        try:
+            keys.add(object_mapper(obj).identity_key_from_instance(obj))
+        except UnmappedInstanceError:
+            pass
+
+
+def _on_after_commit(session):
+    keys = session.info.pop('respawn_dirty', None)
+    if keys and respawn_cache is not None:
+        for key in keys:
+            respawn_cache.pop(key)
+
+
+def _on_after_rollback(session):
+    session.info.pop('respawn_dirty', None)
+
+
+def enable_respawn_cache(maxsize=4096, ttl=60):
+    """Enables a process-wide cache for instances loaded by
+    :func:`respawn`. Entries expire after ``ttl`` seconds and are dropped
+    when a session that modified or deleted the corresponding row commits.
+    Changes made outside of this process are only picked up when entries
+    expire.
+    """
+
+    global respawn_cache
+
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    from neurons.base.cache import LruCache
+
+    if respawn_cache is None:
+        event.listen(Session, 'after_flush', _on_after_flush)
+        event.listen(Session, 'after_commit', _on_after_commit)
+        event.listen(Session, 'after_rollback', _on_after_rollback)
+
+    respawn_cache = LruCache(maxsize)
+    respawn_cache.ttl = ttl
+
+
+def disable_respawn_cache():
+    global respawn_cache
+
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    if respawn_cache is not None:
+        event.remove(Session, 'after_flush', _on_after_flush)
+        event.remove(Session, 'after_commit', _on_after_commit)
+        event.remove(Session, 'after_rollback', _on_after_rollback)
+
+    respawn_cache = None
+
+
+def _get_session(ctx):
+    """Returns the session of the request for the ``sql_main`` store, or None
+    when the request context can't provide one."""
+
+    get_session = getattr(ctx.udc, 'get_session', None)
+    if get_session is None:
+        return None
+
+    return get_session(ctx.app.config.stores['sql_main'])
+
+
+def _query(session, cls, where):
+    return session.query(cls).with_polymorphic('*').filter(where).all()
+
+
+def _respawn_many(session, store, cls, pks):
+    mapper = class_mapper(cls)
+    keys = [mapper.identity_key_from_primary_key(pk) for pk in pks]
+    found = {}
+
+    # 1. objects already loaded by this request
+    for key in keys:
+        obj = session.identity_map.get(key, None)
+        if obj is not None:
+            found[key] = obj
+
+    # 2. objects loaded by other requests
+    if respawn_cache is not None:
+        for key in keys:
+            if key in found:
+                continue
+
+            obj = respawn_cache.get(key)
+            if obj is not None:
+                found[key] = session.merge(obj, load=False)
+
+    # 3. the rest, with a single query
+    missing = [pk for pk, key in zip(pks, keys) if not (key in found)]
+    if len(missing) > 0:
+        pk_cols = mapper.primary_key
+        if len(pk_cols) == 1:
+            where = pk_cols[0].in_([pk[0] for pk in missing])
+        else:
+            where = tuple_(*pk_cols).in_(missing)
+
+        if respawn_cache is None:
+            for obj in _query(session, cls, where):
+                found[object_mapper(obj).identity_key_from_instance(obj)] = obj
+
+        else:
+            # load with a private session so that the cached instances are
+            # never modified. the request gets copies of them.
+            with closing(store.ReadOnlySession()) as loader:
+                objs = _query(loader, cls, where)
+
+            expires_at = time() + respawn_cache.ttl
+            for obj in objs:
+                key = object_mapper(obj).identity_key_from_instance(obj)
+                respawn_cache.put(key, obj, expires_at=expires_at)
+                found[key] = session.merge(obj, load=False)
+
+    return [found.get(key, None) for key in keys]
+
+
+def respawn_many(cls, ctx, pks):
+    """Loads the instances of ``cls`` with the given primary keys, using the
+    session of the request, with at most one query.
+
+    :param pks: A sequence of primary key values. Tuples for composite primary
+        keys.
+    :return: A list of instances in the order of ``pks``. ``None`` for the
+        ones that are not found.
+    """
+
+    pks = [pk if isinstance(pk, tuple) else (pk,) for pk in pks]
+
+    db = ctx.app.config.stores['sql_main'].itself
+
+    session = _get_session(ctx)
+    if session is not None:
+        return _respawn_many(session, db, cls, pks)
+
+    with closing(db.Session()) as session:
+        return _respawn_many(session, db, cls, pks)
+
+
 def respawn(cls, ctx=None):
-    has_db = ctx.app is not None and 'sql_main' in ctx.app.config.stores
+    has_db = ctx is not None and ctx.app is not None and \
+                                        'sql_main' in ctx.app.config.stores
 
-    if ctx is not None and ctx.in_object is not None and len(ctx.in_object) > 0 \
-                       and ctx.in_object[0] is not None and has_db:
+    if has_db and ctx.in_object is not None and len(ctx.in_object) > 0 \
+                                            and ctx.in_object[0] is not None:
         in_object = ctx.in_object[0]
 
-        filters = {}
-        for k, v in get_pk_columns(cls):
-            filters[k] = getattr(in_object, k)
+        pk = tuple([getattr(in_object, k) for k, v in get_pk_columns(cls)])
+
+        retval, = respawn_many(cls, ctx, [pk])
+        if retval is None:
+            raise NoResultFound()
 
-        db = ctx.app.config.stores['sql_main'].itself
-        with closing(db.Session()) as session:
-            return session.query(cls).with_polymorphic('*').filter_by(**filters).one()
+        return retval
 
 
 TableModel.__respawn__ = classmethod(respawn)
@@ -47,6 +47,7 @@ except OSError:
 
 common_reqs = ('spyne>=2.12', 'SQLAlchemy', 'Twisted>=15.2',
     'lxml>=3.4.1', 'pyyaml', 'msgpack-python', 'pycrypto',
+    'futures; python_version < "3"',
 )
 
 